@@ -1,41 +1,51 @@
-
-import os
-import vertexai
-from vertexai.vision_models import ImageGenerationModel
 import json
+from typing import Optional
 from core.state import AgentState
+from services.imaging import ImageJobQueue, image_jobs
 
 class ArtistAgent:
     """
     The Artist.
     Generates visual diagrams and thumbnails for graph nodes using Imagen 3.
+    Generation runs as a background job: the agent answers at once with the
+    job id and the image's (content-addressed) URL, and repeated diagrams for
+    the same concept are served straight from the cache.
     """
-    def __init__(self):
-        self.project_id = os.getenv("GCP_PROJECT", "mba-copilot-485805")
-        self.location = os.getenv("GCP_LOCATION", "us-central1")
-        vertexai.init(project=self.project_id, location=self.location)
-        self.model = ImageGenerationModel.from_pretrained("imagen-3.0-generate-001") # Stable Imagen 3
+    def __init__(self, jobs: Optional[ImageJobQueue] = None):
+        self.jobs = jobs or image_jobs
+        self.aspect_ratio = "16:9"
+
+    def build_prompt(self, subject: str) -> str:
+        return (
+            f"A clean, professional educational diagram explaining: {subject}. "
+            "Flat vector style, labelled parts, white background, no photographs."
+        )
 
     async def run(self, state: AgentState):
         """
-        Generates an image based on the current context or node label.
+        Queues (or reuses) an image for the current context or node label.
         """
         messages = state["messages"]
         last_message = messages[-1].content
-        
-        # In a real app, we'd save this to GCS and return a URL.
-        # For now, we simulate the 'Artist working' response.
-        
-        prompt = f"Creating a professional educational diagram for: {last_message}"
-        # response = self.model.generate_images(prompt=prompt)
-        
+
+        job = self.jobs.submit(self.build_prompt(last_message), aspect_ratio=self.aspect_ratio)
+        if job["status"] == "done":
+            text = f"Here is the visual diagram for '{last_message}'."
+        elif job["status"] == "failed":
+            text = f"I couldn't start a diagram for '{last_message}': {job['error']}"
+        else:
+            text = f"I am generating a visual diagram for '{last_message}' using Imagen 3. It will appear shortly."
+
         return {
             "messages": [
                 json.dumps({
                     "type": "image",
-                    "text": f"I am generating a visual diagram for '{last_message}' using Imagen 3.",
+                    "text": text,
                     "payload": {
-                        "url": None # In production, this would be the GCS URL
+                        "job_id": job["id"],
+                        "status": job["status"],
+                        "url": job["url"],
+                        "cached": job["cached"]
                     }
                 })
             ]
@@ -1,22 +1,17 @@
-
 import os
-from google.cloud import texttospeech
+import json
+from typing import Optional
 from core.state import AgentState
+from services.speech import PodcastSynthesizer
 
 class ComposerAgent:
     """
     The Composer.
     Transforms graph descriptions into lifelike audio summaries (podcasts) using Google Cloud TTS.
+    Long summaries are synthesized in parallel segments and cached per segment.
     """
-    def __init__(self):
-        self.client = texttospeech.TextToSpeechClient()
-        self.voice = texttospeech.VoiceSelectionParams(
-            language_code="en-IN", # Hinglish friendly or standard Indian English
-            ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
-        )
-        self.audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
-        )
+    def __init__(self, synthesizer: Optional[PodcastSynthesizer] = None):
+        self.synthesizer = synthesizer or PodcastSynthesizer(concurrency=int(os.environ.get("TTS_CONCURRENCY", "4")))
 
     async def run(self, state: AgentState):
         """
@@ -24,16 +19,22 @@ class ComposerAgent:
         """
         messages = state["messages"]
         last_message = messages[-1].content
-        
-        # In a real app, we'd save to GCS and return a URL.
-        # For now, we simulate the 'Composer working' response.
-        
-        # input_text = texttospeech.SynthesisInput(text=last_message)
-        # response = self.client.synthesize_speech(
-        #     input=input_text, voice=self.voice, audio_config=self.audio_config
-        # )
-        
-        return {"messages": [f"ComposerAgent: I am composing a voice summary of '{last_message[:50]}...' using Google TTS."]}
+
+        try:
+            audio = await self.synthesizer.synthesize(last_message)
+        except Exception as e:
+            print(f"❌ Composer synthesis failed: {e}")
+            return {"messages": [json.dumps({
+                "type": "text",
+                "text": f"I couldn't compose a voice summary right now: {e}",
+                "payload": {}
+            })]}
+
+        return {"messages": [json.dumps({
+            "type": "audio",
+            "text": f"I composed a voice summary of '{last_message[:50]}...' using Google TTS.",
+            "payload": audio
+        })]}
 
 # Export for LangGraph
 composer_agent = ComposerAgent()
@@ -1,11 +1,15 @@
 
 import os
 import json
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from core.state import AgentState
-from core.db import get_db_connection
+from services.mastery import mastery_store
+from services.retrieval import hybrid_search, fetch_prerequisites
+from services.context import encode_table, estimate_tokens, pack_lines
+from core.scope import GraphScope
+from core.ratelimit import rate_limiter, estimate_call_tokens
 
 class CurriculumMaster:
     """
@@ -13,11 +17,14 @@ class CurriculumMaster:
     Adjusts the learning path and content depth based on user mastery levels.
     """
     def __init__(self):
+        self.model_name = "gemini-2.0-flash"
         self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
+            model=self.model_name,
             temperature=0.3,
             location=os.environ.get("GCP_LOCATION", "us-central1")
         )
+        self.mastery_token_budget = 300
+        self.relevant_k = 8
 
     async def run(self, state: AgentState):
         """
@@ -25,10 +32,12 @@ class CurriculumMaster:
         """
         messages = state["messages"]
         last_message = messages[-1].content
-        user_id = state.get("user_context", {}).get("user_id", "00000000-0000-0000-0000-000000000000") # Dummy UUID
+        user_context = state.get("user_context", {}) or {}
+        user_id = user_context.get("user_id", "00000000-0000-0000-0000-000000000000") # Dummy UUID
 
-        # 1. Fetch relevant mastery levels from DB
+        # 1. Fetch mastery levels (cached) and keep only rows relevant to this message
         mastery_data = await self._get_user_mastery(user_id)
+        mastery_context = await self._select_mastery_context(last_message, mastery_data, GraphScope.from_context(user_context))
         
         # 2. Decide on content level and pruning
         system_instruction = (
@@ -36,39 +45,72 @@ class CurriculumMaster:
             "decide how to present the requested information. "
             "If they are a Beginner, use analogies and simple language. "
             "If they are Advanced, dive into technical details and formulas.\n\n"
-            f"User Mastery Context: {json.dumps(mastery_data)}\n\n"
+            f"User Mastery Context (concept|level|score):\n{mastery_context or 'No mastery recorded yet.'}\n\n"
             "Respond with a tailored explanation or guidance."
         )
         
         prompt = ChatPromptTemplate.from_messages([
-            ("system", system_instruction),
+            ("system", "{system_instruction}"),
             ("human", "{input}")
         ])
         
         chain = prompt | self.llm
-        response = await chain.ainvoke({"input": last_message})
+        response = await rate_limiter.call(
+            self.model_name,
+            lambda: chain.ainvoke({"system_instruction": system_instruction, "input": last_message}),
+            tokens=estimate_call_tokens(system_instruction, last_message)
+        )
         
         return {"messages": [response]}
 
+    async def _select_mastery_context(self, message: str, rows: List[Dict[str, Any]], scope: Optional[GraphScope] = None) -> str:
+        """
+        Keeps the mastery rows for concepts relevant to the message (hybrid
+        retrieval hits, then their prerequisites) as a compact table under
+        `mastery_token_budget`.
+        """
+        if not rows:
+            return ""
+
+        def to_lines(selected):
+            table = encode_table(["concept", "level", "score"], [
+                (r["label"], r["mastery_level"], f"{r.get('score') or 0:.2f}") for r in selected
+            ])
+            return table.split("\n")[1:]
+
+        # Small profiles fit as-is; skip the retrieval round trip entirely
+        all_lines = to_lines(rows)
+        if estimate_tokens("\n".join(all_lines)) <= self.mastery_token_budget:
+            return "\n".join(all_lines)
+
+        rank: Dict[str, int] = {}
+        try:
+            hits = await hybrid_search(message, k=self.relevant_k, scope=scope)
+            prerequisites = await fetch_prerequisites([h["id"] for h in hits])
+            for node_id in [h["id"] for h in hits] + [p["id"] for p in prerequisites]:
+                rank.setdefault(node_id, len(rank))
+        except Exception as e:
+            print(f"⚠️ Mastery relevance retrieval failed: {e}")
+
+        selected = sorted((r for r in rows if r.get("node_id") in rank), key=lambda r: rank[r["node_id"]])
+        if not selected:
+            # Nothing on-topic: the weakest concepts are the most useful signal
+            selected = sorted(rows, key=lambda r: r.get("score") or 0)
+
+        context = pack_lines(to_lines(selected), self.mastery_token_budget)
+        saved = estimate_tokens(json.dumps(rows, default=str)) - estimate_tokens(context)
+        print(f"✂️ Mastery context: {len(context.splitlines())}/{len(rows)} rows, ~{saved} tokens saved")
+        return context
+
     async def _get_user_mastery(self, user_id: str) -> List[Dict[str, Any]]:
         """
-        Fetches mastery data for the user from Cloud SQL.
+        Fetches mastery data for the user (cached; see services.mastery).
         """
-        conn = await get_db_connection()
         try:
-            rows = await conn.fetch(
-                "SELECT n.label, m.mastery_level, m.score "
-                "FROM user_mastery m "
-                "JOIN knowledge_nodes n ON m.node_id = n.id "
-                "WHERE m.user_id = $1",
-                user_id
-            )
-            return [dict(r) for r in rows]
+            return await mastery_store.get(user_id)
         except Exception as e:
             print(f"❌ Error fetching mastery: {e}")
             return []
-        finally:
-            await conn.close()
 
 # Export for LangGraph
 curriculum_agent = CurriculumMaster()
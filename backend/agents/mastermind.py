@@ -2,12 +2,16 @@ from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from langgraph.graph import StateGraph, END
 from core.state import AgentState
+from agents.navigator import is_navigation_request
+from core.ratelimit import rate_limiter, estimate_call_tokens
+from core.metrics import instrument_node
 import os
 
 
 # Initialize Gemini 2.5 Pro (Vertex AI) - Latest Stable GA
+ROUTER_MODEL = "gemini-2.5-pro"
 llm = ChatGoogleGenerativeAI(
-    model="gemini-2.5-pro",
+    model=ROUTER_MODEL,
     temperature=0,
     max_output_tokens=2048,
     location=os.environ.get("GCP_LOCATION", "us-central1")
@@ -43,7 +47,7 @@ prompt = ChatPromptTemplate.from_messages([
 
 chain = prompt | llm
 
-def supervisor_node(state: AgentState):
+async def supervisor_node(state: AgentState):
     """
     The MasterMind node that decides which agent to call next.
     """
@@ -53,12 +57,24 @@ def supervisor_node(state: AgentState):
         
     user_message = messages[-1].content
     user_context = state.get("user_context", {})
+
+    # Navigation answers are complete UI payloads, and pure navigation
+    # requests don't need the router LLM to pick the Navigator.
+    if state.get("next") == "NavigatorAgent":
+        return {"next": "DONE"}
+    if len(messages) == 1 and is_navigation_request(user_message):
+        return {"next": "NavigatorAgent"}
     
-    result = chain.invoke({
+    inputs = {
         "input": user_message,
         "current_page": user_context.get("current_page", "Unknown"),
         "user_focus": user_context.get("user_focus", "None")
-    })
+    }
+    result = await rate_limiter.call(
+        ROUTER_MODEL,
+        lambda: chain.ainvoke(inputs),
+        tokens=estimate_call_tokens(system_prompt, user_message, output=16)
+    )
     
     decision = result.content.strip()
     
@@ -92,14 +108,15 @@ from agents.composer import composer_node
 # --- Graph Construction ---
 workflow = StateGraph(AgentState)
 
-workflow.add_node("MasterMind", supervisor_node)
-workflow.add_node("ScribeAgent", scribe_node)
-workflow.add_node("NavigatorAgent", navigator_node)
-workflow.add_node("ResearchAgent", research_node)
-workflow.add_node("ProfessorAgent", professor_node)
-workflow.add_node("CurriculumMaster", curriculum_node)
-workflow.add_node("ArtistAgent", artist_node)
-workflow.add_node("ComposerAgent", composer_node)
+# Every node is timed per agent; the router's decisions are counted as hops
+workflow.add_node("MasterMind", instrument_node("MasterMind", supervisor_node, router=True))
+workflow.add_node("ScribeAgent", instrument_node("ScribeAgent", scribe_node))
+workflow.add_node("NavigatorAgent", instrument_node("NavigatorAgent", navigator_node))
+workflow.add_node("ResearchAgent", instrument_node("ResearchAgent", research_node))
+workflow.add_node("ProfessorAgent", instrument_node("ProfessorAgent", professor_node))
+workflow.add_node("CurriculumMaster", instrument_node("CurriculumMaster", curriculum_node))
+workflow.add_node("ArtistAgent", instrument_node("ArtistAgent", artist_node))
+workflow.add_node("ComposerAgent", instrument_node("ComposerAgent", composer_node))
 
 workflow.set_entry_point("MasterMind")
 
@@ -1,8 +1,111 @@
+import re
+import json
+import time
+from typing import Dict, Any, Optional
 from core.state import AgentState
+from services.graph_snapshot import graph_store, GraphSnapshot
+from core.scope import GraphScope
 
-async def navigator_node(state: AgentState):
+# Requests the Navigator can answer from the graph alone (no LLM involved).
+NAVIGATION_PATTERN = re.compile(
+    r"^\s*(expand|explore|navigate)\b"
+    r"|\bshow\b.*\b(graph|map|connections|neighbou?rs)\b"
+    r"|\bpath from\b.+\bto\b"
+    r"|\bprerequisites? (of|for)\b"
+    r"|\bneighbou?rs of\b",
+    re.IGNORECASE
+)
+PATH_PATTERN = re.compile(r"\bpath from (.+?) to (.+?)[?.!]*$", re.IGNORECASE)
+HOPS_PATTERN = re.compile(r"\b(\d)\s*(?:-|\s)?hops?\b", re.IGNORECASE)
+
+
+def is_navigation_request(text: str) -> bool:
+    return bool(NAVIGATION_PATTERN.search(text or ""))
+
+
+class NavigatorAgent:
     """
-    Navigator Agent: Expands concepts and generates UI payloads.
-    placeholder for now.
+    The Cartographer.
+    Answers graph exploration requests (expand a node, prerequisites,
+    learning paths) from an in-memory snapshot of the knowledge graph and
+    returns UI-ready payloads.
     """
-    return {"messages": ["NavigatorAgent: Generating visual payload..."]}
+    def __init__(self, default_hops: int = 1, max_hops: int = 3, max_nodes: int = 60):
+        self.default_hops = default_hops
+        self.max_hops = max_hops
+        self.max_nodes = max_nodes
+
+    async def run(self, state: AgentState):
+        messages = state["messages"]
+        last_message = messages[-1].content
+        user_context = state.get("user_context", {}) or {}
+        graph_context = state.get("graph_context", {}) or {}
+
+        try:
+            snapshot = await graph_store.get(GraphScope.from_context(user_context))
+        except Exception as e:
+            print(f"❌ Navigator could not load graph: {e}")
+            return {"messages": [json.dumps(self._reply("text", "The knowledge graph is unavailable right now.", {}))]}
+
+        start = time.perf_counter()
+        reply = self.navigate(snapshot, last_message, graph_context.get("selected_node") or user_context.get("user_focus"))
+        reply["payload"]["elapsed_us"] = round((time.perf_counter() - start) * 1e6, 1)
+        return {"messages": [json.dumps(reply)]}
+
+    def navigate(self, snapshot: GraphSnapshot, message: str, focus: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Pure graph work: resolves the request against the snapshot and builds the reply.
+        """
+        path_match = PATH_PATTERN.search(message)
+        if path_match:
+            source = snapshot.resolve(path_match.group(1))
+            target = snapshot.resolve(path_match.group(2))
+            if source is None or target is None:
+                return self._reply("text", "I couldn't find both concepts in the graph.", {})
+            path = snapshot.shortest_path(source, target)
+            if not path:
+                return self._reply("text", f"No prerequisite path leads from {snapshot.labels[source]} to {snapshot.labels[target]}.", {})
+            payload = snapshot.subgraph_payload(path)
+            payload["path"] = [snapshot.node_ids[i] for i in path]
+            steps = " → ".join(snapshot.labels[i] for i in path)
+            return self._reply("graph", f"Learning path: {steps}", payload)
+
+        center = self._find_center(snapshot, message, focus)
+        if center is None:
+            return self._reply("text", "Which concept should I explore? I couldn't match one in the graph.", {})
+
+        hops_match = HOPS_PATTERN.search(message)
+        hops = min(int(hops_match.group(1)), self.max_hops) if hops_match else self.default_hops
+
+        if re.search(r"\bprerequisites?\b", message, re.IGNORECASE):
+            # Everything that must be learned first: walk prerequisite edges backwards
+            depth = snapshot.k_hop(center, k=self.max_hops, direction="in", relations=["Prerequisite"], limit=self.max_nodes)
+            label = snapshot.labels[center]
+            text = f"{label} builds on {len(depth) - 1} prerequisite concept(s)." if len(depth) > 1 else f"{label} has no recorded prerequisites."
+        else:
+            depth = snapshot.k_hop(center, k=hops, direction="both", limit=self.max_nodes)
+            ranked = snapshot.rank_neighbors(center, top=5)
+            closest = ", ".join(snapshot.labels[i] for i in ranked)
+            text = f"{snapshot.labels[center]} connects to {len(depth) - 1} concept(s)" + (f"; most related: {closest}." if closest else ".")
+
+        payload = snapshot.subgraph_payload(depth.keys(), depth=depth)
+        payload["center"] = snapshot.node_ids[center]
+        return self._reply("graph", text, payload)
+
+    def _find_center(self, snapshot: GraphSnapshot, message: str, focus: Optional[str]) -> Optional[int]:
+        mentioned = snapshot.find_labels(message)
+        if mentioned:
+            return mentioned[0]
+        if focus:
+            # user_focus arrives as e.g. "Node: Competition"
+            return snapshot.resolve(focus.split(":", 1)[-1])
+        return None
+
+    def _reply(self, reply_type: str, text: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        return {"type": reply_type, "text": text, "payload": payload}
+
+# Export for LangGraph
+navigator_agent = NavigatorAgent()
+
+async def navigator_node(state: AgentState):
+    return await navigator_agent.run(state)
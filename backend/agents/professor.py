@@ -1,22 +1,49 @@
-
 import os
-import json
+import time
+from typing import List, Dict, Any, Optional
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain_core.prompts import ChatPromptTemplate
 from core.state import AgentState
+from core.cache import TTLCache
+from core.db import get_db_connection
+from services.retrieval import hybrid_search, fetch_prerequisites, embed_query, embedding_bucket
+from services.context import pack_lines, truncate
+from services.analytics import centrality_stores
+from core.scope import GraphScope
+from core.events import event_bus, GRAPH_CHANNEL
+from core.ratelimit import rate_limiter, estimate_call_tokens
 
 class ProfessorAgent:
     """
     The Expert.
     Specializes in high-level domain knowledge (Finance, Marketing, Strategy).
     Provides exam predictions and deep theoretical explanations.
+    Answers are grounded in the top-k knowledge graph nodes for the question.
     """
     def __init__(self):
+        self.model_name = "gemini-2.5-pro" # Use Pro for deeper reasoning
+        self.max_output_tokens = 1024
         self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro", # Use Pro for deeper reasoning
+            model=self.model_name,
             temperature=0.2,
+            max_output_tokens=self.max_output_tokens,
             location=os.environ.get("GCP_LOCATION", "us-central1")
         )
+        self.top_k = 6
+        self.context_token_budget = 800
+        self.critical_top_n = 8
+        # (graph scope, query-embedding bucket) -> packed context; dropped per scope when its graph changes
+        self.context_cache = TTLCache(maxsize=512, ttl=600)
+        # Bumped on every graph change so an in-flight retrieval can't re-cache stale context
+        self._graph_generation = 0
+        event_bus.subscribe(GRAPH_CHANNEL, self._on_graph_changed)
+
+    def _on_graph_changed(self, payload: Dict[str, Any]):
+        """Concepts Scribe just added must be retrievable at once: drop the affected scopes' context."""
+        self._graph_generation += 1
+        self.context_cache.invalidate_where(
+            lambda key: payload.get("full") or key[0].covers(payload.get("tenant_id"), payload.get("subject"))
+        )
 
     async def run(self, state: AgentState):
         """
@@ -26,24 +53,121 @@ class ProfessorAgent:
         last_message = messages[-1].content
         user_context = state.get("user_context", {})
         current_subject = user_context.get("current_page", "General Management")
+        scope = GraphScope.from_context(user_context)
+
+        start = time.perf_counter()
+        graph_context, cached = await self._retrieve_context(scope, last_message)
+        retrieval_ms = (time.perf_counter() - start) * 1000
+        print(f"📚 Professor retrieval: {retrieval_ms:.1f} ms ({'cache hit' if cached else 'graph query'})")
 
         system_instruction = (
             f"You are the Professor of {current_subject}. "
             "Your goal is to provide deep academic insight and identify exam-critical concepts. "
             "Use a professional, authoritative, yet encouraging tone.\n\n"
-            "If the user asks a question, explain the underlying theory and its practical application in business."
+            "If the user asks a question, explain the underlying theory and its practical application in business. "
+            "Be concise: lead with the answer, then the key reasoning."
         )
-        
+        if graph_context:
+            system_instruction += (
+                "\n\nRelevant concepts from this course's knowledge graph "
+                "(ground your answer in these and name them where they apply):\n"
+                f"{graph_context}"
+            )
+        critical = self._critical_concepts(scope)
+        if critical:
+            system_instruction += (
+                "\n\nProfessor Emphasis — the course's most central concepts "
+                f"(highlight them when relevant): {', '.join(critical)}"
+            )
+
         prompt = ChatPromptTemplate.from_messages([
-            ("system", system_instruction),
+            ("system", "{system_instruction}"),
             ("human", "{input}")
         ])
-        
+
         chain = prompt | self.llm
-        response = await chain.ainvoke({"input": last_message})
-        
+        response = await rate_limiter.call(
+            self.model_name,
+            lambda: chain.ainvoke({"system_instruction": system_instruction, "input": last_message}),
+            tokens=estimate_call_tokens(system_instruction, last_message, output=self.max_output_tokens)
+        )
+
+        metadata = getattr(response, "response_metadata", None)
+        if isinstance(metadata, dict):
+            metadata["retrieval_ms"] = round(retrieval_ms, 2)
+            metadata["retrieval_cached"] = cached
+
         return {"messages": [response]}
 
+    async def _retrieve_context(self, scope: GraphScope, query: str):
+        """
+        Returns (packed graph context, cache hit?) from the course's own graph.
+        Retrieval failures degrade to an ungrounded answer rather than failing the turn.
+        """
+        try:
+            embedding = await embed_query(query)
+        except Exception as e:
+            print(f"⚠️ Professor embedding failed: {e}")
+            return "", False
+
+        cache_key = (scope, embedding_bucket(embedding))
+        cached = self.context_cache.get(cache_key)
+        if cached is not None:
+            return cached, True
+        generation = self._graph_generation
+
+        try:
+            conn = await get_db_connection()
+        except Exception as e:
+            print(f"⚠️ Professor retrieval DB connection failed: {e}")
+            return "", False
+
+        try:
+            nodes = await hybrid_search(query, k=self.top_k, embedding=embedding, conn=conn, scope=scope)
+            prerequisites = await fetch_prerequisites([n["id"] for n in nodes], conn=conn)
+        except Exception as e:
+            print(f"⚠️ Professor retrieval failed: {e}")
+            return "", False
+        finally:
+            await conn.close()
+
+        context = self.build_context(nodes, prerequisites)
+        if self._graph_generation == generation:
+            self.context_cache.set(cache_key, context)
+        return context, False
+
+    def _critical_concepts(self, scope: Optional[GraphScope] = None) -> List[str]:
+        """Labels of the course's top-ranked concepts from the precomputed graph ranking (no LLM, no DB wait)."""
+        try:
+            return [c["label"] for c in centrality_stores.for_scope(scope).cached_top(self.critical_top_n)]
+        except Exception as e:
+            print(f"⚠️ Professor critical concepts unavailable: {e}")
+            return []
+
+    def build_context(self, nodes: List[Dict[str, Any]], prerequisites: List[Dict[str, Any]]) -> str:
+        """
+        Packs retrieved nodes (best first), then their prerequisites, into the token budget.
+        """
+        needs: Dict[str, List[str]] = {}
+        for p in prerequisites:
+            needs.setdefault(p["for_id"], []).append(p["label"])
+
+        lines = []
+        for node in nodes:
+            line = f"- {node['label']} [{node['type']}]: {truncate(node['content'], 280)}"
+            if node["id"] in needs:
+                line += f" (requires: {', '.join(needs[node['id']])})"
+            lines.append(line)
+
+        seen = {n["id"] for n in nodes}
+        for p in prerequisites:
+            if p["id"] in seen:
+                continue
+            seen.add(p["id"])
+            lines.append(f"- {p['label']} [prerequisite]: {truncate(p['content'], 160)}")
+
+        return pack_lines(lines, self.context_token_budget)
+
 # Export for LangGraph
 professor_agent = ProfessorAgent()
 
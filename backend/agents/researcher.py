@@ -1,21 +1,84 @@
-from typing import TypedDict, Annotated, List
+from typing import TypedDict, Annotated, List, Optional
 from langchain_core.messages import BaseMessage, AIMessage
 from langchain_google_genai import ChatGoogleGenerativeAI
-from google.cloud import discoveryengine_v1beta as discoveryengine
 from core.state import AgentState
+from core.scope import GraphScope
+from services.search_index import get_course_index, tokenize
+from services.retrieval import hybrid_search, reciprocal_rank_fusion
+from core.ratelimit import rate_limiter, estimate_call_tokens
 import os
 
 # Initialize Gemini with Grounding (Vertex AI)
 class ResearchAgent:
     def __init__(self):
+        self.model_name = "gemini-2.5-pro"
         self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.5-pro",
+            model=self.model_name,
             temperature=0.2,
             location=os.environ.get("GCP_LOCATION", "us-central1")
         )
         self.project_id = "mba-copilot-485805"
         self.location = "global" # Discovery Engine usually global
-        self.search_client = discoveryengine.SearchServiceClient()
+        self._search_client = None
+        # Local retrieval: below this query-term coverage we also search externally.
+        self.local_top_k = 5
+        self.snippet_chars = 400
+        self.min_term_coverage = 0.6
+
+    @property
+    def search_client(self):
+        """Vertex AI Search client, created on first use (construction resolves credentials)."""
+        if self._search_client is None:
+            from google.cloud import discoveryengine_v1beta as discoveryengine
+            self._search_client = discoveryengine.SearchServiceClient()
+        return self._search_client
+
+    async def search_local(self, query: str, scope: Optional[GraphScope] = None) -> List[dict]:
+        """
+        Queries the course's in-process BM25 index (transcripts, Master Docs,
+        node content) first: milliseconds, no network call. Only when its
+        recall is poor does it also run the hybrid (full-text + vector) search
+        over the course's knowledge nodes and fuse both rankings with RRF.
+        """
+        lexical = get_course_index(scope).search(query, k=self.local_top_k)
+        if self.has_good_recall(query, lexical):
+            return lexical
+
+        try:
+            nodes = await hybrid_search(query, k=self.local_top_k, scope=scope)
+        except Exception as e:
+            print(f"⚠️ Hybrid search failed, using the local course index only: {e}")
+            return lexical
+
+        terms = set(tokenize(query))
+        hits = {hit["id"]: hit for hit in lexical}
+        for node in nodes:
+            text = f"{node['label']}. {node['content'] or ''}"
+            # Node documents share the course index's ids: the BM25 hit (and snippet) wins
+            hits.setdefault(f"node:{node['label']}", {
+                "id": f"node:{node['label']}",
+                "score": node["score"],
+                "matched_terms": sorted(terms & set(tokenize(text))),
+                "snippet": text if len(text) <= self.snippet_chars else text[:self.snippet_chars] + "...",
+            })
+        fused = reciprocal_rank_fusion(
+            {
+                "lexical": {hit["id"]: rank for rank, hit in enumerate(lexical, 1)},
+                "hybrid": {f"node:{node['label']}": rank for rank, node in enumerate(nodes, 1)},
+            },
+            {"lexical": 1.0, "hybrid": 1.0}
+        )
+        return [{**hits[doc_id], "score": score} for doc_id, score in fused[:self.local_top_k]]
+
+    def has_good_recall(self, query: str, hits: List[dict]) -> bool:
+        """
+        Local recall is good when the hits cover most of the distinct query terms.
+        """
+        terms = set(tokenize(query))
+        if not hits or not terms:
+            return False
+        covered = {t for hit in hits for t in hit["matched_terms"]}
+        return len(covered & terms) / len(terms) >= self.min_term_coverage
 
     async def search_google(self, query: str) -> str:
         """
@@ -34,16 +97,21 @@ class ResearchAgent:
         messages = state["messages"]
         last_message = messages[-1].content
         
-        # 1. Generate search queries
-        query_prompt = f"Given the user request: '{last_message}', generate 3 specific search queries to find the most accurate and up-to-date information."
-        queries_resp = await self.llm.ainvoke(query_prompt)
-        queries = queries_resp.content.split("\n")
-        
-        # 2. Simulate/Perform search
-        search_results = []
-        for q in queries[:2]: # Top 2 queries
-            res = await self.search_google(q)
-            search_results.append(res)
+        # 1. Query local course materials first
+        local_hits = await self.search_local(last_message, GraphScope.from_context(state.get("user_context")))
+        search_results = [f"[{hit['id']}] {hit['snippet']}" for hit in local_hits]
+
+        # 2. Fall back to external search only when local recall is poor
+        if not self.has_good_recall(last_message, local_hits):
+            query_prompt = f"Given the user request: '{last_message}', generate 3 specific search queries to find the most accurate and up-to-date information."
+            queries_resp = await rate_limiter.call(
+                self.model_name, lambda: self.llm.ainvoke(query_prompt), tokens=estimate_call_tokens(query_prompt, output=128)
+            )
+            queries = queries_resp.content.split("\n")
+
+            for q in queries[:2]: # Top 2 queries
+                res = await self.search_google(q)
+                search_results.append(res)
             
         # 3. Synthesize final answer
         synthesis_prompt = (
@@ -52,7 +120,9 @@ class ResearchAgent:
             "Provide a structured response with academic depth."
         )
         
-        response = await self.llm.ainvoke(synthesis_prompt)
+        response = await rate_limiter.call(
+            self.model_name, lambda: self.llm.ainvoke(synthesis_prompt), tokens=estimate_call_tokens(synthesis_prompt)
+        )
         
         return {"messages": [response]}
 
@@ -1,11 +1,23 @@
 
 import os
 import json
-from typing import List, Dict, Any
+import hashlib
+from collections import Counter
+from typing import List, Dict, Any, Optional, Tuple
 from langchain_google_genai import ChatGoogleGenerativeAI, GoogleGenerativeAIEmbeddings
 from langchain_core.prompts import ChatPromptTemplate
 from core.db import get_db_connection
 from core.state import AgentState
+from services.search_index import get_course_index, schedule_save
+from core.events import event_bus, GRAPH_CHANNEL
+from services.pubsub import broker, graph_update_messages
+from services.labels import label_indexes
+from core.scope import GraphScope
+from core.ratelimit import rate_limiter, estimate_call_tokens
+from core.scheduler import work_class, LIVE
+
+EXTRACTION_MODEL = "gemini-2.0-flash"
+EMBEDDING_MODEL = "text-embedding-004"
 
 class ScribeAgent:
     """
@@ -15,33 +27,95 @@ class ScribeAgent:
     """
     def __init__(self):
         self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash",
+            model=EXTRACTION_MODEL,
             temperature=0.1,
             location=os.environ.get("GCP_LOCATION", "us-central1")
         )
         self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/text-embedding-004", # Latest embedding model
+            model=f"models/{EMBEDDING_MODEL}", # Latest embedding model
             task_type="retrieval_document"
         )
 
-    async def process_transcript(self, session_id: str, text: str) -> List[Dict[str, Any]]:
+    async def process_transcript(self, session_id: str, text: str, scope: Optional[GraphScope] = None) -> List[Dict[str, Any]]:
         """
         Main entry point for processing a transcript segment.
+        Concepts are resolved and written within `scope` (tenant + subject)
+        and stamped with the session that produced them.
         """
-        # 1. Extract concepts and relations via LLM
-        extraction = await self._extract_knowledge(text)
-        
-        # 2. Store in DB
-        processed_nodes = []
-        for node in extraction.get("nodes", []):
-            node_id = await self._upsert_node(node)
-            processed_nodes.append({**node, "id": str(node_id)})
-            
+        scope = (scope or GraphScope()).writable()
+        index = label_indexes.for_scope(scope)
+
+        # Model calls here are live-lecture work: queued behind chat, ahead of batch
+        with work_class(LIVE):
+            # 1. Extract concepts and relations via LLM
+            extraction = await self._extract_knowledge(text)
+
+            # 2. Resolve against existing concepts in bulk, then write only what's new
+            nodes = extraction.get("nodes", [])
+            resolved = await self._resolve_nodes(nodes, scope)
+            existing = [node_id for node_id, _ in resolved if node_id]
+            if existing:
+                await self._touch_nodes(existing)
+
+            processed_nodes = []
+            for node, (node_id, embedding) in zip(nodes, resolved):
+                if node_id is None:
+                    # An earlier node of this batch may have just created the same concept
+                    node_id = index.resolve(node["label"]) or await self._upsert_node(node, embedding, scope, session_id)
+                processed_nodes.append({**node, "id": str(node_id)})
+
         for edge in extraction.get("edges", []):
-            await self._upsert_edge(edge, nodes=processed_nodes)
+            await self._upsert_edge(edge, nodes=processed_nodes, scope=scope, session_id=session_id)
+
+        # 3. Keep the local course-material index and graph snapshots in step
+        self._index_segment(session_id, text, processed_nodes, scope)
+        if processed_nodes:
+            await event_bus.publish(GRAPH_CHANNEL, {
+                "session_id": session_id,
+                "tenant_id": scope.tenant_id,
+                "subject": scope.subject,
+                "nodes": len(processed_nodes)
+            })
+            await self._broadcast(session_id, processed_nodes, extraction.get("edges", []))
             
         return processed_nodes
 
+    async def _broadcast(self, session_id: str, nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]]):
+        """
+        Pushes the new concepts to everyone watching this session's graph.
+        """
+        ids = {n["label"]: n["id"] for n in nodes if n["id"] not in ("dummy-node-id", "error-node-id")}
+        live_nodes = [
+            {"id": n["id"], "label": n["label"], "type": n.get("type")}
+            for n in nodes if n["label"] in ids
+        ]
+        live_edges = [
+            {"source": ids[e["source"]], "target": ids[e["target"]], "relation": e.get("relation")}
+            for e in edges if e.get("source") in ids and e.get("target") in ids
+        ]
+        for message in graph_update_messages(live_nodes, live_edges):
+            await broker.publish(f"session:{session_id}", message)
+
+    def _index_segment(self, session_id: str, text: str, nodes: List[Dict[str, Any]], scope: Optional[GraphScope] = None):
+        """
+        Adds the transcript segment and extracted node content to the course's
+        BM25 index. The file write is batched and runs off the event loop.
+        """
+        index = get_course_index(scope)
+        segment_hash = hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+        index.add(
+            f"transcript:{session_id}:{segment_hash}",
+            text,
+            {"source": "transcript", "session_id": session_id}
+        )
+        for node in nodes:
+            index.add(
+                f"node:{node['label']}",
+                f"{node['label']}. {node.get('content', '')}",
+                {"source": "knowledge_node", "label": node["label"], "type": node.get("type")}
+            )
+        schedule_save(index)
+
     async def _extract_knowledge(self, text: str) -> Dict[str, Any]:
         """
         Uses LLM to extract JSON nodes and edges.
@@ -68,7 +142,9 @@ class ScribeAgent:
         """)
         
         chain = prompt | self.llm
-        response = await chain.ainvoke({"text": text})
+        response = await rate_limiter.call(
+            EXTRACTION_MODEL, lambda: chain.ainvoke({"text": text}), tokens=estimate_call_tokens(text, output=1024)
+        )
         
         try:
             # Clean JSON if LLM adds markdown backticks
@@ -78,10 +154,97 @@ class ScribeAgent:
             print(f"JSON Parse Error in ScribeAgent: {e}")
             return {"nodes": [], "edges": []}
 
-    async def _upsert_node(self, node: Dict[str, Any]):
+    async def _resolve_nodes(
+        self,
+        nodes: List[Dict[str, Any]],
+        scope: Optional[GraphScope] = None
+    ) -> List[Tuple[Optional[str], Optional[List[float]]]]:
         """
-        Inserts or updates a concept node.
+        Matches extracted concepts to existing nodes of the same scope before
+        any DB write. Exact label and alias matches come first (free); only the
+        leftovers are embedded, in one batch, and checked against their nearest
+        existing neighbour (trie prefix / abbreviation candidates need the same
+        embedding confirmation). If the batch embedding fails, each leftover is
+        embedded on its own so one bad node doesn't abort the transcript.
+        Returns (existing node id or None, embedding for new nodes) per node.
         """
+        if not nodes:
+            return []
+        label_index = label_indexes.for_scope(scope)
+        try:
+            await label_index.refresh()
+        except Exception as e:
+            print(f"⚠️ Label index sync failed, resolving against what's loaded: {e}")
+
+        resolved = [label_index.resolve(n["label"]) for n in nodes]
+        pending = [i for i, node_id in enumerate(resolved) if node_id is None]
+        if not pending:
+            return [(node_id, None) for node_id in resolved]
+
+        texts = [nodes[i].get("content", nodes[i]["label"]) for i in pending]
+        try:
+            vectors = await rate_limiter.call(
+                EMBEDDING_MODEL, lambda: self.embeddings.aembed_documents(texts), tokens=estimate_call_tokens(*texts, output=0)
+            )
+        except Exception as e:
+            print(f"⚠️ Batch embedding failed, resolving concepts one by one: {e}")
+            vectors = [await self._embed_one(text) for text in texts]
+
+        embedded = [(i, v) for i, v in zip(pending, vectors) if v is not None]
+        embeddings: Dict[int, List[float]] = dict(embedded)
+        if embedded:
+            matches = label_index.nearest(
+                [v for _, v in embedded],
+                candidates=[label_index.candidates(nodes[i]["label"]) for i, _ in embedded]
+            )
+            for (i, _), match in zip(embedded, matches):
+                resolved[i] = match
+        # Nodes without an embedding are left to _upsert_node (which embeds, or fails, on its own)
+        return [(node_id, embeddings.get(i)) for i, node_id in enumerate(resolved)]
+
+    async def _embed_one(self, text: str) -> Optional[List[float]]:
+        try:
+            return await rate_limiter.call(
+                EMBEDDING_MODEL, lambda: self.embeddings.aembed_query(text), tokens=estimate_call_tokens(text, output=0)
+            )
+        except Exception as e:
+            print(f"⚠️ Embedding failed for a concept: {e}")
+            return None
+
+    async def _touch_nodes(self, node_ids: List[str]):
+        """
+        Records another mention of already-known concepts (no re-embedding).
+        An id listed twice (two labels of one concept in a segment) counts twice.
+        """
+        try:
+            conn = await get_db_connection()
+        except Exception as e:
+            print(f"❌ DB Connection Error in ScribeAgent: {e}")
+            return
+
+        try:
+            counts = Counter(node_ids)
+            await conn.execute(
+                "UPDATE knowledge_nodes AS k SET mention_count = k.mention_count + t.n, updated_at = NOW() "
+                "FROM unnest($1::uuid[], $2::int[]) AS t(id, n) WHERE k.id = t.id",
+                list(counts), list(counts.values())
+            )
+        except Exception as e:
+            print(f"❌ Touch Nodes Error: {e}")
+        finally:
+            await conn.close()
+
+    async def _upsert_node(
+        self,
+        node: Dict[str, Any],
+        embedding: Optional[List[float]] = None,
+        scope: Optional[GraphScope] = None,
+        session_id: Optional[str] = None
+    ):
+        """
+        Inserts or updates a concept node within its scope.
+        """
+        scope = (scope or GraphScope()).writable()
         try:
             conn = await get_db_connection()
         except Exception as e:
@@ -89,26 +252,36 @@ class ScribeAgent:
             return "dummy-node-id"
 
         try:
-            # Generate embedding
-            raw_embedding = await self.embeddings.aembed_query(node["content"])
+            content = node.get("content", node["label"])
+            # Generate embedding (unless resolution already did)
+            raw_embedding = embedding
+            if raw_embedding is None:
+                raw_embedding = await rate_limiter.call(
+                    EMBEDDING_MODEL,
+                    lambda: self.embeddings.aembed_query(content),
+                    tokens=estimate_call_tokens(content, output=0)
+                )
             
-            # Check if node exists by label
+            # Check if node exists by label (in this course only)
             row = await conn.fetchrow(
-                "SELECT id FROM knowledge_nodes WHERE label = $1", 
-                node["label"]
+                "SELECT id FROM knowledge_nodes WHERE tenant_id = $1 AND subject = $2 AND label = $3",
+                scope.tenant_id, scope.subject, node["label"]
             )
             
             if row:
                 node_id = row['id']
                 await conn.execute(
-                    "UPDATE knowledge_nodes SET content = $1, embedding = $2, metadata = $3 WHERE id = $4",
-                    node["content"], raw_embedding, json.dumps(node), node_id
+                    "UPDATE knowledge_nodes SET content = $1, embedding = $2, metadata = $3, mention_count = mention_count + 1, updated_at = NOW() WHERE id = $4",
+                    content, raw_embedding, json.dumps(node), node_id
                 )
             else:
                 node_id = await conn.fetchval(
-                    "INSERT INTO knowledge_nodes (label, type, content, embedding, metadata) VALUES ($1, $2, $3, $4, $5) RETURNING id",
-                    node["label"], node["type"], node["content"], raw_embedding, json.dumps(node)
+                    "INSERT INTO knowledge_nodes (label, type, content, embedding, metadata, tenant_id, subject, session_id) "
+                    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8) RETURNING id",
+                    node["label"], node.get("type", "Concept"), content, raw_embedding, json.dumps(node),
+                    scope.tenant_id, scope.subject, session_id
                 )
+            label_indexes.for_scope(scope).add(str(node_id), node["label"], raw_embedding)
             return node_id
         except Exception as e:
             print(f"❌ Upsert Node Error: {e}")
@@ -116,10 +289,17 @@ class ScribeAgent:
         finally:
             await conn.close()
 
-    async def _upsert_edge(self, edge: Dict[str, Any], nodes: List[Dict[str, Any]]):
+    async def _upsert_edge(
+        self,
+        edge: Dict[str, Any],
+        nodes: List[Dict[str, Any]],
+        scope: Optional[GraphScope] = None,
+        session_id: Optional[str] = None
+    ):
         """
-        Inserts a relationship between nodes.
+        Inserts a relationship between nodes (of the same scope).
         """
+        scope = (scope or GraphScope()).writable()
         source_id = next((n["id"] for n in nodes if n["label"] == edge["source"]), None)
         target_id = next((n["id"] for n in nodes if n["label"] == edge["target"]), None)
         
@@ -134,8 +314,9 @@ class ScribeAgent:
 
         try:
             await conn.execute(
-                "INSERT INTO knowledge_edges (source_id, target_id, relation) VALUES ($1, $2, $3) ON CONFLICT DO NOTHING",
-                source_id, target_id, edge["relation"]
+                "INSERT INTO knowledge_edges (source_id, target_id, relation, tenant_id, subject, session_id) "
+                "VALUES ($1, $2, $3, $4, $5, $6) ON CONFLICT DO NOTHING",
+                source_id, target_id, edge["relation"], scope.tenant_id, scope.subject, session_id
             )
         except Exception as e:
             print(f"❌ Upsert Edge Error: {e}")
@@ -148,9 +329,11 @@ class ScribeAgent:
         """
         messages = state["messages"]
         last_message = messages[-1].content
-        session_id = state.get("user_context", {}).get("session_id", "default-session")
+        user_context = state.get("user_context", {}) or {}
+        session_id = user_context.get("session_id", "default-session")
+        scope = GraphScope.from_context(user_context)
 
-        nodes = await self.process_transcript(session_id, last_message)
+        nodes = await self.process_transcript(session_id, last_message, scope)
         
         return {
             "messages": [f"ScribeAgent: Extracted {len(nodes)} new concepts into the knowledge vault."],
@@ -1,4 +1,7 @@
 from services.gcp import vertex_service
+from typing import Optional
+from services.search_index import get_course_index, schedule_save
+from core.scope import GraphScope, DEFAULT_TENANT
 
 class SynthesisAgent:
     def __init__(self):
@@ -14,7 +17,7 @@ class SynthesisAgent:
         5. maintain a professional, high-density academic tone.
         """
 
-    async def generate_master_doc(self, subject: str, transcript: str, notes: str, chats: str):
+    async def generate_master_doc(self, subject: str, transcript: str, notes: str, chats: str, tenant_id: Optional[str] = None):
         prompt = f"""
         Subject: {subject}
         
@@ -30,6 +33,13 @@ class SynthesisAgent:
         Synthesize the above into a Master Document. Ensure zero hallucination by sticking strictly to the provided materials.
         """
         
-        return await vertex_service.generate_content(prompt, self.system_instruction)
+        doc = await vertex_service.generate_content(prompt, self.system_instruction)
+
+        # Master Docs become local research material for later questions of the same course
+        index = get_course_index(GraphScope(tenant_id or DEFAULT_TENANT, subject))
+        index.add(f"master_doc:{subject}", doc, {"source": "master_doc", "subject": subject})
+        schedule_save(index)
+
+        return doc
 
 synthesis_agent = SynthesisAgent()
@@ -0,0 +1,280 @@
+"""
+Deterministic, latency-configurable stand-ins for Gemini, embeddings,
+Speech-to-Text and Postgres. Outputs depend only on the inputs, and every
+simulated delay is a fixed function of the request size, so two runs on the
+same machine differ only by the code under test.
+"""
+import re
+import json
+import time
+import uuid
+import asyncio
+import hashlib
+from types import SimpleNamespace
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from core.metrics import InstrumentedConnection
+
+
+class LatencyProfile:
+    """
+    Simulated service latencies in seconds. `scale` multiplies all of them:
+    1.0 approximates the real services, 0 measures pure in-process overhead.
+    """
+    def __init__(
+        self,
+        scale: float = 1.0,
+        llm_base: float = 0.150,
+        llm_per_output_token: float = 0.002,
+        embed_base: float = 0.040,
+        embed_per_text: float = 0.002,
+        db_query: float = 0.002,
+        db_connect: float = 0.010,
+        speech_per_audio_second: float = 0.030
+    ):
+        self.scale = scale
+        self.llm_base = llm_base
+        self.llm_per_output_token = llm_per_output_token
+        self.embed_base = embed_base
+        self.embed_per_text = embed_per_text
+        self.db_query = db_query
+        self.db_connect = db_connect
+        self.speech_per_audio_second = speech_per_audio_second
+
+    def llm(self, output_tokens: int) -> float:
+        return self.scale * (self.llm_base + self.llm_per_output_token * output_tokens)
+
+    def embed(self, texts: int) -> float:
+        return self.scale * (self.embed_base + self.embed_per_text * texts)
+
+    def db(self) -> float:
+        return self.scale * self.db_query
+
+    def connect(self) -> float:
+        return self.scale * self.db_connect
+
+    def speech(self, audio_seconds: float) -> float:
+        return self.scale * self.speech_per_audio_second * audio_seconds
+
+
+def _tokens(text: str) -> int:
+    return max(1, len(text) // 4)
+
+
+async def _sleep(seconds: float):
+    # asyncio.sleep(0) still yields, so scale=0 keeps the same interleaving
+    await asyncio.sleep(seconds)
+
+
+# ─── Gemini (LangChain chat model) ───
+
+class FakeChatModel(BaseChatModel):
+    """
+    LangChain chat model answering with `respond(prompt_text)` after the
+    profile's LLM latency, reporting usage like ChatGoogleGenerativeAI does.
+    """
+    respond: Callable[[str], str]
+    latency: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-gemini"
+
+    def _result(self, messages) -> ChatResult:
+        prompt = "\n".join(str(m.content) for m in messages)
+        text = self.respond(prompt)
+        usage = {"input_tokens": _tokens(prompt), "output_tokens": _tokens(text), "total_tokens": _tokens(prompt) + _tokens(text)}
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text, usage_metadata=usage))])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = self._result(messages)
+        time.sleep(self.latency.llm(result.generations[0].message.usage_metadata["output_tokens"]))
+        return result
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        result = self._result(messages)
+        await _sleep(self.latency.llm(result.generations[0].message.usage_metadata["output_tokens"]))
+        return result
+
+
+def router_response(prompt: str) -> str:
+    """The router's one-word decision, picked from the request text."""
+    agents = ["Professor", "Research", "Curriculum", "Artist", "Composer", "Scribe"]
+    return agents[int(hashlib.sha1(prompt.encode()).hexdigest(), 16) % len(agents)]
+
+
+STUDENT_MARKER = "[student]"
+
+
+def chat_router_response(prompt: str) -> str:
+    """Routes a student's question to the Professor, and the Professor's answer to DONE."""
+    return "Professor" if STUDENT_MARKER in prompt else "DONE"
+
+
+def answer_response(prompt: str) -> str:
+    """A ~150-token tutoring answer that echoes the question (without the marker, so the router stops)."""
+    question = prompt.strip().splitlines()[-1].replace(STUDENT_MARKER, "").strip()[:200]
+    return f"Let's work through this: {question}. " + "The key idea is that risk and return are linked. " * 12
+
+
+def extraction_response(concepts: int) -> Callable[[str], str]:
+    """Scribe extraction JSON with `concepts` nodes chained by Prerequisite edges."""
+    def respond(prompt: str) -> str:
+        seed = hashlib.sha1(prompt.encode()).hexdigest()[:6]
+        nodes = [
+            {"label": f"Concept {seed}-{i}", "type": "Concept", "content": f"Definition of concept {i} from segment {seed}."}
+            for i in range(concepts)
+        ]
+        edges = [
+            {"source": nodes[i]["label"], "target": nodes[i + 1]["label"], "relation": "Prerequisite"}
+            for i in range(concepts - 1)
+        ]
+        return "```json\n" + json.dumps({"nodes": nodes, "edges": edges}) + "\n```"
+    return respond
+
+
+# ─── Embeddings ───
+
+class FakeEmbeddings:
+    """GoogleGenerativeAIEmbeddings stand-in: unit vectors seeded by the text."""
+    def __init__(self, latency: LatencyProfile, dim: int = 768):
+        self.latency = latency
+        self.dim = dim
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int(hashlib.sha1(text.encode()).hexdigest()[:8], 16)
+        vec = np.random.default_rng(seed).standard_normal(self.dim)
+        return (vec / np.linalg.norm(vec)).tolist()
+
+    async def aembed_documents(self, texts: List[str]) -> List[List[float]]:
+        await _sleep(self.latency.embed(len(texts)))
+        return [self._vector(t) for t in texts]
+
+    async def aembed_query(self, text: str) -> List[float]:
+        await _sleep(self.latency.embed(1))
+        return self._vector(text)
+
+
+# ─── Vertex AI GenerativeModel (synthesis) ───
+
+def fake_generative_model(latency: LatencyProfile, output_ratio: float = 0.25, max_output_tokens: int = 2048):
+    """
+    A `vertexai.GenerativeModel` replacement class. The Master Doc it writes
+    is `output_ratio` times the prompt's length (up to the model's output
+    cap), and latency grows with it.
+    """
+    class FakeGenerativeModel:
+        def __init__(self, model_name: str, system_instruction=None):
+            self.model_name = model_name
+
+        async def generate_content_async(self, prompt: str):
+            out_tokens = max(1, min(max_output_tokens, int(_tokens(prompt) * output_ratio)))
+            await _sleep(latency.llm(out_tokens))
+            words = re.findall(r"\w+", prompt)[:out_tokens] or ["empty"]
+            text = "# Master Document\n\n" + " ".join(words)
+            usage = SimpleNamespace(
+                prompt_token_count=_tokens(prompt),
+                candidates_token_count=out_tokens,
+                total_token_count=_tokens(prompt) + out_tokens
+            )
+            return SimpleNamespace(text=text, usage_metadata=usage)
+
+    return FakeGenerativeModel
+
+
+# ─── Speech-to-Text v2 ───
+
+# 16 kHz, 16-bit mono LINEAR16
+AUDIO_BYTES_PER_SECOND = 32000
+
+
+def fake_speech_client(latency: LatencyProfile, words_per_second: float = 2.5, result_seconds: float = 15.0):
+    """
+    A `speech_v2.SpeechClient` replacement class. Like Chirp, it returns one
+    result per ~`result_seconds` of audio; `recognize` blocks (as the real,
+    synchronous client does) for the profile's per-audio-second latency.
+    """
+    class FakeSpeechClient:
+        def __init__(self, client_options=None):
+            self.client_options = client_options
+
+        def recognize(self, request):
+            seconds = len(request.content) / AUDIO_BYTES_PER_SECOND
+            time.sleep(latency.speech(seconds))
+            results, offset = [], 0.0
+            while offset < seconds:
+                span = min(result_seconds, seconds - offset)
+                words = " ".join(f"word{i}" for i in range(int(span * words_per_second)))
+                results.append(SimpleNamespace(alternatives=[SimpleNamespace(transcript=words, confidence=0.92)]))
+                offset += result_seconds
+            return SimpleNamespace(results=results)
+
+    return FakeSpeechClient
+
+
+# ─── Postgres ───
+
+class FakeDatabase:
+    """
+    Just enough of the knowledge_nodes / user_mastery tables for the hot
+    paths under benchmark, answered by statement shape.
+    """
+    def __init__(self, latency: LatencyProfile):
+        self.latency = latency
+        self.nodes: Dict[tuple, str] = {}
+        self.mastery: Dict[str, List[Dict[str, Any]]] = {}
+        self.queries = 0
+
+    def seed_mastery(self, users: int, rows_per_user: int):
+        for u in range(users):
+            self.mastery[f"user-{u}"] = [
+                {"node_id": uuid.UUID(int=u * 100_000 + i), "label": f"Concept {i}", "mastery_level": "learning", "score": (i % 10) / 10}
+                for i in range(rows_per_user)
+            ]
+
+    async def connect(self):
+        await _sleep(self.latency.connect())
+        return InstrumentedConnection(FakeConnection(self))
+
+
+class FakeConnection:
+    def __init__(self, db: FakeDatabase):
+        self.db = db
+
+    async def _roundtrip(self):
+        self.db.queries += 1
+        await _sleep(self.db.latency.db())
+
+    async def execute(self, sql: str, *args):
+        await self._roundtrip()
+        return "INSERT 0 1" if sql.lstrip().upper().startswith("INSERT") else "UPDATE 1"
+
+    async def fetch(self, sql: str, *args):
+        await self._roundtrip()
+        if "FROM user_mastery" in sql:
+            return [dict(r) for r in self.db.mastery.get(args[0], [])]
+        return []  # label / graph syncs: nothing changed elsewhere
+
+    async def fetchrow(self, sql: str, *args):
+        await self._roundtrip()
+        if "FROM knowledge_nodes" in sql and len(args) == 3:
+            node_id = self.db.nodes.get(args)
+            return {"id": node_id} if node_id else None
+        return None
+
+    async def fetchval(self, sql: str, *args):
+        await self._roundtrip()
+        if "INSERT INTO knowledge_nodes" in sql:
+            node_id = str(uuid.uuid4())
+            label, tenant_id, subject = args[0], args[5], args[6]
+            self.db.nodes[(tenant_id, subject, label)] = node_id
+            return node_id
+        return None
+
+    async def close(self):
+        pass
@@ -0,0 +1,107 @@
+"""
+Timing, reporting and baseline comparison for the benchmark cases.
+"""
+import os
+import json
+import time
+import asyncio
+import platform
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+# A case regresses when its p95 grows by more than this fraction over the baseline
+# and by more than MIN_DELTA_MS (microsecond cases are all noise).
+DEFAULT_TOLERANCE = 0.20
+MIN_DELTA_MS = 1.0
+
+
+def summarize(latencies: List[float], wall: float, concurrency: int) -> Dict[str, Any]:
+    """Throughput and latency percentiles (ms) of one case's timed calls."""
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 3)
+
+    return {
+        "iterations": len(ordered),
+        "concurrency": concurrency,
+        "throughput_per_s": round(len(ordered) / wall, 2) if wall > 0 else None,
+        "p50_ms": pct(0.50),
+        "p95_ms": pct(0.95),
+        "p99_ms": pct(0.99),
+        "max_ms": pct(1.0),
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3),
+    }
+
+
+async def measure(
+    fn: Callable[[int], Awaitable[Any]],
+    iterations: int,
+    concurrency: int = 1,
+    warmup: int = 2
+) -> Dict[str, Any]:
+    """
+    Calls `fn(i)` `iterations` times with at most `concurrency` in flight,
+    after `warmup` untimed calls, and summarizes the per-call latencies.
+    """
+    for i in range(warmup):
+        await fn(-1 - i)
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def timed(i: int):
+        async with semaphore:
+            start = time.perf_counter()
+            await fn(i)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(timed(i) for i in range(iterations)))
+    return summarize(latencies, time.perf_counter() - start, concurrency)
+
+
+def environment(latency_scale: float) -> Dict[str, Any]:
+    return {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "latency_scale": latency_scale,
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def save_baseline(path: str, results: Dict[str, Dict[str, Any]], meta: Dict[str, Any]):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({"meta": meta, "cases": results}, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def load_baseline(path: str) -> Optional[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(results: Dict[str, Dict[str, Any]], baseline: Dict[str, Any], tolerance: float = DEFAULT_TOLERANCE) -> List[str]:
+    """Names (with the change) of cases whose p95 regressed beyond `tolerance`."""
+    regressions = []
+    for name, current in results.items():
+        before = baseline.get("cases", {}).get(name)
+        if not before or not before.get("p95_ms"):
+            continue
+        change = current["p95_ms"] / before["p95_ms"] - 1
+        if change > tolerance and current["p95_ms"] - before["p95_ms"] > MIN_DELTA_MS:
+            regressions.append(f"{name}: p95 {before['p95_ms']}ms → {current['p95_ms']}ms (+{change:.0%})")
+    return regressions
+
+
+def report(results: Dict[str, Dict[str, Any]], baseline: Optional[Dict[str, Any]] = None):
+    header = f"{'case':<36}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'vs base':>10}"
+    print(header)
+    print("─" * len(header))
+    for name, r in results.items():
+        before = (baseline or {}).get("cases", {}).get(name)
+        delta = f"{r['p95_ms'] / before['p95_ms'] - 1:+.0%}" if before and before.get("p95_ms") else "—"
+        print(f"{name:<36}{r['throughput_per_s']:>10}{r['p50_ms']:>10}{r['p95_ms']:>10}{r['p99_ms']:>10}{delta:>10}")
@@ -0,0 +1,335 @@
+"""
+HTTP load generator for the FastAPI app, with GCP and Postgres replaced by
+the benchmark fakes. Drives a mixed class-traffic workload against the app
+in-process (ASGI), over localhost (uvicorn in a thread), or against a running
+server, and reports latency histograms per endpoint plus event-loop lag.
+
+    cd backend
+    python -m benchmarks.load --users 50 --duration 30              # closed loop, in-process
+    python -m benchmarks.load --rate 20 --duration 30               # open loop (Poisson arrivals)
+    python -m benchmarks.load --target http --users 100             # through a real socket
+    python -m benchmarks.load --url http://localhost:8080 --rate 5  # an already running server
+    python -m benchmarks.load --mix chat=1 --max-lag-ms 50          # fail on any loop stall
+
+Closed loop: each of --users students sends a request, waits for it, thinks
+(--think seconds on average) and repeats; throughput adapts to latency.
+Open loop: requests arrive at --rate per second whatever the latency, which
+is how real students behave and what exposes queueing.
+"""
+import io
+import sys
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+import threading
+import contextlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Tuple
+
+from benchmarks import fakes, harness
+from benchmarks.run import BenchmarkSuite
+
+# Share of requests per endpoint during a live class: students chat and use the
+# Gemini bridge throughout, the lecturer's client uploads a transcription chunk
+# every ~30 s, and a few students generate Master Docs.
+CLASS_MIX = {"chat": 0.55, "gemini": 0.25, "transcribe": 0.12, "synthesis": 0.08}
+TRANSCRIBE_CHUNK_SECONDS = 30
+SYNTHESIS_WORDS = 4000
+# Upper bounds (ms) of the printed latency histogram.
+HISTOGRAM_BOUNDS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+# A loop wake-up this late means a handler ran blocking code (sync SDK call, CPU work).
+STALL_MS = 100
+
+
+Request = Tuple[str, str, Dict[str, Any]]
+
+
+def build_request(endpoint: str, user: int, i: int) -> Request:
+    """(method, path, httpx kwargs) of one request of the given endpoint."""
+    if endpoint == "chat":
+        return "POST", "/api/agent/chat", {"json": {
+            "message": f"{fakes.STUDENT_MARKER} Question {i}: why does diversification reduce unsystematic risk?",
+            "session_id": f"load-session-{user}",
+            "user_context": {"user_id": f"student-{user}", "current_page": "Finance"},
+        }}
+    if endpoint == "gemini":
+        return "POST", "/api/gemini", {"json": {
+            "model": "gemini-2.0-flash",
+            "contents": f"Summarize slide {i} of today's lecture in three bullet points.",
+        }}
+    if endpoint == "transcribe":
+        audio = bytes(fakes.AUDIO_BYTES_PER_SECOND * TRANSCRIBE_CHUNK_SECONDS)
+        return "POST", "/api/agent/transcribe", {
+            "files": {"audio": ("chunk.wav", audio, "audio/wav")},
+            "data": {"language": "en-IN"},
+        }
+    if endpoint == "synthesis":
+        transcript = " ".join(f"term{j % 997}" for j in range(SYNTHESIS_WORDS))
+        return "POST", "/api/agent/synthesis", {"json": {
+            "subject": "Finance", "transcript": transcript, "notes": "", "chats": "", "user_id": f"student-{user}",
+        }}
+    raise ValueError(f"Unknown endpoint: {endpoint}")
+
+
+class LoopLagMonitor:
+    """
+    Sleeps `interval` in a loop on the monitored event loop and records how
+    late each wake-up is. Blocking sync calls in handlers show up as lag.
+    """
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.lags: List[float] = []
+        self._stopped = False
+
+    async def run(self):
+        while not self._stopped:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.lags.append(max(0.0, time.perf_counter() - start - self.interval))
+
+    def stop(self):
+        self._stopped = True
+
+    def summary(self) -> Dict[str, Any]:
+        if not self.lags:
+            return {"samples": 0}
+        ordered = sorted(self.lags)
+        pct = lambda p: round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 2)
+        return {
+            "samples": len(ordered), "p50_ms": pct(0.5), "p95_ms": pct(0.95), "p99_ms": pct(0.99), "max_ms": pct(1.0),
+            "stalls": sum(1 for lag in ordered if lag * 1000 >= STALL_MS),
+        }
+
+
+class LoadRecorder:
+    def __init__(self):
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.statuses: Dict[str, Dict[str, int]] = defaultdict(lambda: defaultdict(int))
+        self.dropped = 0
+
+    async def send(self, client, endpoint: str, request: Request):
+        method, path, kwargs = request
+        start = time.perf_counter()
+        try:
+            response = await client.request(method, path, **kwargs)
+            status = str(response.status_code)
+        except Exception as e:
+            status = type(e).__name__
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        self.statuses[endpoint][status] += 1
+
+    def summary(self, wall: float, concurrency: int) -> Dict[str, Any]:
+        endpoints = {}
+        for endpoint, latencies in sorted(self.latencies.items()):
+            statuses = self.statuses[endpoint]
+            errors = sum(n for s, n in statuses.items() if not s.startswith("2"))
+            endpoints[endpoint] = {
+                **harness.summarize(latencies, wall, concurrency),
+                "errors": errors,
+                "statuses": dict(statuses),
+            }
+        return endpoints
+
+
+def histogram(latencies: List[float], width: int = 40) -> List[str]:
+    counts = [0] * (len(HISTOGRAM_BOUNDS_MS) + 1)
+    for latency in latencies:
+        ms = latency * 1000
+        counts[next((i for i, b in enumerate(HISTOGRAM_BOUNDS_MS) if ms <= b), len(HISTOGRAM_BOUNDS_MS))] += 1
+    peak = max(counts) or 1
+    labels = [f"≤{b}ms" for b in HISTOGRAM_BOUNDS_MS] + [f">{HISTOGRAM_BOUNDS_MS[-1]}ms"]
+    return [
+        f"  {label:>9} {'█' * round(width * count / peak):<{width}} {count}"
+        for label, count in zip(labels, counts) if count
+    ]
+
+
+def parse_mix(spec: Optional[str]) -> Dict[str, float]:
+    if not spec:
+        return dict(CLASS_MIX)
+    mix = {}
+    for part in spec.split(","):
+        name, _, weight = part.partition("=")
+        if name not in CLASS_MIX:
+            raise ValueError(f"Unknown endpoint in --mix: {name} (choose from {', '.join(CLASS_MIX)})")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class LoadGenerator:
+    def __init__(self, client, mix: Dict[str, float], duration: float, seed: int = 7):
+        self.client = client
+        self.mix = mix
+        self.duration = duration
+        self.rng = random.Random(seed)
+        self.recorder = LoadRecorder()
+        self._count = 0
+
+    def next_request(self, user: int) -> Tuple[str, Request]:
+        endpoint = self.rng.choices(list(self.mix), weights=list(self.mix.values()))[0]
+        self._count += 1
+        return endpoint, build_request(endpoint, user, self._count)
+
+    async def closed_loop(self, users: int, think: float):
+        deadline = time.perf_counter() + self.duration
+
+        async def student(user: int):
+            rng = random.Random(user)
+            await asyncio.sleep(rng.uniform(0, think))  # stagger the first requests
+            while time.perf_counter() < deadline:
+                endpoint, request = self.next_request(user)
+                await self.recorder.send(self.client, endpoint, request)
+                await asyncio.sleep(rng.expovariate(1 / think) if think > 0 else 0)
+
+        await asyncio.gather(*(student(u) for u in range(users)))
+
+    async def open_loop(self, rate: float, max_in_flight: int):
+        deadline = time.perf_counter() + self.duration
+        in_flight = set()
+        user = 0
+        while time.perf_counter() < deadline:
+            await asyncio.sleep(self.rng.expovariate(rate))
+            if len(in_flight) >= max_in_flight:
+                self.recorder.dropped += 1
+                continue
+            user += 1
+            endpoint, request = self.next_request(user)
+            task = asyncio.create_task(self.recorder.send(self.client, endpoint, request))
+            in_flight.add(task)
+            task.add_done_callback(in_flight.discard)
+        if in_flight:
+            await asyncio.gather(*in_flight)
+
+
+@contextlib.contextmanager
+def uvicorn_in_thread(app):
+    """Serves `app` on a free localhost port from its own thread and event loop."""
+    import uvicorn
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_until_complete, args=(server.serve(),), daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    try:
+        yield f"http://127.0.0.1:{port}", loop
+    finally:
+        server.should_exit = True
+        thread.join(timeout=10)
+
+
+async def run(args) -> int:
+    import httpx
+
+    mix = parse_mix(args.mix)
+    monitor = LoopLagMonitor()
+    suite = None
+    quiet = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+
+    with contextlib.ExitStack() as stack:
+        if args.url:
+            client = httpx.AsyncClient(base_url=args.url, timeout=args.timeout)
+            monitor = None  # the server's loop is out of reach
+        else:
+            suite = BenchmarkSuite(fakes.LatencyProfile(scale=args.latency_scale))
+            with quiet:
+                suite.install()
+                suite.fake_chat_stack()
+                import main
+            stack.callback(suite.uninstall)
+            if args.target == "http":
+                url, server_loop = stack.enter_context(uvicorn_in_thread(main.app))
+                client = httpx.AsyncClient(base_url=url, timeout=args.timeout)
+                asyncio.run_coroutine_threadsafe(monitor.run(), server_loop)
+            else:
+                client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://load", timeout=args.timeout)
+                asyncio.create_task(monitor.run())
+
+        generator = LoadGenerator(client, mix, args.duration, args.seed)
+        start = time.perf_counter()
+        with quiet:
+            async with client:
+                if args.rate:
+                    await generator.open_loop(args.rate, args.max_in_flight)
+                else:
+                    await generator.closed_loop(args.users, args.think)
+        wall = time.perf_counter() - start
+        if monitor:
+            monitor.stop()
+
+    concurrency = args.max_in_flight if args.rate else args.users
+    results = {
+        "model": f"open loop, {args.rate}/s" if args.rate else f"closed loop, {args.users} users, {args.think}s think",
+        "target": args.url or args.target,
+        "duration_s": round(wall, 2),
+        "requests": sum(len(v) for v in generator.recorder.latencies.values()),
+        "dropped": generator.recorder.dropped,
+        "endpoints": generator.recorder.summary(wall, concurrency),
+        "event_loop_lag": monitor.summary() if monitor else None,
+    }
+    print_report(results, generator.recorder)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"💾 Report written to {args.json}")
+
+    failed = False
+    total = results["requests"] or 1
+    error_rate = sum(e["errors"] for e in results["endpoints"].values()) / total
+    if error_rate > args.max_error_rate:
+        print(f"❌ Error rate {error_rate:.1%} exceeds {args.max_error_rate:.1%}")
+        failed = True
+    lag = results["event_loop_lag"]
+    if args.max_lag_ms is not None and lag and lag.get("samples") and lag["max_ms"] > args.max_lag_ms:
+        print(f"❌ Event loop lag {lag['max_ms']}ms exceeds {args.max_lag_ms}ms: something is blocking the loop")
+        failed = True
+    return 1 if failed else 0
+
+
+def print_report(results: Dict[str, Any], recorder: LoadRecorder):
+    print(f"{results['model']} → {results['target']}: {results['requests']} requests in {results['duration_s']}s"
+          + (f", {results['dropped']} dropped" if results["dropped"] else ""))
+    header = f"{'endpoint':<12}{'reqs':>7}{'req/s':>9}{'p50 ms':>11}{'p95 ms':>11}{'p99 ms':>11}{'errors':>8}"
+    print(header)
+    print("─" * len(header))
+    for name, r in results["endpoints"].items():
+        print(f"{name:<12}{r['iterations']:>7}{r['throughput_per_s']:>9}{r['p50_ms']:>11}{r['p95_ms']:>11}{r['p99_ms']:>11}{r['errors']:>8}")
+    for name, latencies in sorted(recorder.latencies.items()):
+        print(f"\n{name} latency")
+        print("\n".join(histogram(latencies)))
+    lag = results["event_loop_lag"]
+    if lag and lag.get("samples"):
+        print(f"\nEvent loop lag: p50 {lag['p50_ms']}ms, p95 {lag['p95_ms']}ms, p99 {lag['p99_ms']}ms, max {lag['max_ms']}ms, "
+              f"{lag['stalls']} stalls ≥{STALL_MS}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load generator for the FastAPI app with fake GCP and Postgres")
+    parser.add_argument("--target", choices=("asgi", "http"), default="asgi", help="in-process ASGI, or uvicorn on localhost")
+    parser.add_argument("--url", help="drive an already running server instead (no fakes are installed there by this tool)")
+    parser.add_argument("--duration", type=float, default=20.0, help="seconds of load")
+    parser.add_argument("--users", type=int, default=20, help="closed loop: concurrent students")
+    parser.add_argument("--think", type=float, default=1.0, help="closed loop: mean think time between requests (s)")
+    parser.add_argument("--rate", type=float, help="open loop: mean arrivals per second (enables open loop)")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="open loop: arrivals beyond this many in flight are dropped")
+    parser.add_argument("--mix", help=f"endpoint weights, e.g. chat=3,gemini=1 (default: {CLASS_MIX})")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for the fakes' simulated latencies")
+    parser.add_argument("--timeout", type=float, default=120.0, help="per-request timeout (s)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="also write the report as JSON")
+    parser.add_argument("--max-lag-ms", type=float, help="fail when any event loop wake-up is later than this")
+    parser.add_argument("--max-error-rate", type=float, default=0.01, help="fail when more requests than this fraction error")
+    parser.add_argument("--verbose", action="store_true", help="keep the application's own log output")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
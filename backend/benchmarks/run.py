@@ -0,0 +1,252 @@
+"""
+Offline benchmarks of the backend's hot paths, with GCP and Postgres replaced
+by the deterministic fakes in benchmarks/fakes.py.
+
+    cd backend
+    python -m benchmarks.run                      # run everything, compare with the saved baseline
+    python -m benchmarks.run --cases router,scribe --quick
+    python -m benchmarks.run --latency-scale 0    # in-process overhead only
+    python -m benchmarks.run --save               # record a new baseline
+
+Exits with status 1 when a case's p95 regresses beyond --tolerance.
+"""
+import os
+import io
+import sys
+import argparse
+import asyncio
+import tempfile
+import contextlib
+from unittest.mock import MagicMock, patch
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if BACKEND not in sys.path:
+    sys.path.insert(0, BACKEND)
+
+# Offline configuration, before any agent module is imported
+_scratch = tempfile.mkdtemp(prefix="vidyos-bench-")
+os.environ.setdefault("GOOGLE_API_KEY", "benchmark-offline")
+os.environ.setdefault("GCP_PROJECT", "benchmark-offline")
+os.environ["SEARCH_INDEX_PATH"] = os.path.join(_scratch, "search_index.json")
+os.environ["MEDIA_STORE_PATH"] = os.path.join(_scratch, "media")
+os.environ["TTS_PROVIDER"] = "fake"
+os.environ["IMAGE_PROVIDER"] = "fake"
+
+from benchmarks import fakes, harness  # noqa: E402
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "baseline.json")
+
+
+class BenchmarkSuite:
+    """Installs the fakes once, then runs the selected cases."""
+    def __init__(self, latency: fakes.LatencyProfile, quick: bool = False):
+        self.latency = latency
+        self.quick = quick
+        self.db = fakes.FakeDatabase(latency)
+        self._patches = []
+
+    def iterations(self, n: int) -> int:
+        return max(4, n // 5) if self.quick else n
+
+    def install(self):
+        import core.db
+        from google.cloud import speech_v2
+        import services.gcp
+        from core.ratelimit import rate_limiter
+
+        # Discovery Engine's client authenticates on construction (at agent import); no benchmark calls it
+        from google.cloud import discoveryengine_v1beta
+        self._patch(discoveryengine_v1beta, "SearchServiceClient", MagicMock())
+
+        original = core.db.get_db_connection
+        self._patch(core.db, "get_db_connection", self.db.connect)
+        # Modules that imported the function by name
+        for name, module in list(sys.modules.items()):
+            if name.split(".")[0] in ("agents", "services", "core") and getattr(module, "get_db_connection", None) is original:
+                self._patch(module, "get_db_connection", self.db.connect)
+
+        model_class = fakes.fake_generative_model(self.latency)
+        self._patch(services.gcp, "GenerativeModel", model_class)
+        self._patch(services.gcp.vertex_service, "_model", model_class(services.gcp.vertex_service.model_name))
+        self._patch(speech_v2, "SpeechClient", fakes.fake_speech_client(self.latency))
+
+        # Quotas are not what's being measured: lift them, keep the limiter's own overhead
+        self._patch(rate_limiter, "limits", {
+            model: {"rpm": 1e9, "tpm": 1e12, "concurrency": 256, "max_concurrency": 256}
+            for model in ("gemini-2.5-pro", "gemini-2.0-flash", "text-embedding-004")
+        })
+        rate_limiter.models.clear()
+
+    def fake_chat_stack(self):
+        """
+        Fakes the models behind /api/agent/chat and /api/gemini: the router
+        sends student questions to the Professor, who answers after a
+        retrieval pass against the fake DB and embeddings.
+        """
+        import langchain_google_genai
+        import agents.mastermind as mastermind
+        import services.retrieval
+        from agents.professor import professor_agent
+
+        answer = fakes.FakeChatModel(respond=fakes.answer_response, latency=self.latency)
+        self._patch(mastermind, "chain", mastermind.prompt | fakes.FakeChatModel(respond=fakes.chat_router_response, latency=self.latency))
+        self._patch(professor_agent, "llm", answer)
+        self._patch(services.retrieval, "_query_embeddings", fakes.FakeEmbeddings(self.latency))
+        self._patch(langchain_google_genai, "ChatGoogleGenerativeAI", lambda **kwargs: answer)
+
+    def _patch(self, target, attribute, value):
+        p = patch.object(target, attribute, value)
+        p.start()
+        self._patches.append(p)
+
+    def uninstall(self):
+        for p in reversed(self._patches):
+            p.stop()
+
+    # ─── Cases ───
+
+    async def router(self):
+        import agents.mastermind as mastermind
+        from langchain_core.messages import HumanMessage
+
+        self._patch(mastermind, "chain", mastermind.prompt | fakes.FakeChatModel(respond=fakes.router_response, latency=self.latency))
+
+        async def decide(i):
+            state = {
+                "messages": [HumanMessage(content=f"Explain question {i} about the Capital Asset Pricing Model")],
+                "user_context": {"current_page": "Finance"},
+            }
+            await mastermind.supervisor_node(state)
+
+        return {
+            "router_decision": await harness.measure(decide, self.iterations(100), concurrency=1),
+            "router_decision_c16": await harness.measure(decide, self.iterations(400), concurrency=16),
+        }
+
+    async def scribe(self):
+        from agents.scribe import scribe_agent
+        from core.scope import GraphScope
+
+        self._patch(scribe_agent, "embeddings", fakes.FakeEmbeddings(self.latency))
+        results = {}
+        for concepts in (5, 25):
+            self._patch(scribe_agent, "llm", fakes.FakeChatModel(respond=fakes.extraction_response(concepts), latency=self.latency))
+            scope = GraphScope(subject=f"Benchmarks {concepts}")
+
+            async def process(i, concepts=concepts, scope=scope):
+                text = f"Segment {i} with {concepts} concepts: the lecturer explains risk, return and diversification."
+                await scribe_agent.process_transcript(f"bench-session-{concepts}", text, scope)
+
+            results[f"process_transcript_{concepts}_concepts"] = await harness.measure(process, self.iterations(20))
+        return results
+
+    async def synthesis(self):
+        from agents.synthesis_agent import synthesis_agent
+
+        results = {}
+        for tokens in (2_000, 20_000):
+            transcript = " ".join(f"term{i % 997}" for i in range(tokens))
+
+            async def synthesize(i, transcript=transcript):
+                await synthesis_agent.generate_master_doc(f"Bench Subject {i % 4}", transcript, "notes", "q&a")
+
+            results[f"synthesis_{tokens}_tokens"] = await harness.measure(synthesize, self.iterations(10), concurrency=2)
+        return results
+
+    async def mastery(self):
+        from services.mastery import MasteryStore
+
+        self.db.seed_mastery(users=50, rows_per_user=200)
+        store = MasteryStore()
+
+        async def cold(i):
+            user = f"user-{i % 50}"
+            store.invalidate(user)
+            await store.get(user)
+
+        async def warm(i):
+            await store.get(f"user-{i % 50}")
+
+        cold_stats = await harness.measure(cold, self.iterations(200), concurrency=8)
+        for u in range(50):
+            await store.get(f"user-{u}")
+
+        return {
+            "mastery_lookup_cold": cold_stats,
+            "mastery_lookup_warm": await harness.measure(warm, self.iterations(2000), concurrency=8),
+        }
+
+    async def transcription(self):
+        import httpx
+        import main
+
+        results = {}
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            for seconds in (30, 120):
+                audio = bytes(fakes.AUDIO_BYTES_PER_SECOND * seconds)
+
+                async def transcribe(i, audio=audio):
+                    response = await client.post(
+                        "/api/agent/transcribe",
+                        files={"audio": ("lecture.wav", audio, "audio/wav")},
+                        data={"language": "en-IN"}
+                    )
+                    response.raise_for_status()
+
+                # Concurrency 4: the endpoint's blocking recognize() call shows up as lost throughput
+                results[f"transcribe_{seconds}s_audio"] = await harness.measure(transcribe, self.iterations(12), concurrency=4)
+        return results
+
+
+CASES = ("router", "scribe", "synthesis", "mastery", "transcription")
+
+
+async def run(args) -> int:
+    suite = BenchmarkSuite(fakes.LatencyProfile(scale=args.latency_scale), quick=args.quick)
+    selected = [c.strip() for c in args.cases.split(",")] if args.cases else list(CASES)
+    unknown = set(selected) - set(CASES)
+    if unknown:
+        print(f"Unknown cases: {', '.join(sorted(unknown))} (choose from {', '.join(CASES)})")
+        return 2
+
+    results = {}
+    output = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with output:
+        suite.install()
+        try:
+            for case in selected:
+                results.update(await getattr(suite, case)())
+        finally:
+            suite.uninstall()
+
+    baseline = harness.load_baseline(args.baseline)
+    if baseline and baseline["meta"].get("latency_scale") != args.latency_scale:
+        print(f"⚠️ Baseline was recorded at latency scale {baseline['meta'].get('latency_scale')}, not comparing")
+        baseline = None
+    harness.report(results, baseline)
+
+    if args.save:
+        harness.save_baseline(args.baseline, results, harness.environment(args.latency_scale))
+        print(f"💾 Baseline saved to {args.baseline}")
+        return 0
+    regressions = harness.compare(results, baseline, args.tolerance) if baseline else []
+    for line in regressions:
+        print(f"❌ Regression: {line}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline hot-path benchmarks with fake GCP and Postgres")
+    parser.add_argument("--cases", help=f"comma-separated subset of: {', '.join(CASES)}")
+    parser.add_argument("--quick", action="store_true", help="fewer iterations (smoke run)")
+    parser.add_argument("--latency-scale", type=float, default=1.0, help="multiplier for the fakes' simulated latencies")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="baseline JSON to compare with / save to")
+    parser.add_argument("--save", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=harness.DEFAULT_TOLERANCE, help="allowed p95 growth before failing")
+    parser.add_argument("--verbose", action="store_true", help="keep the application's own log output")
+    sys.exit(asyncio.run(run(parser.parse_args())))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,11 @@
 
 import os
 import asyncio
+import hashlib
 import asyncpg
 from google.cloud.sql.connector import Connector, IPTypes
+from core.metrics import InstrumentedConnection
+from core.tracing import child_span
 
 # Function to get current event loop or create one
 def get_loop():
@@ -11,9 +14,22 @@ def get_loop():
     except RuntimeError:
         return asyncio.new_event_loop()
 
+# One Cloud SQL connector per event loop: it caches the instance metadata and
+# ephemeral certificate, so only the first connection of a process pays for them.
+_connectors = {}
+
+def get_connector() -> Connector:
+    loop = get_loop()
+    connector = _connectors.get(loop)
+    if connector is None:
+        connector = _connectors[loop] = Connector(loop=loop)
+    return connector
+
 async def get_db_connection():
     """
     Establishes a connection to Cloud SQL using the Python Connector.
+    Queries on the returned connection are timed into the DB latency metrics
+    and traced as spans of the current request.
     """
     instance_connection_name = os.environ.get("INSTANCE_CONNECTION_NAME")
     db_user = os.environ.get("DB_USER", "vidyos_admin")
@@ -27,24 +43,33 @@ async def get_db_connection():
         instance = "vidyos-graph-db"
         instance_connection_name = f"{project_id}:{region}:{instance}"
 
-    loop = get_loop()
-    
-    # Initialize connector
-    connector = Connector(loop=loop)
+    connector = get_connector()
 
     async def getdict(conn):
         return dict(conn)
 
-    conn: asyncpg.Connection = await connector.connect_async(
-        instance_connection_name,
-        "asyncpg",
-        user=db_user,
-        password=db_pass,
-        db=db_name,
-        ip_type=IPTypes.PUBLIC  # Use PUBLIC for local dev, PRIVATE for Cloud Run if VPC configured
-    )
+    with child_span("db.connect"):
+        conn: asyncpg.Connection = await connector.connect_async(
+            instance_connection_name,
+            "asyncpg",
+            user=db_user,
+            password=db_pass,
+            db=db_name,
+            ip_type=IPTypes.PUBLIC  # Use PUBLIC for local dev, PRIVATE for Cloud Run if VPC configured
+        )
     
-    return conn
+    return InstrumentedConnection(conn)
+
+async def warm_db():
+    """
+    Opens one connection and runs a trivial query, so the connector's setup
+    (and any DNS / TLS work) happens before the first request needs it.
+    """
+    conn = await get_db_connection()
+    try:
+        await conn.fetchval("SELECT 1")
+    finally:
+        await conn.close()
 
 async def init_db_schema():
     """
@@ -92,15 +117,179 @@ async def init_db_schema():
             );
         """)
         
-        # 4. Create Index for Vector Search (IVFFlat or HNSW)
-        # Note: Requires some data to be effective, but creating shell here
-        # await conn.execute("CREATE INDEX ON knowledge_nodes USING ivfflat (embedding vector_cosine_ops) WITH (lists = 100);")
-        
+        # 5. Full-text search column over label + content (hybrid retrieval, lexical side)
+        await conn.execute("""
+            ALTER TABLE knowledge_nodes ADD COLUMN IF NOT EXISTS search_tsv tsvector
+            GENERATED ALWAYS AS (
+                setweight(to_tsvector('english', coalesce(label, '')), 'A') ||
+                setweight(to_tsvector('english', coalesce(content, '')), 'B')
+            ) STORED;
+        """)
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS knowledge_nodes_search_tsv_idx ON knowledge_nodes USING GIN (search_tsv);"
+        )
+
+        # 6. Create Index for Vector Search (HNSW works on an empty table, unlike IVFFlat)
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS knowledge_nodes_embedding_idx ON knowledge_nodes USING hnsw (embedding vector_cosine_ops);"
+        )
+
+        # 7. Change markers for incremental graph snapshots (watermark queries)
+        await conn.execute("ALTER TABLE knowledge_nodes ADD COLUMN IF NOT EXISTS updated_at TIMESTAMPTZ DEFAULT NOW();")
+        await conn.execute("CREATE INDEX IF NOT EXISTS knowledge_nodes_updated_at_idx ON knowledge_nodes (updated_at);")
+        await conn.execute("CREATE INDEX IF NOT EXISTS knowledge_edges_created_at_idx ON knowledge_edges (created_at);")
+
+        # 8. Changelog for frontend delta sync (/api/graph/changes), filled by triggers
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS graph_changes (
+                version BIGSERIAL PRIMARY KEY,
+                entity TEXT NOT NULL, -- 'node', 'edge'
+                entity_id UUID NOT NULL,
+                op CHAR(1) NOT NULL, -- 'U' (insert/update), 'D' (delete)
+                txid xid8 NOT NULL DEFAULT pg_current_xact_id(),
+                changed_at TIMESTAMPTZ DEFAULT NOW()
+            );
+        """)
+        await conn.execute("CREATE INDEX IF NOT EXISTS graph_changes_txid_idx ON graph_changes (txid);")
+        # Each change belongs to the graph scope of its row, so deltas and tombstones stay within one course
+        await conn.execute("ALTER TABLE graph_changes ADD COLUMN IF NOT EXISTS tenant_id TEXT NOT NULL DEFAULT 'default';")
+        await conn.execute("ALTER TABLE graph_changes ADD COLUMN IF NOT EXISTS subject TEXT NOT NULL DEFAULT 'General';")
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS graph_changes_scope_txid_idx ON graph_changes (tenant_id, subject, txid);"
+        )
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS graph_change_horizon (
+                id INT PRIMARY KEY,
+                horizon xid8 NOT NULL -- changes at or below this txid have been pruned
+            );
+        """)
+        await conn.execute("""
+            CREATE OR REPLACE FUNCTION log_graph_change() RETURNS trigger AS $$
+            BEGIN
+                -- A row moved to another scope is a deletion there
+                IF TG_OP = 'DELETE' OR (TG_OP = 'UPDATE' AND
+                        (OLD.tenant_id, OLD.subject) IS DISTINCT FROM (NEW.tenant_id, NEW.subject)) THEN
+                    INSERT INTO graph_changes (entity, entity_id, op, tenant_id, subject)
+                    VALUES (TG_ARGV[0], OLD.id, 'D', OLD.tenant_id, OLD.subject);
+                    IF TG_OP = 'DELETE' THEN
+                        RETURN OLD;
+                    END IF;
+                END IF;
+                INSERT INTO graph_changes (entity, entity_id, op, tenant_id, subject)
+                VALUES (TG_ARGV[0], NEW.id, 'U', NEW.tenant_id, NEW.subject);
+                RETURN NEW;
+            END;
+            $$ LANGUAGE plpgsql;
+        """)
+        for table, entity in (("knowledge_nodes", "node"), ("knowledge_edges", "edge")):
+            await conn.execute(f"DROP TRIGGER IF EXISTS {table}_changes ON {table};")
+            await conn.execute(
+                f"CREATE TRIGGER {table}_changes AFTER INSERT OR UPDATE OR DELETE ON {table} "
+                f"FOR EACH ROW EXECUTE FUNCTION log_graph_change('{entity}');"
+            )
+
+        # 9. Community detection output (kept off knowledge_nodes so re-clustering doesn't flood the changelog)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS node_communities (
+                node_id UUID PRIMARY KEY REFERENCES knowledge_nodes(id) ON DELETE CASCADE,
+                community_id UUID NOT NULL, -- the community's best-connected member
+                assigned_at TIMESTAMPTZ DEFAULT NOW()
+            );
+        """)
+        await conn.execute("CREATE INDEX IF NOT EXISTS node_communities_community_idx ON node_communities (community_id);")
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS graph_communities (
+                id UUID PRIMARY KEY,
+                label TEXT NOT NULL,
+                size INT NOT NULL,
+                computed_at TIMESTAMPTZ DEFAULT NOW()
+            );
+        """)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS graph_community_edges (
+                source_id UUID NOT NULL,
+                target_id UUID NOT NULL,
+                weight FLOAT NOT NULL,
+                edge_count INT NOT NULL,
+                PRIMARY KEY (source_id, target_id)
+            );
+        """)
+
+        # 10. How often the Scribe has seen each concept (criticality ranking)
+        await conn.execute("ALTER TABLE knowledge_nodes ADD COLUMN IF NOT EXISTS mention_count INT NOT NULL DEFAULT 1;")
+
+        # 11. Near-duplicate merge runs (incremental dedup scans nodes created since the last one)
+        await conn.execute("""
+            CREATE TABLE IF NOT EXISTS dedup_runs (
+                id SERIAL PRIMARY KEY,
+                started_at TIMESTAMPTZ NOT NULL,
+                dry_run BOOLEAN NOT NULL,
+                merged INT NOT NULL
+            );
+        """)
+
+        # 12. Graph scope keys: every row belongs to one tenant and subject (course),
+        #     and remembers the session that produced it. Composite indexes lead
+        #     with the scope, so scoped reads touch one course's rows.
+        for table in ("knowledge_nodes", "knowledge_edges"):
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS tenant_id TEXT NOT NULL DEFAULT 'default';")
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS subject TEXT NOT NULL DEFAULT 'General';")
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS session_id TEXT;")
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_session_idx ON {table} (session_id) WHERE session_id IS NOT NULL;")
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS knowledge_nodes_scope_updated_idx ON knowledge_nodes (tenant_id, subject, updated_at);"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS knowledge_nodes_scope_label_idx ON knowledge_nodes (tenant_id, subject, label);"
+        )
+        await conn.execute(
+            "CREATE INDEX IF NOT EXISTS knowledge_edges_scope_created_idx ON knowledge_edges (tenant_id, subject, created_at);"
+        )
+        # Persisted communities belong to the scope that computed them (subject NULL: tenant-wide run)
+        for table in ("graph_communities", "graph_community_edges"):
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS tenant_id TEXT NOT NULL DEFAULT 'default';")
+            await conn.execute(f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS subject TEXT;")
+            await conn.execute(f"CREATE INDEX IF NOT EXISTS {table}_scope_idx ON {table} (tenant_id, subject);")
+        await conn.execute("CREATE INDEX IF NOT EXISTS knowledge_edges_target_relation_idx ON knowledge_edges (target_id, relation);")
+        await conn.execute("CREATE INDEX IF NOT EXISTS knowledge_edges_source_idx ON knowledge_edges (source_id);")
+        await ensure_subject_vector_indexes(conn)
+
         print("✅ Database Schema Initialized successfully!")
         
     finally:
         await conn.close()
 
+async def ensure_subject_vector_indexes(conn, min_nodes: int = 1000) -> int:
+    """
+    Builds a partial HNSW index per (tenant, subject) with at least `min_nodes`
+    embedded concepts, so a course's vector search walks a graph of its own
+    size. Smaller subjects use the global index plus the scope filter.
+    Safe to re-run (e.g. after a course grows); returns how many were created.
+    """
+    from core.scope import GraphScope
+
+    rows = await conn.fetch(
+        "SELECT tenant_id, subject FROM knowledge_nodes WHERE embedding IS NOT NULL "
+        "GROUP BY tenant_id, subject HAVING count(*) >= $1",
+        min_nodes
+    )
+    created = 0
+    for r in rows:
+        scope = GraphScope(r["tenant_id"], r["subject"])
+        digest = hashlib.sha1(f"{scope.tenant_id}/{scope.subject}".encode("utf-8")).hexdigest()[:12]
+        name = f"knowledge_nodes_embedding_{digest}_idx"
+        if await conn.fetchval("SELECT to_regclass($1) IS NOT NULL", name):
+            continue
+        # CONCURRENTLY: writers to the course aren't blocked while the index builds
+        await conn.execute(
+            f"CREATE INDEX CONCURRENTLY IF NOT EXISTS {name} ON knowledge_nodes "
+            f"USING hnsw (embedding vector_cosine_ops) WHERE {scope.literal_filter()};"
+        )
+        created += 1
+    if created:
+        print(f"🧭 Created {created} per-subject vector indexes")
+    return created
+
 if __name__ == "__main__":
     # Run initialization
     asyncio.run(init_db_schema())
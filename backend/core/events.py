@@ -0,0 +1,90 @@
+import json
+import uuid
+import asyncio
+from typing import Callable, Dict, List, Any
+
+
+class EventBus:
+    """
+    In-process publish/subscribe for change notifications (cache invalidation,
+    graph updates). Optionally bridged to Postgres LISTEN/NOTIFY so that every
+    worker sees events published by any other worker. Without the bridge it is
+    a purely local stand-in.
+    """
+    def __init__(self):
+        self.worker_id = uuid.uuid4().hex
+        self._handlers: Dict[str, List[Callable[[Dict[str, Any]], None]]] = {}
+        self._bridge_conn = None
+        self._bridge_lock = asyncio.Lock()
+
+    @property
+    def bridged(self) -> bool:
+        return self._bridge_conn is not None
+
+    def subscribe(self, channel: str, handler: Callable[[Dict[str, Any]], None]):
+        self._handlers.setdefault(channel, []).append(handler)
+
+    def unsubscribe(self, channel: str, handler: Callable[[Dict[str, Any]], None]):
+        handlers = self._handlers.get(channel, [])
+        if handler in handlers:
+            handlers.remove(handler)
+
+    def publish_local(self, channel: str, payload: Dict[str, Any]):
+        for handler in list(self._handlers.get(channel, [])):
+            try:
+                handler(payload)
+            except Exception as e:
+                print(f"⚠️ Event handler error on '{channel}': {e}")
+
+    async def publish(self, channel: str, payload: Dict[str, Any], local: bool = True):
+        """
+        Delivers to local subscribers immediately, then to other workers via NOTIFY.
+        Pass local=False when the caller has already handled this worker.
+        """
+        if local:
+            self.publish_local(channel, payload)
+        if not self.bridged:
+            return
+        message = json.dumps({**payload, "_origin": self.worker_id}, default=str)
+        try:
+            async with self._bridge_lock:
+                await self._bridge_conn.execute("SELECT pg_notify($1, $2)", channel, message)
+        except Exception as e:
+            print(f"⚠️ NOTIFY on '{channel}' failed: {e}")
+
+    async def start_bridge(self, channels: List[str], conn=None):
+        """
+        LISTENs on the given channels over a dedicated connection.
+        """
+        if self.bridged:
+            return
+        if conn is None:
+            from core.db import get_db_connection
+            conn = await get_db_connection()
+        for channel in channels:
+            await conn.add_listener(channel, self._on_notify)
+        self._bridge_conn = conn
+        print(f"🔔 Event bridge listening on: {', '.join(channels)}")
+
+    async def stop_bridge(self):
+        conn, self._bridge_conn = self._bridge_conn, None
+        if conn is not None:
+            await conn.close()
+
+    def _on_notify(self, conn, pid, channel: str, message: str):
+        try:
+            payload = json.loads(message)
+        except ValueError:
+            return
+        # Our own NOTIFYs were already delivered locally in publish()
+        if payload.pop("_origin", None) == self.worker_id:
+            return
+        self.publish_local(channel, payload)
+
+
+event_bus = EventBus()
+
+# Channels used across the backend
+MASTERY_CHANNEL = "mastery_changed"
+GRAPH_CHANNEL = "graph_changed"
+LIVE_GRAPH_CHANNEL = "live_graph_updates"
@@ -0,0 +1,255 @@
+import time
+import functools
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from core.tracing import child_span
+
+# Upper bounds (seconds) of the duration histogram buckets.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+# Recent observations kept per label set for the quantile estimates.
+RESERVOIR_SIZE = 2048
+
+# USD per million (input, output) tokens, for the estimated cost counter.
+MODEL_PRICES = {
+    "gemini-2.5-pro": (1.25, 10.0),
+    "gemini-2.0-flash": (0.10, 0.40),
+    "text-embedding-004": (0.025, 0.0),
+}
+
+DB_OPERATIONS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH", "CREATE", "ALTER", "LISTEN", "NOTIFY")
+
+Labels = Tuple[str, ...]
+
+
+def _format_labels(names: Tuple[str, ...], values: Labels, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(round(value, 6))
+
+
+class Counter:
+    """Monotonic counter per label set."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values: Dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1.0):
+        self.values[labels] = self.values.get(labels, 0.0) + amount
+
+    def get(self, *labels: str) -> float:
+        return self.values.get(labels, 0.0)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for labels, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, labels)} {_number(value)}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram per label set, plus a reservoir of recent
+    observations from which p50/p95/p99 are reported (as a separate summary
+    family, since Prometheus doesn't derive quantiles from buckets by itself).
+    """
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series: Dict[Labels, Dict[str, Any]] = {}
+
+    def observe(self, value: float, *labels: str):
+        series = self.series.get(labels)
+        if series is None:
+            series = self.series[labels] = {
+                "buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0,
+                "recent": deque(maxlen=RESERVOIR_SIZE)
+            }
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series["buckets"][index] += 1
+        series["sum"] += value
+        series["count"] += 1
+        series["recent"].append(value)
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, *labels)
+
+    def count(self, *labels: str) -> int:
+        series = self.series.get(labels)
+        return series["count"] if series else 0
+
+    def quantiles(self, *labels: str) -> Dict[float, float]:
+        series = self.series.get(labels)
+        recent: Deque[float] = series["recent"] if series else deque()
+        ordered = sorted(recent)
+        if not ordered:
+            return {q: 0.0 for q in QUANTILES}
+        return {q: ordered[min(len(ordered) - 1, int(q * len(ordered)))] for q in QUANTILES}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self.series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets, series["buckets"]):
+                cumulative += count
+                le = 'le="%s"' % _number(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {cumulative}")
+            inf = _format_labels(self.labels, labels, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{inf} {series['count']}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_number(series['sum'])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {series['count']}")
+
+        summary = f"{self.name}_quantiles"
+        lines += [f"# HELP {summary} {self.help} (p50/p95/p99 of the last {RESERVOIR_SIZE} observations)",
+                  f"# TYPE {summary} summary"]
+        for labels in sorted(self.series):
+            for q, value in self.quantiles(*labels).items():
+                quantile = 'quantile="%s"' % q
+                lines.append(f"{summary}{_format_labels(self.labels, labels, quantile)} {_number(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    """In-process metric families, rendered in the Prometheus text exposition format."""
+    def __init__(self):
+        self.families: Dict[str, Any] = {}
+
+    def counter(self, name: str, help: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.families.setdefault(name, Counter(name, help, labels))
+
+    def histogram(self, name: str, help: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self.families.setdefault(name, Histogram(name, help, labels, buckets))
+
+    def render(self) -> str:
+        lines = []
+        for family in self.families.values():
+            lines += family.render()
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+NODE_SECONDS = metrics.histogram("vidyos_graph_node_seconds", "LangGraph node (agent) duration in seconds", ("node",))
+NODE_ERRORS = metrics.counter("vidyos_graph_node_errors_total", "LangGraph node runs that raised", ("node",))
+GRAPH_SECONDS = metrics.histogram("vidyos_graph_run_seconds", "End-to-end master_graph run duration in seconds")
+ROUTER_HOPS = metrics.histogram(
+    "vidyos_router_hops", "Specialist agents the router dispatched to per graph run", buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 25)
+)
+ROUTES = metrics.counter("vidyos_router_routes_total", "Router decisions by target", ("target",))
+LLM_SECONDS = metrics.histogram("vidyos_llm_call_seconds", "Model call duration in seconds (excluding queueing)", ("model", "kind"))
+LLM_TOKENS = metrics.counter(
+    "vidyos_llm_tokens_total", "Model tokens by direction (reported usage; estimated for embeddings)", ("model", "direction")
+)
+LLM_COST = metrics.counter("vidyos_llm_cost_usd_total", "Estimated model spend in USD", ("model",))
+DB_SECONDS = metrics.histogram("vidyos_db_query_seconds", "Database query duration in seconds", ("operation",))
+
+
+# ─── Hooks ───
+
+_router_hops: ContextVar[Optional[List[int]]] = ContextVar("router_hops", default=None)
+
+
+@contextmanager
+def graph_run() -> Iterator[None]:
+    """Times (and traces) one master_graph invocation and counts the router's hops inside it."""
+    hops = [0]
+    token = _router_hops.set(hops)
+    try:
+        with GRAPH_SECONDS.time(), child_span("graph.ainvoke") as s:
+            yield
+    finally:
+        _router_hops.reset(token)
+        ROUTER_HOPS.observe(hops[0])
+        if s is not None:
+            s.set(router_hops=hops[0])
+
+
+def instrument_node(name: str, fn: Callable[[Any], Awaitable[Dict[str, Any]]], router: bool = False):
+    """
+    Wraps a LangGraph node so each run is timed (and traced) per node; a
+    `router` node's decisions (its `next`) are counted as routes and hops.
+    """
+    @functools.wraps(fn)
+    async def node(state):
+        start = time.perf_counter()
+        with child_span(f"node.{name}") as s:
+            try:
+                result = await fn(state)
+            except Exception:
+                NODE_ERRORS.inc(name)
+                raise
+            finally:
+                NODE_SECONDS.observe(time.perf_counter() - start, name)
+            if router and isinstance(result, dict) and result.get("next") and s is not None:
+                s.set(next=result["next"])
+        if router and isinstance(result, dict) and result.get("next"):
+            ROUTES.inc(result["next"])
+            hops = _router_hops.get()
+            if hops is not None and result["next"] != "DONE":
+                hops[0] += 1
+        return result
+    return node
+
+
+def record_model_call(model: str, seconds: float, input_tokens: int, output_tokens: int):
+    """Latency, tokens and estimated cost of one successful model call."""
+    kind = "embedding" if "embedding" in model else "generate"
+    LLM_SECONDS.observe(seconds, model, kind)
+    LLM_TOKENS.inc(model, "input", amount=input_tokens)
+    LLM_TOKENS.inc(model, "output", amount=output_tokens)
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    LLM_COST.inc(model, amount=(input_tokens * input_price + output_tokens * output_price) / 1_000_000)
+
+
+def query_operation(sql: str) -> str:
+    words = sql.lstrip().split(None, 1)
+    verb = words[0].upper() if words else ""
+    return verb if verb in DB_OPERATIONS else "OTHER"
+
+
+class InstrumentedConnection:
+    """
+    asyncpg connection proxy that times (and traces) every query by its SQL verb.
+    Everything besides the query methods is passed through untouched.
+    """
+    QUERY_METHODS = ("execute", "executemany", "fetch", "fetchrow", "fetchval")
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        attr = getattr(self._conn, name)
+        if name not in self.QUERY_METHODS:
+            return attr
+
+        async def timed(sql, *args, **kwargs):
+            operation = query_operation(sql)
+            with DB_SECONDS.time(operation), child_span(f"db.{name}", operation=operation, statement=sql.strip()[:200]):
+                return await attr(sql, *args, **kwargs)
+        return timed
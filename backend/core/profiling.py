@@ -0,0 +1,177 @@
+import os
+import sys
+import hmac
+import time
+import cProfile
+import tempfile
+import threading
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+PROFILE_HEADER = "x-profile"
+ADMIN_TOKEN_HEADER = "x-admin-token"
+# Seconds between stack samples.
+SAMPLE_INTERVAL = 0.005
+FORMATS = {"collapsed": ("collapsed", "text/plain; charset=utf-8"), "pstats": ("pstats", "application/octet-stream")}
+
+
+def profiling_token() -> Optional[str]:
+    """PROFILE_ADMIN_TOKEN enables profiling; without it the hook is not installed at all."""
+    return os.environ.get("PROFILE_ADMIN_TOKEN") or None
+
+
+def _frame_name(code) -> str:
+    filename = code.co_filename
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    if filename.startswith(root):
+        filename = os.path.relpath(filename, root)
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples one thread's Python stack every `interval` seconds from a helper
+    thread and counts identical stacks, in the collapsed format flamegraph
+    tools (flamegraph.pl, speedscope, inferno) read: "outer;inner;leaf count".
+    Profiling the event loop thread captures everything running on it, so
+    concurrent requests show up too; that is acceptable in staging.
+    """
+    def __init__(self, thread_id: Optional[int] = None, interval: float = SAMPLE_INTERVAL):
+        self.thread_id = thread_id or threading.get_ident()
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> str:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self.collapsed()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if stack:
+                self.samples[";".join(reversed(stack))] += 1
+
+    def collapsed(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in self.samples.most_common())
+
+
+class ProfileStore:
+    """Profiles on local disk, one file per trace id and format."""
+    def __init__(self, root: Optional[str] = None):
+        self.root = root or os.environ.get("PROFILE_DIR") or os.path.join(tempfile.gettempdir(), "vidyos-profiles")
+
+    def path(self, trace_id: str, fmt: str) -> str:
+        if not trace_id.isalnum():
+            raise ValueError("Invalid trace id")
+        return os.path.join(self.root, f"{trace_id}.{FORMATS[fmt][0]}")
+
+    def save_collapsed(self, trace_id: str, collapsed: str) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(trace_id, "collapsed")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(collapsed)
+        return path
+
+    def save_pstats(self, trace_id: str, profile: cProfile.Profile) -> str:
+        os.makedirs(self.root, exist_ok=True)
+        path = self.path(trace_id, "pstats")
+        profile.dump_stats(path)
+        return path
+
+    def find(self, trace_id: str) -> Optional[Tuple[str, str]]:
+        """(path, media type) of the stored profile for a trace, if any."""
+        for fmt, (_, media_type) in FORMATS.items():
+            path = self.path(trace_id, fmt)
+            if os.path.exists(path):
+                return path, media_type
+        return None
+
+
+profile_store = ProfileStore()
+
+# One profile at a time: the sampler sees the whole loop thread and cProfile can't nest.
+_profiling = threading.Lock()
+
+
+def is_authorized(token: Optional[str]) -> bool:
+    expected = profiling_token()
+    return bool(expected and token and hmac.compare_digest(token.encode(), expected.encode()))
+
+
+def requested_format(headers: Dict[str, str], query_string: bytes) -> Optional[str]:
+    """Profile format asked for via `X-Profile: collapsed|pstats|1` or `?profile=...`, else None."""
+    value = headers.get(PROFILE_HEADER)
+    if value is None and b"profile" in query_string:
+        value = (parse_qs(query_string.decode("latin-1")).get("profile") or [None])[0]
+    if not value or value in ("0", "false"):
+        return None
+    return value if value in FORMATS else "collapsed"
+
+
+class ProfilingMiddleware:
+    """
+    ASGI middleware profiling requests that ask for it (`X-Profile` header or
+    `profile` query flag) and carry the admin token (`X-Admin-Token`). The
+    profile is stored under the request's trace id, echoed as X-Profile-Id;
+    fetch it from /api/profiles/{trace_id}. Installed only when
+    PROFILE_ADMIN_TOKEN is set, so unprofiled deployments pay nothing.
+    Must run inside TracingMiddleware (add it first).
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        fmt = requested_format(headers, scope.get("query_string", b""))
+        if fmt is None or not is_authorized(headers.get(ADMIN_TOKEN_HEADER)):
+            return await self.app(scope, receive, send)
+        if not _profiling.acquire(blocking=False):
+            return await self.app(scope, receive, self._with_header(send, b"x-profile", b"busy"))
+
+        from core.tracing import current_trace_id, new_trace_id
+        trace_id = current_trace_id() or new_trace_id()
+        start = time.perf_counter()
+        try:
+            if fmt == "pstats":
+                profile = cProfile.Profile()
+                profile.enable()
+                try:
+                    await self.app(scope, receive, self._with_header(send, b"x-profile-id", trace_id.encode()))
+                finally:
+                    profile.disable()
+                    profile_store.save_pstats(trace_id, profile)
+            else:
+                sampler = StackSampler()
+                sampler.start()
+                try:
+                    await self.app(scope, receive, self._with_header(send, b"x-profile-id", trace_id.encode()))
+                finally:
+                    profile_store.save_collapsed(trace_id, sampler.stop())
+        finally:
+            _profiling.release()
+            print(f"🔬 Profiled {scope['path']} ({fmt}) in {(time.perf_counter() - start) * 1000:.0f}ms → {trace_id}")
+
+    @staticmethod
+    def _with_header(send, name: bytes, value: bytes):
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message = {**message, "headers": [*message.get("headers", []), (name, value)]}
+            await send(message)
+        return send_with_header
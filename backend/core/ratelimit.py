@@ -0,0 +1,357 @@
+import os
+import json
+import time
+import random
+import asyncio
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, List, Optional
+from core.metrics import record_model_call
+from core.tracing import Span, child_span
+from core.scheduler import PRIORITY_CLASSES, RESERVED_SHARE, FairQueue, WorkClass, current_work, reserved_limit
+
+# Per-model quotas (requests and tokens per minute) and the concurrency
+# window's starting point. Override with RATE_LIMITS='{"gemini-2.5-pro": {"rpm": 30}}'.
+DEFAULT_LIMITS = {"rpm": 300, "tpm": 1_000_000, "concurrency": 8, "max_concurrency": 64}
+MODEL_LIMITS = {
+    "gemini-2.5-pro": {"rpm": 60, "tpm": 500_000, "concurrency": 4},
+    "gemini-2.0-flash": {"rpm": 300, "tpm": 1_000_000, "concurrency": 8},
+    "text-embedding-004": {"rpm": 1500, "tpm": 2_000_000, "concurrency": 16},
+}
+
+# Other names clients send for the models above: they share the canonical
+# model's limiter and metrics series. Any other model name is rejected.
+# Retired 1.5 models map to the current model of the same tier; /api/gemini
+# reports the model that actually served the call next to the requested one.
+MODEL_ALIASES = {
+    "gemini-2.0-flash-exp": "gemini-2.0-flash",
+    "gemini-2.0-flash-001": "gemini-2.0-flash",
+    "gemini-1.5-flash": "gemini-2.0-flash",
+    "gemini-1.5-pro": "gemini-2.5-pro",
+}
+
+# Output reserved per call when the caller doesn't cap max_output_tokens.
+DEFAULT_OUTPUT_TOKENS = 512
+
+# Calls slower than this shrink the concurrency window like a 429 would (gently).
+TARGET_LATENCY = 20.0
+MAX_RETRIES = 4
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 20.0
+
+
+class RateLimitedError(Exception):
+    """The model kept answering 429 after all retries; surfaces as HTTP 429."""
+    def __init__(self, model: str, retry_after: float):
+        super().__init__(f"Model {model} is rate limited, retry in {retry_after:.0f}s")
+        self.model = model
+        self.retry_after = retry_after
+
+
+class UnknownModelError(ValueError):
+    """A model outside MODEL_LIMITS / MODEL_ALIASES; surfaces as HTTP 400."""
+    def __init__(self, model: str):
+        super().__init__(f"Unknown model: {model}")
+        self.model = model
+
+
+def is_rate_limit_error(e: Exception) -> bool:
+    """429 / RESOURCE_EXHAUSTED from any of the Google clients (gRPC, REST, genai)."""
+    if isinstance(e, RateLimitedError):
+        return True
+    if getattr(e, "code", None) == 429 or getattr(e, "status_code", None) == 429:
+        return True
+    if type(e).__name__ in ("ResourceExhausted", "TooManyRequests"):
+        return True
+    text = str(e)
+    return text.startswith("429") or "RESOURCE_EXHAUSTED" in text or "Too Many Requests" in text
+
+
+def estimate_call_tokens(*texts: str, output: int = DEFAULT_OUTPUT_TOKENS) -> int:
+    """Token budget to reserve for a call: prompt (~4 chars per token) plus expected output."""
+    return sum(len(t) for t in texts) // 4 + output
+
+
+def token_usage(result: Any) -> Optional[Dict[str, int]]:
+    """
+    Reported (input, output) token counts of a model response: LangChain's
+    `usage_metadata` dict or the Vertex SDK's usage object. None if absent.
+    """
+    usage = getattr(result, "usage_metadata", None)
+    if isinstance(usage, dict):
+        counts = usage.get("input_tokens"), usage.get("output_tokens")
+    else:
+        counts = getattr(usage, "prompt_token_count", None), getattr(usage, "candidates_token_count", None)
+    if all(isinstance(c, int) for c in counts) and any(counts):
+        return {"input": counts[0], "output": counts[1]}
+    return None
+
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    """p50 / p95 / max of durations in seconds, reported in milliseconds."""
+    ordered = sorted(samples)
+
+    def pct(p):
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000, 1) if ordered else 0.0
+
+    return {"p50": pct(0.5), "p95": pct(0.95), "max": pct(1.0)}
+
+
+def backoff_delay(attempt: int, base: float = BACKOFF_BASE, cap: float = BACKOFF_CAP) -> float:
+    """Exponential backoff with full jitter: uniform in [0, min(cap, base * 2^attempt)]."""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class TokenBucket:
+    """
+    Refills `per_minute` units per minute up to a burst of one minute's worth.
+    May go negative when actual usage is reconciled above the estimate; the
+    debt is then paid off by later callers waiting longer.
+    """
+    def __init__(self, per_minute: float):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, reserve: float = 0.0) -> float:
+        """
+        Seconds until `amount` can be taken while leaving a `reserve` share of
+        the capacity untouched (0 if now). Requests above capacity wait for a full bucket.
+        """
+        self._refill(time.monotonic())
+        needed = min(amount + reserve * self.capacity, self.capacity)
+        return 0.0 if self.tokens >= needed else (needed - self.tokens) / self.rate
+
+    def take(self, amount: float):
+        self._refill(time.monotonic())
+        self.tokens -= amount
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency window: each fast success widens it by about one slot
+    per window's worth of calls, a 429 halves it, a slow call trims it.
+    Waiters are woken in priority / fair-share order (see FairQueue) as
+    slots free up; lower classes may not fill the slots reserved above them.
+    """
+    def __init__(self, initial: float, minimum: float = 1.0, maximum: float = 64.0, decrease: float = 0.5):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.decrease = decrease
+        self.in_flight = 0
+        self.waiters = FairQueue()
+
+    def admits(self, priority: str) -> bool:
+        return self.in_flight < reserved_limit(self.limit, priority)
+
+    async def acquire(self, work: Optional[WorkClass] = None, cost: float = 1.0):
+        work = work or WorkClass()
+        if not self.waiters.ahead_of(work.priority) and self.admits(work.priority):
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.push(work, cost, waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release()  # the slot was handed over just as we were cancelled
+            else:
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        while True:
+            waiter = self.waiters.pop(self.admits)
+            if waiter is None:
+                return
+            self.in_flight += 1
+            waiter.set_result(None)
+
+    def on_success(self, latency: float, target: float = TARGET_LATENCY):
+        if latency > target:
+            self.limit = max(self.minimum, self.limit * 0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._wake()
+
+    def on_throttle(self):
+        self.limit = max(self.minimum, self.limit * self.decrease)
+
+
+class ModelLimiter:
+    """Request bucket, token bucket, concurrency window and wait stats for one model."""
+    def __init__(self, model: str, rpm: float, tpm: float, concurrency: float, max_concurrency: float = 64):
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.window = AdaptiveConcurrency(concurrency, maximum=max_concurrency)
+        self.queue_waits: Dict[str, Deque[float]] = {c: deque(maxlen=2048) for c in PRIORITY_CLASSES}
+        self.latencies: Dict[str, Deque[float]] = {c: deque(maxlen=2048) for c in PRIORITY_CLASSES}
+        self.counts = {"calls": 0, "throttled": 0, "retries": 0, "errors": 0}
+        self.waiting = 0
+
+    async def acquire(self, tokens: int, work: Optional[WorkClass] = None) -> float:
+        """
+        Waits for a concurrency slot (in priority order), then for request and
+        token quota; lower classes leave their reserved share of the quota
+        for the classes above. Returns the time spent waiting.
+        """
+        work = work or WorkClass()
+        reserve = RESERVED_SHARE[work.priority]
+        start = time.monotonic()
+        self.waiting += 1
+        try:
+            await self.window.acquire(work, tokens)
+            try:
+                while True:
+                    delay = max(self.requests.wait_time(1, reserve), self.tokens.wait_time(tokens, reserve))
+                    if delay <= 0:
+                        break
+                    await asyncio.sleep(delay)
+            except BaseException:
+                self.window.release()
+                raise
+            self.requests.take(1)
+            self.tokens.take(tokens)
+        finally:
+            self.waiting -= 1
+        waited = time.monotonic() - start
+        self.queue_waits[work.priority].append(waited)
+        return waited
+
+    def stats(self) -> Dict[str, Any]:
+        waits = [w for samples in self.queue_waits.values() for w in samples]
+        return {
+            **self.counts,
+            "concurrency_limit": round(self.window.limit, 2),
+            "in_flight": self.window.in_flight,
+            "waiting": self.waiting,
+            "queue_wait_ms": percentiles(waits),
+        }
+
+
+class RateLimiter:
+    """
+    Process-wide gate in front of every Vertex / Gemini call. `call` waits
+    for the model's request and token budgets and a slot in its adaptive
+    concurrency window, runs the call, and retries 429s with jittered
+    exponential backoff before giving up with RateLimitedError.
+    """
+    def __init__(self, limits: Optional[Dict[str, Dict[str, float]]] = None):
+        self.limits = {**MODEL_LIMITS, **(limits or {})}
+        self.models: Dict[str, ModelLimiter] = {}
+
+    def canonical(self, model: str) -> str:
+        """The configured model `model` names (itself or via MODEL_ALIASES); UnknownModelError otherwise."""
+        model = MODEL_ALIASES.get(model, model)
+        if model not in self.limits:
+            raise UnknownModelError(model)
+        return model
+
+    def for_model(self, model: str) -> ModelLimiter:
+        # One limiter (and metrics series) per configured model: arbitrary names can't mint new ones
+        model = self.canonical(model)
+        limiter = self.models.get(model)
+        if limiter is None:
+            config = {**DEFAULT_LIMITS, **self.limits.get(model, {})}
+            limiter = self.models[model] = ModelLimiter(
+                model, config["rpm"], config["tpm"], config["concurrency"], config["max_concurrency"]
+            )
+        return limiter
+
+    async def call(
+        self,
+        model: str,
+        fn: Callable[[], Awaitable[Any]],
+        tokens: int = 1,
+        max_retries: int = MAX_RETRIES
+    ) -> Any:
+        """
+        Runs `fn()` (a fresh awaitable per attempt) under the model's limits.
+        `tokens` is the estimated prompt + output size; it is corrected from
+        the response's usage metadata when the client reports it. The call is
+        queued by the caller's work class (see core.scheduler.work_class).
+        """
+        model = self.canonical(model)
+        work = current_work()
+        with child_span(f"llm.{model}", priority=work.priority, estimated_tokens=tokens) as s:
+            return await self._call(self.for_model(model), fn, tokens, max_retries, work, s)
+
+    async def _call(
+        self,
+        limiter: ModelLimiter,
+        fn: Callable[[], Awaitable[Any]],
+        tokens: int,
+        max_retries: int,
+        work: WorkClass,
+        trace: Optional[Span]
+    ) -> Any:
+        model = limiter.model
+        started = time.monotonic()
+        for attempt in range(max_retries + 1):
+            waited = await limiter.acquire(tokens, work)
+            if trace is not None:
+                trace.set(attempts=attempt + 1, queue_wait_ms=round(waited * 1000, 1))
+            start = time.monotonic()
+            try:
+                result = await fn()
+            except Exception as e:
+                if not is_rate_limit_error(e):
+                    limiter.counts["errors"] += 1
+                    raise
+                limiter.counts["throttled"] += 1
+                limiter.window.on_throttle()
+                delay = backoff_delay(attempt)
+                if attempt == max_retries:
+                    raise RateLimitedError(model, max(delay, BACKOFF_BASE)) from e
+                limiter.counts["retries"] += 1
+                print(f"⏳ {model} rate limited (attempt {attempt + 1}), backing off {delay:.1f}s")
+                await asyncio.sleep(delay)
+                continue
+            finally:
+                limiter.window.release()
+
+            elapsed = time.monotonic() - start
+            limiter.counts["calls"] += 1
+            limiter.window.on_success(elapsed)
+            limiter.latencies[work.priority].append(time.monotonic() - started)
+            usage = token_usage(result)
+            if usage and trace is not None:
+                trace.set(input_tokens=usage["input"], output_tokens=usage["output"])
+            if usage:
+                limiter.tokens.take(usage["input"] + usage["output"] - tokens)
+                record_model_call(model, elapsed, usage["input"], usage["output"])
+            else:
+                # Embedding clients report no usage: count the estimate as input
+                record_model_call(model, elapsed, tokens, 0)
+            return result
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        return {model: limiter.stats() for model, limiter in self.models.items()}
+
+    def class_stats(self) -> Dict[str, Dict[str, Any]]:
+        """End-to-end latency (queueing, retries and the call) and queue wait per priority class, across models."""
+        stats = {}
+        for priority in PRIORITY_CLASSES:
+            latencies = [x for m in self.models.values() for x in m.latencies[priority]]
+            waits = [x for m in self.models.values() for x in m.queue_waits[priority]]
+            stats[priority] = {
+                "calls": len(latencies),
+                "waiting": sum(m.window.waiters.waiting(priority) for m in self.models.values()),
+                "latency_ms": percentiles(latencies),
+                "queue_wait_ms": percentiles(waits),
+            }
+        return stats
+
+
+rate_limiter = RateLimiter(json.loads(os.environ.get("RATE_LIMITS", "{}")))
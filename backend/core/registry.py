@@ -0,0 +1,94 @@
+"""
+Process-wide dependencies (SDK clients, model handles, the agent graph)
+built on first use instead of at import. Construction is timed, so startup
+can report what each cold dependency costs, and the critical ones can be
+built ahead of the first request by the lifespan warm-up.
+"""
+import time
+import asyncio
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+
+class LazyRegistry:
+    """
+    Named factories, each called at most once (thread-safe: warm-up builds
+    in worker threads while requests may ask for the same dependency).
+    A failed build is not cached; the next `get` retries it.
+    """
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._critical: Dict[str, bool] = {}
+        self._instances: Dict[str, Any] = {}
+        self._build_ms: Dict[str, float] = {}
+        self._errors: Dict[str, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+
+    def register(self, name: str, factory: Callable[[], Any], critical: bool = False):
+        """Registers (or replaces) `name`; `critical` ones are built by the warm-up first."""
+        self._factories[name] = factory
+        self._critical[name] = critical
+        self._locks.setdefault(name, threading.Lock())
+        self._instances.pop(name, None)
+
+    def get(self, name: str) -> Any:
+        if name in self._instances:
+            return self._instances[name]
+        if name not in self._factories:
+            raise KeyError(f"Unknown dependency: {name}")
+        with self._locks[name]:
+            if name not in self._instances:
+                start = time.perf_counter()
+                try:
+                    instance = self._factories[name]()
+                except Exception as e:
+                    self._errors[name] = f"{type(e).__name__}: {e}"
+                    raise
+                self._build_ms[name] = round((time.perf_counter() - start) * 1000, 1)
+                self._errors.pop(name, None)
+                self._instances[name] = instance
+                print(f"🧩 Built {name} in {self._build_ms[name]} ms")
+        return self._instances[name]
+
+    def is_built(self, name: str) -> bool:
+        return name in self._instances
+
+    def reset(self, name: Optional[str] = None):
+        """Forgets built instances (all, or one) so the next `get` rebuilds them."""
+        for key in [name] if name else list(self._instances):
+            self._instances.pop(key, None)
+            self._build_ms.pop(key, None)
+            self._errors.pop(key, None)
+
+    def names(self, critical: Optional[bool] = None) -> list:
+        return [n for n in self._factories if critical is None or self._critical[n] == critical]
+
+    async def warm(self, names: Iterable[str]) -> Dict[str, Optional[str]]:
+        """
+        Builds `names` concurrently in worker threads (factories import and
+        construct blocking SDK clients). Returns each name's error, or None.
+        """
+        async def build(name):
+            try:
+                await asyncio.to_thread(self.get, name)
+                return None
+            except Exception as e:
+                return f"{type(e).__name__}: {e}"
+
+        names = list(names)
+        errors = await asyncio.gather(*(build(n) for n in names))
+        return dict(zip(names, errors))
+
+    def status(self) -> Dict[str, Dict[str, Any]]:
+        return {
+            name: {
+                "built": name in self._instances,
+                "critical": self._critical[name],
+                "build_ms": self._build_ms.get(name),
+                "error": self._errors.get(name),
+            }
+            for name in self._factories
+        }
+
+
+registry = LazyRegistry()
@@ -0,0 +1,122 @@
+import heapq
+import itertools
+import asyncio
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+# Priority classes, highest first. A waiting call of a higher class is always
+# dispatched before any call of a lower one.
+INTERACTIVE = "interactive"   # chat turns, retrieval, the Gemini proxy
+LIVE = "live"                 # Scribe extraction while a lecture is running
+BATCH = "batch"               # synthesis and other background generation
+PRIORITY_CLASSES = (INTERACTIVE, LIVE, BATCH)
+
+# Share of a model's concurrency window and quota a class must leave unused,
+# so an interactive burst finds headroom instead of queueing behind batch work.
+RESERVED_SHARE = {INTERACTIVE: 0.0, LIVE: 0.1, BATCH: 0.25}
+
+ANONYMOUS = "anonymous"
+
+
+class WorkClass(NamedTuple):
+    """Who a model call is for: its priority class and the user it is charged to."""
+    priority: str = INTERACTIVE
+    user: str = ANONYMOUS
+    weight: float = 1.0
+
+
+_current_work: ContextVar[WorkClass] = ContextVar("work_class", default=WorkClass())
+
+
+def current_work() -> WorkClass:
+    """The work class of the running request (interactive/anonymous unless labelled)."""
+    return _current_work.get()
+
+
+@contextmanager
+def work_class(priority: str, user: Optional[str] = None, weight: float = 1.0) -> Iterator[WorkClass]:
+    """
+    Labels every model call made inside the block (including tasks it spawns)
+    with a priority class and user. Without `user`, the enclosing label's user is kept.
+    """
+    if priority not in PRIORITY_CLASSES:
+        raise ValueError(f"Unknown priority class: {priority}")
+    work = WorkClass(priority, user or current_work().user, weight)
+    token = _current_work.set(work)
+    try:
+        yield work
+    finally:
+        _current_work.reset(token)
+
+
+def reserved_limit(limit: float, priority: str) -> int:
+    """Slots of a `limit`-wide window that `priority` may occupy (always at least one)."""
+    return max(1, int(limit * (1 - RESERVED_SHARE[priority])))
+
+
+class FairQueue:
+    """
+    Waiting calls, strictly ordered by priority class and, within a class,
+    by weighted fair queuing across users: each call gets a virtual finish
+    time of max(class clock, the user's last finish) + cost / weight, and the
+    smallest finish goes first. A user with a backlog of large requests is
+    interleaved with everyone else's calls instead of being served in one run.
+    """
+    def __init__(self):
+        self._heaps: Dict[str, List[Tuple[float, int, asyncio.Future]]] = {c: [] for c in PRIORITY_CLASSES}
+        self._clock = {c: 0.0 for c in PRIORITY_CLASSES}
+        self._finish: Dict[str, Dict[str, float]] = {c: {} for c in PRIORITY_CLASSES}
+        self._seq = itertools.count()
+
+    def __len__(self):
+        return sum(len(h) for h in self._heaps.values())
+
+    def waiting(self, priority: str) -> int:
+        return len(self._heaps[priority])
+
+    def ahead_of(self, priority: str) -> int:
+        """Calls queued that a new call of `priority` would have to wait behind."""
+        rank = PRIORITY_CLASSES.index(priority)
+        return sum(len(self._heaps[c]) for c in PRIORITY_CLASSES[:rank + 1])
+
+    def push(self, work: WorkClass, cost: float, waiter: asyncio.Future):
+        finishes = self._finish[work.priority]
+        start = max(self._clock[work.priority], finishes.get(work.user, 0.0))
+        finish = start + max(cost, 1.0) / max(work.weight, 1e-6)
+        finishes[work.user] = finish
+        heapq.heappush(self._heaps[work.priority], (finish, next(self._seq), waiter))
+        if len(finishes) > 1024:
+            self._prune(work.priority)
+
+    def pop(self, admits: Callable[[str], bool]) -> Optional[asyncio.Future]:
+        """
+        Next waiter, if its class `admits` another call. Lower classes never
+        overtake a blocked higher class: that is what defers batch work.
+        """
+        for priority in PRIORITY_CLASSES:
+            heap = self._heaps[priority]
+            while heap and heap[0][2].done():
+                heapq.heappop(heap)  # cancelled while waiting
+            if not heap:
+                continue
+            if not admits(priority):
+                return None
+            finish, _, waiter = heapq.heappop(heap)
+            self._clock[priority] = finish
+            return waiter
+        return None
+
+    def remove(self, waiter: asyncio.Future):
+        for heap in self._heaps.values():
+            for i, entry in enumerate(heap):
+                if entry[2] is waiter:
+                    heap[i] = heap[-1]
+                    heap.pop()
+                    heapq.heapify(heap)
+                    return
+
+    def _prune(self, priority: str):
+        """Forgets users with nothing queued ahead of the clock; they restart from it anyway."""
+        clock = self._clock[priority]
+        self._finish[priority] = {u: f for u, f in self._finish[priority].items() if f > clock}
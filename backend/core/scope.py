@@ -0,0 +1,107 @@
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+from core.events import event_bus
+
+DEFAULT_TENANT = "default"
+# Subject assigned to concepts written without one.
+DEFAULT_SUBJECT = "General"
+
+
+class GraphScope(NamedTuple):
+    """
+    The slice of the knowledge graph a request works on: one tenant and,
+    usually, one subject (course). subject=None spans the tenant's subjects.
+    """
+    tenant_id: str = DEFAULT_TENANT
+    subject: Optional[str] = None
+
+    @classmethod
+    def from_context(cls, user_context: Optional[Dict[str, Any]], default_subject: Optional[str] = None) -> "GraphScope":
+        """Reads `tenant_id` and `subject` (falling back to `current_page`) from a request's user_context."""
+        user_context = user_context or {}
+        subject = user_context.get("subject") or user_context.get("current_page") or default_subject
+        return cls(user_context.get("tenant_id") or DEFAULT_TENANT, subject)
+
+    def writable(self) -> "GraphScope":
+        """This scope with a concrete subject, as every written row needs one."""
+        return self if self.subject else self._replace(subject=DEFAULT_SUBJECT)
+
+    def covers(self, tenant_id: Optional[str], subject: Optional[str]) -> bool:
+        """Whether a change in (tenant_id, subject) can affect this scope. None matches anything."""
+        if tenant_id is not None and tenant_id != self.tenant_id:
+            return False
+        return self.subject is None or subject is None or subject == self.subject
+
+    def filter(self, start: int, alias: str = "") -> Tuple[str, List[str]]:
+        """
+        SQL predicate and its parameters, numbered from `$start`.
+        Subject-scoped queries compare `subject` to a parameter so the planner
+        can use the (tenant_id, subject, ...) indexes and per-subject partial indexes.
+        """
+        prefix = f"{alias}." if alias else ""
+        if self.subject is None:
+            return f"{prefix}tenant_id = ${start}", [self.tenant_id]
+        return f"{prefix}tenant_id = ${start} AND {prefix}subject = ${start + 1}", [self.tenant_id, self.subject]
+
+    def literal_filter(self) -> str:
+        """
+        The same predicate with inlined literals. A per-subject partial index is
+        only used when the query repeats its predicate verbatim, which a
+        parameter can't do under a generic plan.
+        """
+        predicate = f"tenant_id = {sql_literal(self.tenant_id)}"
+        if self.subject is not None:
+            predicate += f" AND subject = {sql_literal(self.subject)}"
+        return predicate
+
+
+def sql_literal(value: str) -> str:
+    """Quotes a string as a SQL literal (standard_conforming_strings)."""
+    return "'" + value.replace("'", "''") + "'"
+
+
+class ScopedRegistry:
+    """
+    Lazily creates one object per GraphScope and keeps the `maxsize` most
+    recently used. With a `channel`, a single event-bus subscription forwards
+    each event to the `_on_graph_changed` of the scopes it can affect (events
+    carry optional `tenant_id` / `subject` keys; events without them reach all).
+    `on_evict` is called with each object dropped to stay within `maxsize`.
+    """
+    def __init__(
+        self,
+        factory: Callable[[GraphScope], Any],
+        maxsize: int = 64,
+        channel: Optional[str] = None,
+        on_evict: Optional[Callable[[Any], None]] = None
+    ):
+        self.factory = factory
+        self.maxsize = maxsize
+        self.on_evict = on_evict
+        self._items: "OrderedDict[GraphScope, Any]" = OrderedDict()
+        if channel:
+            event_bus.subscribe(channel, self._dispatch)
+
+    def __len__(self):
+        return len(self._items)
+
+    def for_scope(self, scope: Optional[GraphScope] = None) -> Any:
+        scope = scope or GraphScope()
+        item = self._items.get(scope)
+        if item is None:
+            item = self._items[scope] = self.factory(scope)
+            while len(self._items) > self.maxsize:
+                _, evicted = self._items.popitem(last=False)
+                if self.on_evict:
+                    self.on_evict(evicted)
+        else:
+            self._items.move_to_end(scope)
+        return item
+
+    def items(self):
+        return list(self._items.items())
+
+    def _dispatch(self, payload: Dict[str, Any]):
+        for scope, item in self.items():
+            if payload.get("full") or scope.covers(payload.get("tenant_id"), payload.get("subject")):
+                item._on_graph_changed(payload)
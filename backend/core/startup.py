@@ -0,0 +1,170 @@
+"""
+Cold-start accounting and warm-up. Records how long the app took to import,
+builds the chat critical path (router graph, DB connector) in the background
+during the lifespan, and times the first request to each route, so the cost
+of a cold instance is visible at startup and on /api/ready.
+"""
+import os
+import time
+import asyncio
+from typing import Any, Dict, Optional
+
+from core.registry import registry
+
+# Bounds the DB warm-up when the database is unreachable (e.g. local dev)
+WARMUP_DB_TIMEOUT = float(os.environ.get("WARMUP_DB_TIMEOUT", "20"))
+# A failed DB warm-up is retried in the background, backing off up to this many seconds
+WARMUP_DB_MAX_BACKOFF = float(os.environ.get("WARMUP_DB_MAX_BACKOFF", "60"))
+# First-request timings kept (one per route)
+MAX_FIRST_REQUESTS = 64
+
+
+def warmup_enabled() -> bool:
+    return os.environ.get("WARMUP", "1") != "0"
+
+
+class StartupState:
+    def __init__(self):
+        self.import_ms: Optional[float] = None
+        self.warmup_started: Optional[float] = None
+        self.warmup_ms: Optional[float] = None
+        self.db: Dict[str, Any] = {"warm": False, "ms": None, "error": None, "attempts": 0}
+        self._db_retry: Optional[asyncio.Task] = None
+        self.errors: Dict[str, str] = {}
+        self.first_requests: Dict[str, Dict[str, Any]] = {}
+
+    @property
+    def ready(self) -> bool:
+        """Warm-up finished (or is disabled), the DB answered and every critical dependency is built."""
+        if not warmup_enabled():
+            return True
+        critical_built = all(registry.is_built(name) for name in registry.names(critical=True))
+        return self.warmup_ms is not None and self.db["warm"] and critical_built
+
+    def mark_imported(self, started: float):
+        self.import_ms = round((time.perf_counter() - started) * 1000, 1)
+        print(f"📦 App imported in {self.import_ms} ms")
+
+    async def _warm_db(self) -> bool:
+        from core import db
+
+        start = time.perf_counter()
+        self.db["attempts"] += 1
+        try:
+            await asyncio.wait_for(db.warm_db(), WARMUP_DB_TIMEOUT)
+            self.db.update(warm=True, error=None)
+            self.errors.pop("db", None)
+        except Exception as e:
+            self.db["error"] = f"{type(e).__name__}: {e}"
+            self.errors["db"] = self.db["error"]
+        self.db["ms"] = round((time.perf_counter() - start) * 1000, 1)
+        return self.db["warm"]
+
+    async def _retry_db(self, delay: float = 1.0):
+        """Retries the DB warm-up with exponential backoff until it succeeds, so a transient failure heals."""
+        while True:
+            await asyncio.sleep(delay)
+            if await self._warm_db():
+                break
+            delay = min(delay * 2, WARMUP_DB_MAX_BACKOFF)
+        print(f"✅ DB warm after {self.db['attempts']} attempts ({self.db['ms']} ms)")
+
+    def start_db_retry(self) -> Optional[asyncio.Task]:
+        """Starts the background DB warm-up retry (once); returns its task, None when the DB is warm."""
+        if self.db["warm"]:
+            return None
+        if self._db_retry is None or self._db_retry.done():
+            self._db_retry = asyncio.create_task(self._retry_db())
+        return self._db_retry
+
+    def stop_db_retry(self):
+        """Cancels a pending DB warm-up retry (at shutdown)."""
+        if self._db_retry is not None and not self._db_retry.done():
+            self._db_retry.cancel()
+
+    async def warm_up(self):
+        """
+        Builds the critical dependencies and the DB connector concurrently,
+        reports the cold-start costs, then builds the remaining dependencies.
+        Runs as a background task: the app serves requests meanwhile (they
+        build what they need themselves, at most once).
+        """
+        self.warmup_started = time.perf_counter()
+        built, _ = await asyncio.gather(registry.warm(registry.names(critical=True)), self._warm_db())
+        self.errors.update({name: error for name, error in built.items() if error})
+        self.warmup_ms = round((time.perf_counter() - self.warmup_started) * 1000, 1)
+
+        costs = ", ".join(
+            f"{name} {info['build_ms']} ms" for name, info in registry.status().items() if info["build_ms"] is not None
+        )
+        db = f"db {self.db['ms']} ms" if self.db["warm"] else f"db failed ({self.db['error']})"
+        print(f"🔥 Warm-up {'done' if self.ready else 'incomplete'} in {self.warmup_ms} ms "
+              f"(import {self.import_ms} ms; {costs}{', ' if costs else ''}{db})")
+        for name, error in self.errors.items():
+            print(f"⚠️ Warm-up of {name} failed, requests will retry it: {error}")
+        self.start_db_retry()
+
+        # Building a dependency can import modules that register more: repeat until none are new
+        attempted = set()
+        while True:
+            rest = [n for n in registry.names(critical=False) if not registry.is_built(n) and n not in attempted]
+            if not rest:
+                break
+            attempted.update(rest)
+            for name, error in (await registry.warm(rest)).items():
+                if error:
+                    print(f"⚠️ Background build of {name} failed: {error}")
+
+    def record_first_request(self, route: str, seconds: float, status: Optional[int]):
+        if route in self.first_requests or len(self.first_requests) >= MAX_FIRST_REQUESTS:
+            return
+        self.first_requests[route] = {
+            "ms": round(seconds * 1000, 1),
+            "status": status,
+            "warm": self.ready,
+        }
+        print(f"⏱️ First {route}: {self.first_requests[route]['ms']} ms ({'warm' if self.ready else 'cold'})")
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ready": self.ready,
+            "import_ms": self.import_ms,
+            "warmup_ms": self.warmup_ms,
+            "warming": self.warmup_started is not None and (self.warmup_ms is None or not self.db["warm"]),
+            "db": self.db,
+            "dependencies": registry.status(),
+            "first_requests": self.first_requests,
+        }
+
+
+startup_state = StartupState()
+
+
+class FirstRequestMiddleware:
+    """ASGI middleware timing the first HTTP request to each route."""
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or len(startup_state.first_requests) >= MAX_FIRST_REQUESTS:
+            return await self.app(scope, receive, send)
+
+        start = time.perf_counter()
+        status = {}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router stores the matched route in the scope; unmatched paths aren't routes
+            route = scope.get("route")
+            if route is not None:
+                startup_state.record_first_request(
+                    f"{scope['method']} {getattr(route, 'path', scope['path'])}",
+                    time.perf_counter() - start,
+                    status.get("code")
+                )
@@ -0,0 +1,395 @@
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+TRACE_HEADER = "x-trace-id"
+# Traces kept in memory for /api/traces/{trace_id}.
+RECENT_TRACES = 512
+# Spans kept per trace; a runaway loop can't grow one trace without bound.
+MAX_SPANS_PER_TRACE = 2000
+# TRACE_FILE is rotated past this size; the previous file is kept as TRACE_FILE.1.
+TRACE_FILE_MAX_BYTES = int(float(os.environ.get("TRACE_FILE_MAX_MB", "64")) * 1024 * 1024)
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex
+
+
+def new_span_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+class Span:
+    """One timed operation of a trace. Times are wall-clock (start) plus a monotonic duration."""
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "attributes", "start", "_t0", "duration_ms", "status", "error")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None, attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = new_span_id()
+        self.parent_id = parent_id
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start = time.time()
+        self._t0 = time.perf_counter()
+        self.duration_ms: Optional[float] = None
+        self.status = "ok"
+        self.error: Optional[str] = None
+
+    def set(self, **attributes: Any):
+        self.attributes.update(attributes)
+
+    def end(self):
+        self.duration_ms = round((time.perf_counter() - self._t0) * 1000, 3)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start": self.start,
+            "duration_ms": self.duration_ms,
+            "status": self.status,
+            "error": self.error,
+            "attributes": self.attributes,
+        }
+
+
+class JsonlSpanExporter:
+    """
+    Appends each finished trace to a JSONL file, one span per line. Spans are
+    written by a background thread (export only queues them), the file is
+    rotated at `max_bytes`, and line offsets are indexed by trace id so
+    `find` reads one trace's lines instead of the whole file.
+    """
+    def __init__(self, path: str, max_bytes: int = TRACE_FILE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._pending: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()  # guards _pending
+        self._io_lock = threading.Lock()  # guards the files and the index; taken before _lock
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # trace id -> (file generation, byte offset) of each of its lines
+        self._offsets: Dict[str, List[Tuple[int, int]]] = {}
+        self._generation = 0
+        self._indexed = False
+
+    def export(self, spans: List[Dict[str, Any]]):
+        with self._lock:
+            self._pending.extend(spans)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="trace-writer", daemon=True)
+                self._thread.start()
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.wait()
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        """Writes the queued spans now."""
+        with self._io_lock:
+            self._ensure_indexed()
+            with self._lock:
+                spans, self._pending = self._pending, []
+            if spans:
+                self._write(spans)
+
+    def _file(self, generation: int) -> str:
+        return self.path if generation == self._generation else f"{self.path}.1"
+
+    def _ensure_indexed(self):
+        """Indexes the lines earlier processes left in the files (once)."""
+        if self._indexed:
+            return
+        self._indexed = True
+        for generation, path in ((self._generation - 1, f"{self.path}.1"), (self._generation, self.path)):
+            try:
+                with open(path, "rb") as f:
+                    offset = 0
+                    for line in f:
+                        try:
+                            self._offsets.setdefault(json.loads(line)["trace_id"], []).append((generation, offset))
+                        except (ValueError, KeyError):
+                            pass
+                        offset += len(line)
+            except OSError:
+                continue
+
+    def _write(self, spans: List[Dict[str, Any]]):
+        try:
+            with open(self.path, "ab") as f:
+                offset = f.seek(0, os.SEEK_END)
+                for s in spans:
+                    line = (json.dumps(s, default=str) + "\n").encode("utf-8")
+                    f.write(line)
+                    self._offsets.setdefault(s["trace_id"], []).append((self._generation, offset))
+                    offset += len(line)
+        except OSError as e:
+            print(f"⚠️ Could not write trace spans: {e}")
+            return
+        if offset >= self.max_bytes:
+            self._rotate()
+
+    def _rotate(self):
+        try:
+            os.replace(self.path, f"{self.path}.1")
+        except OSError as e:
+            print(f"⚠️ Could not rotate trace file: {e}")
+            return
+        self._generation += 1
+        # Lines of the file just overwritten are gone
+        offsets = {}
+        for trace_id, locations in self._offsets.items():
+            kept = [loc for loc in locations if loc[0] == self._generation - 1]
+            if kept:
+                offsets[trace_id] = kept
+        self._offsets = offsets
+
+    def find(self, trace_id: str) -> List[Dict[str, Any]]:
+        self.flush()
+        spans = []
+        with self._io_lock:
+            by_file: Dict[str, List[int]] = {}
+            for generation, offset in self._offsets.get(trace_id, ()):
+                by_file.setdefault(self._file(generation), []).append(offset)
+            for path, offsets in by_file.items():
+                try:
+                    with open(path, "rb") as f:
+                        for offset in offsets:
+                            f.seek(offset)
+                            spans.append(json.loads(f.readline()))
+                except (OSError, ValueError) as e:
+                    print(f"⚠️ Could not read trace spans from {path}: {e}")
+        return spans
+
+
+class OtlpHttpExporter:
+    """
+    Posts finished traces as OTLP/JSON (`/v1/traces`) to a collector such as
+    an OpenTelemetry Collector or Jaeger. Sending happens in the background.
+    """
+    def __init__(self, endpoint: str, service_name: str = "vidyos-backend"):
+        self.endpoint = endpoint.rstrip("/") + "/v1/traces"
+        self.service_name = service_name
+
+    def payload(self, spans: List[Dict[str, Any]]) -> Dict[str, Any]:
+        def value(v):
+            if isinstance(v, bool):
+                return {"boolValue": v}
+            if isinstance(v, int):
+                return {"intValue": str(v)}
+            if isinstance(v, float):
+                return {"doubleValue": v}
+            return {"stringValue": str(v)}
+
+        return {"resourceSpans": [{
+            "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": self.service_name}}]},
+            "scopeSpans": [{
+                "scope": {"name": "vidyos.tracing"},
+                "spans": [{
+                    "traceId": s["trace_id"],
+                    "spanId": s["span_id"],
+                    "parentSpanId": s["parent_id"] or "",
+                    "name": s["name"],
+                    "kind": 1,
+                    "startTimeUnixNano": str(int(s["start"] * 1e9)),
+                    "endTimeUnixNano": str(int((s["start"] + (s["duration_ms"] or 0) / 1000) * 1e9)),
+                    "attributes": [{"key": k, "value": value(v)} for k, v in s["attributes"].items()],
+                    "status": {"code": 2, "message": s["error"]} if s["status"] == "error" else {"code": 1},
+                } for s in spans]
+            }]
+        }]}
+
+    def export(self, spans: List[Dict[str, Any]]):
+        try:
+            asyncio.get_running_loop().create_task(self._send(spans))
+        except RuntimeError:
+            pass  # no loop (CLI jobs): drop rather than block
+
+    async def _send(self, spans: List[Dict[str, Any]]):
+        import httpx
+        try:
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                await client.post(self.endpoint, json=self.payload(spans))
+        except Exception as e:
+            print(f"⚠️ OTLP export failed: {e}")
+
+
+class Tracer:
+    """
+    Collects spans per trace in memory. When a trace's root span ends, the
+    whole trace is handed to the exporters and kept for lookup by id. Spans
+    that end later (background work the request started) are exported as
+    they finish and appended to the stored trace.
+    """
+    def __init__(self, exporters: Optional[List[Any]] = None, recent: int = RECENT_TRACES):
+        self.exporters = exporters or []
+        self.recent = recent
+        self._open: Dict[str, List[Span]] = {}
+        self._done: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    def record(self, span: Span):
+        if span.parent_id is not None and span.trace_id in self._done and span.trace_id not in self._open:
+            self._store(span.trace_id, [span.to_dict()])
+            return
+        spans = self._open.setdefault(span.trace_id, [])
+        if len(spans) < MAX_SPANS_PER_TRACE:
+            spans.append(span)
+
+    def finish(self, trace_id: str):
+        spans = [s.to_dict() for s in self._open.pop(trace_id, [])]
+        if spans:
+            self._store(trace_id, spans)
+
+    def _store(self, trace_id: str, spans: List[Dict[str, Any]]):
+        stored = self._done.setdefault(trace_id, [])
+        if len(stored) < MAX_SPANS_PER_TRACE:
+            stored.extend(spans)
+            stored.sort(key=lambda s: s["start"])
+        self._done.move_to_end(trace_id)
+        while len(self._done) > self.recent:
+            self._done.popitem(last=False)
+        for exporter in self.exporters:
+            exporter.export(spans)
+
+    def get(self, trace_id: str) -> List[Dict[str, Any]]:
+        """Spans of a finished trace: from memory, else from a file exporter."""
+        if trace_id in self._done:
+            return self._done[trace_id]
+        for exporter in self.exporters:
+            if hasattr(exporter, "find"):
+                spans = exporter.find(trace_id)
+                if spans:
+                    return sorted(spans, key=lambda s: s["start"])
+        return []
+
+
+def default_exporters() -> List[Any]:
+    """TRACE_FILE enables the JSONL exporter, OTEL_EXPORTER_OTLP_ENDPOINT the OTLP one."""
+    exporters = []
+    if os.environ.get("TRACE_FILE"):
+        exporters.append(JsonlSpanExporter(os.environ["TRACE_FILE"]))
+    if os.environ.get("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        exporters.append(OtlpHttpExporter(os.environ["OTEL_EXPORTER_OTLP_ENDPOINT"]))
+    return exporters
+
+
+tracer = Tracer(default_exporters())
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def current_trace_id() -> Optional[str]:
+    span = _current_span.get()
+    return span.trace_id if span else None
+
+
+@contextmanager
+def span(name: str, trace_id: Optional[str] = None, **attributes: Any) -> Iterator[Span]:
+    """
+    Times the block as a child of the current span (or as the root of a new
+    trace, optionally with a given `trace_id`). Tasks created inside inherit it.
+    Outside of any trace, a nested `span` call starts its own trace.
+    """
+    parent = _current_span.get()
+    if parent is not None and trace_id is None:
+        current = Span(name, parent.trace_id, parent.span_id, attributes)
+    else:
+        current = Span(name, trace_id or new_trace_id(), None, attributes)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except BaseException as e:
+        current.status = "error"
+        current.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+        tracer.record(current)
+        if current.parent_id is None:
+            tracer.finish(current.trace_id)
+
+
+@contextmanager
+def child_span(name: str, **attributes: Any) -> Iterator[Optional[Span]]:
+    """Like `span`, but a no-op outside a trace (for hot paths such as DB queries)."""
+    if _current_span.get() is None:
+        yield None
+        return
+    with span(name, **attributes) as s:
+        yield s
+
+
+def waterfall(spans: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Spans in start order with their offset from the trace start and nesting depth."""
+    if not spans:
+        return []
+    origin = min(s["start"] for s in spans)
+    parents = {s["span_id"]: s["parent_id"] for s in spans}
+
+    def depth(span_id):
+        d, parent = 0, parents.get(span_id)
+        while parent in parents and d < 64:
+            d, parent = d + 1, parents[parent]
+        return d
+
+    return [
+        {**s, "offset_ms": round((s["start"] - origin) * 1000, 3), "depth": depth(s["span_id"])}
+        for s in sorted(spans, key=lambda s: s["start"])
+    ]
+
+
+def incoming_trace_id(headers: Dict[str, str]) -> Optional[str]:
+    """Trace id from X-Trace-Id or a W3C traceparent header, if well-formed."""
+    trace_id = headers.get(TRACE_HEADER)
+    if not trace_id and headers.get("traceparent"):
+        parts = headers["traceparent"].split("-")
+        trace_id = parts[1] if len(parts) == 4 else None
+    if trace_id and len(trace_id) == 32 and all(c in "0123456789abcdef" for c in trace_id.lower()):
+        return trace_id.lower()
+    return None
+
+
+class TracingMiddleware:
+    """
+    ASGI middleware: one trace per HTTP request or WebSocket connection,
+    continuing an incoming X-Trace-Id / traceparent, and echoing the trace id
+    in the X-Trace-Id response (or WebSocket accept) header.
+    """
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            return await self.app(scope, receive, send)
+
+        headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        method = scope.get("method", "WS")
+        with span(f"{method} {scope['path']}", trace_id=incoming_trace_id(headers), path=scope["path"]) as root:
+            trace_header = (TRACE_HEADER.encode(), root.trace_id.encode())
+
+            async def send_with_trace(message):
+                if message["type"] == "http.response.start":
+                    message = {**message, "headers": [*message.get("headers", []), trace_header]}
+                    root.set(status_code=message["status"])
+                elif message["type"] == "websocket.accept":
+                    message = {**message, "headers": [*message.get("headers", []), trace_header]}
+                await send(message)
+
+            await self.app(scope, receive, send_with_trace)
@@ -1,4 +1,7 @@
-from fastapi import FastAPI, HTTPException, Header, WebSocket, WebSocketDisconnect, UploadFile, File, Form
+import time
+_import_started = time.perf_counter()  # reported at startup as the app's import time
+
+from fastapi import FastAPI, HTTPException, Header, Request, WebSocket, WebSocketDisconnect, UploadFile, File, Form
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import Optional, List
@@ -8,32 +11,54 @@ import asyncio
 from dotenv import load_dotenv
 import tempfile
 import base64
+from core.tracing import TracingMiddleware
+from core.profiling import ProfilingMiddleware, profiling_token
+from core.registry import registry
+from core.startup import startup_state, warmup_enabled, FirstRequestMiddleware
+from contextlib import asynccontextmanager
 
 load_dotenv()
 
 # ─── LAZY LOADING ───
 # Do NOT import agents at module level — their dependencies (Vertex AI, LangChain)
 # require GCP authentication which may not be available at container cold-start.
-# Instead, we import them on first use inside each endpoint.
+# They are registered here and built on first use (or by the lifespan warm-up).
+
+def _build_master_graph():
+    from agents.mastermind import master_graph
+    return master_graph
 
-_master_graph = None
-_synthesis_agent = None
+def _build_synthesis_agent():
+    from agents.synthesis_agent import synthesis_agent
+    return synthesis_agent
+
+# The router graph is on every chat request's path: warm it first
+registry.register("master_graph", _build_master_graph, critical=True)
+registry.register("synthesis_agent", _build_synthesis_agent)
 
 def get_master_graph():
-    global _master_graph
-    if _master_graph is None:
-        from agents.mastermind import master_graph
-        _master_graph = master_graph
-    return _master_graph
+    return registry.get("master_graph")
 
 def get_synthesis_agent():
-    global _synthesis_agent
-    if _synthesis_agent is None:
-        from agents.synthesis_agent import synthesis_agent
-        _synthesis_agent = synthesis_agent
-    return _synthesis_agent
+    return registry.get("synthesis_agent")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    await start_event_bridge()
+    await start_graph_refresher()
+    await start_community_job()
+    # Warm-up runs in the background: the instance accepts traffic at once
+    # and /api/ready reports when the critical path is built.
+    warmup = asyncio.create_task(startup_state.warm_up()) if warmup_enabled() else None
+    yield
+    if warmup and not warmup.done():
+        warmup.cancel()
+    startup_state.stop_db_retry()
+    # Course material indexes are written in batches: write what's pending
+    from services.search_index import flush_indexes
+    await flush_indexes()
 
-app = FastAPI(title="Vidyos Agentic Backend", version="0.1.0")
+app = FastAPI(title="Vidyos Agentic Backend", version="0.1.0", lifespan=lifespan)
 
 # CORS for dev and production
 app.add_middleware(
@@ -42,8 +67,20 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Trace-Id"],
 )
 
+# Opt-in request profiling (X-Profile + X-Admin-Token); not installed without a token.
+# Added before tracing so it runs inside the request's trace.
+if profiling_token():
+    app.add_middleware(ProfilingMiddleware)
+
+# One trace per request / WebSocket; the id comes back as X-Trace-Id
+app.add_middleware(TracingMiddleware)
+
+# Cold-start visibility: the first request to each route is timed and logged
+app.add_middleware(FirstRequestMiddleware)
+
 class GeminiRequest(BaseModel):
     model: str
     contents: str
@@ -54,16 +91,99 @@ class SynthesisRequest(BaseModel):
     transcript: str
     notes: Optional[str] = ""
     chats: Optional[str] = ""
+    user_id: Optional[str] = None
+    session_id: Optional[str] = None
+    tenant_id: Optional[str] = None
 
 class ChatRequest(BaseModel):
     message: str
     session_id: str
     user_context: Optional[dict] = {}
 
+class MasteryUpdateRequest(BaseModel):
+    user_id: str
+    node_id: str
+    mastery_level: str
+    score: float = 0.0
+
+class RetrievalRequest(BaseModel):
+    query: str
+    k: int = 8
+    lexical_weight: float = 1.0
+    vector_weight: float = 1.0
+    subject: Optional[str] = None
+    tenant_id: Optional[str] = None
+
+def api_error(e: Exception, prefix: str = "") -> HTTPException:
+    """
+    Maps a handler failure to an HTTP error: model rate limiting (after the
+    limiter's retries) is a 429 with Retry-After, anything else a 500.
+    """
+    from core.ratelimit import is_rate_limit_error
+    if is_rate_limit_error(e):
+        retry_after = max(1, round(getattr(e, "retry_after", 5)))
+        return HTTPException(status_code=429, detail=f"{prefix}{e}", headers={"Retry-After": str(retry_after)})
+    return HTTPException(status_code=500, detail=f"{prefix}{e}")
+
+def graph_scope(subject: Optional[str] = None, tenant_id: Optional[str] = None):
+    """Graph scope of a request: one course (subject) of one tenant; no subject spans the tenant."""
+    from core.scope import GraphScope, DEFAULT_TENANT
+    return GraphScope(tenant_id or DEFAULT_TENANT, subject)
+
+async def start_event_bridge():
+    """
+    Bridges in-process change events (cache invalidation) across workers via
+    Postgres LISTEN/NOTIFY. Opt-in: single-worker deployments don't need it.
+    """
+    if os.environ.get("PG_NOTIFY_BRIDGE") != "1":
+        return
+    try:
+        from core.events import event_bus, MASTERY_CHANNEL, GRAPH_CHANNEL, LIVE_GRAPH_CHANNEL
+        import services.pubsub  # registers the live-update relay before events arrive
+        await event_bus.start_bridge([MASTERY_CHANNEL, GRAPH_CHANNEL, LIVE_GRAPH_CHANNEL])
+    except Exception as e:
+        print(f"⚠️ Event bridge unavailable, using local events only: {e}")
+
+async def start_graph_refresher():
+    """
+    Optional timed refresh of the in-process graph snapshot. Without it the
+    snapshot still refreshes incrementally on read and on graph_changed events.
+    """
+    interval = os.environ.get("GRAPH_REFRESH_INTERVAL")
+    if not interval:
+        return
+    from services.graph_snapshot import graph_store
+    graph_store.refresh_interval = float(interval)
+    asyncio.create_task(graph_store.run_periodic())
+
+async def start_community_job():
+    """
+    Optional periodic community detection (persisted for other consumers).
+    Without it, /api/graph/overview clusters on demand.
+    """
+    interval = os.environ.get("COMMUNITY_REFRESH_INTERVAL")
+    if not interval:
+        return
+    from services.communities import community_stores
+    store = community_stores.for_scope(graph_scope())
+    store.min_interval = float(interval)
+    asyncio.create_task(store.run_periodic())
+
 @app.get("/")
 async def health_check():
     return {"status": "active", "service": "Vidyos Fusion Engine", "version": "0.1.0"}
 
+@app.get("/api/ready")
+async def readiness():
+    """
+    Readiness probe: 200 once the warm-up has built the critical path
+    (router graph, DB connector), 503 while warming or after a failed
+    warm-up. The body has per-dependency build times and first-request latencies.
+    """
+    from fastapi.responses import JSONResponse
+    status = startup_state.status()
+    return JSONResponse(status, status_code=200 if status["ready"] else 503)
+
 @app.post("/api/agent/chat")
 async def run_chat(request: ChatRequest):
     """
@@ -71,6 +191,8 @@ async def run_chat(request: ChatRequest):
     """
     try:
         from langchain_core.messages import HumanMessage
+        from core.scheduler import work_class, INTERACTIVE
+        from core.metrics import graph_run
         graph = get_master_graph()
         
         # Initial state for the graph
@@ -80,8 +202,10 @@ async def run_chat(request: ChatRequest):
             "next": ""
         }
         
-        # Run the graph
-        final_state = await graph.ainvoke(initial_state)
+        # Run the graph (its model calls are queued as interactive work for this user)
+        user_id = (request.user_context or {}).get("user_id") or request.session_id
+        with work_class(INTERACTIVE, user=user_id), graph_run():
+            final_state = await graph.ainvoke(initial_state)
         
         # Extract the last message from the graph
         response_messages = final_state.get("messages", [])
@@ -112,25 +236,245 @@ async def run_chat(request: ChatRequest):
             }
     except Exception as e:
         print(f"Graph Error: {e}")
-        raise HTTPException(status_code=500, detail=str(e))
+        raise api_error(e)
 
 @app.post("/api/agent/synthesis")
-async def run_synthesis(request: SynthesisRequest):
+async def run_synthesis(request: SynthesisRequest, http_request: Request):
     """
     Triggers the Synthesis Agent to generate a Master Doc.
+    Runs as batch work: it yields the model quota to chat and live lectures.
     """
     try:
+        from core.scheduler import work_class, BATCH
         agent = get_synthesis_agent()
-        doc = await agent.generate_master_doc(
-            request.subject, 
-            request.transcript, 
-            request.notes, 
-            request.chats
-        )
+        # Fair share needs a real identity: anonymous callers are told apart by session, else by address
+        client = http_request.client.host if http_request.client else None
+        user_id = request.user_id or request.session_id or client
+        with work_class(BATCH, user=user_id):
+            doc = await agent.generate_master_doc(
+                request.subject, 
+                request.transcript, 
+                request.notes, 
+                request.chats,
+                tenant_id=request.tenant_id
+            )
         return {"master_doc": doc}
     except Exception as e:
+        raise api_error(e)
+
+@app.post("/api/mastery")
+async def update_mastery(request: MasteryUpdateRequest):
+    """
+    Records a user's mastery of a concept; invalidates cached mastery on all workers.
+    """
+    try:
+        from services.mastery import mastery_store
+        await mastery_store.update(request.user_id, request.node_id, request.mastery_level, request.score)
+        return {"status": "ok"}
+    except Exception as e:
+        print(f"Mastery Update Error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/api/retrieval/search")
+async def retrieval_search(request: RetrievalRequest):
+    """
+    Hybrid (full-text + vector) search over the knowledge graph, fused with RRF.
+    """
+    try:
+        from services.retrieval import hybrid_search
+        results = await hybrid_search(
+            request.query,
+            k=request.k,
+            lexical_weight=request.lexical_weight,
+            vector_weight=request.vector_weight,
+            scope=graph_scope(request.subject, request.tenant_id)
+        )
+        return {"results": results}
+    except Exception as e:
+        print(f"Retrieval Error: {e}")
+        raise api_error(e)
+
+@app.get("/api/graph/changes")
+async def graph_changes(since: Optional[int] = None, subject: Optional[str] = None, tenant_id: Optional[str] = None):
+    """
+    Knowledge graph delta since a client's version: added/updated nodes and
+    edges plus tombstones. Falls back to a full snapshot (full=true) when the
+    version is missing or older than the retained changelog.
+    """
+    try:
+        from services.graph_sync import graph_changes_since
+        return await graph_changes_since(since, graph_scope(subject, tenant_id))
+    except Exception as e:
+        print(f"Graph Sync Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/graph/overview")
+async def graph_overview(
+    zoom: int = 0,
+    expand: Optional[str] = None,
+    subject: Optional[str] = None,
+    tenant_id: Optional[str] = None
+):
+    """
+    Level-of-detail graph view. zoom=0 returns one supernode per community
+    with aggregated edges; zoom>=1 additionally expands the communities listed
+    in `expand` (comma-separated community ids) into their member nodes.
+    """
+    try:
+        from services.graph_snapshot import graph_store
+        from services.communities import community_stores, level_of_detail
+        scope = graph_scope(subject, tenant_id)
+        snapshot = await graph_store.get(scope)
+        communities = await community_stores.for_scope(scope).get(snapshot)
+        expanded = [c for c in (expand or "").split(",") if c] if zoom >= 1 else []
+        return level_of_detail(snapshot, communities, expand=expanded)
+    except Exception as e:
+        print(f"Graph Overview Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/graph/critical")
+async def critical_concepts(limit: int = 20, subject: Optional[str] = None, tenant_id: Optional[str] = None):
+    """
+    Top-N exam-critical concepts, ranked by PageRank, prerequisite dependents
+    and mention frequency. Served from a precomputed ranking.
+    """
+    try:
+        from services.analytics import centrality_stores
+        store = centrality_stores.for_scope(graph_scope(subject, tenant_id))
+        return {"concepts": await store.top(min(limit, 200))}
+    except Exception as e:
+        print(f"Critical Concepts Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/api/graph/layout")
+async def graph_layout(
+    center: Optional[str] = None,
+    hops: int = 2,
+    iterations: int = 150,
+    subject: Optional[str] = None,
+    tenant_id: Optional[str] = None
+):
+    """
+    Precomputed node coordinates (normalized to [-1, 1]) for the whole graph
+    or the k-hop neighbourhood of `center`, so clients can skip local layout.
+    """
+    try:
+        from services.graph_snapshot import graph_store
+        from services.layout import layout_service
+        scope = graph_scope(subject, tenant_id)
+        snapshot = await graph_store.get(scope)
+        if center:
+            i = snapshot.resolve(center)
+            if i is None:
+                raise HTTPException(status_code=404, detail=f"Unknown node: {center}")
+            indices = list(snapshot.k_hop(i, k=min(hops, 3), direction="both", limit=2000))
+        else:
+            indices = range(snapshot.num_nodes)
+
+        payload = snapshot.subgraph_payload(indices)
+        layout = await layout_service.layout(
+            [n["id"] for n in payload["nodes"]],
+            [(e["source"], e["target"], e["weight"]) for e in payload["edges"]],
+            scope=f"{scope.tenant_id}/{scope.subject or '*'}:{center or 'global'}",
+            iterations=min(iterations, 500)
+        )
+        for node in payload["nodes"]:
+            node["x"], node["y"] = layout["positions"][node["id"]]
+        payload.update({k: layout[k] for k in ("hash", "cached", "warm_start")})
+        return payload
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Graph Layout Error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/metrics")
+async def prometheus_metrics():
+    """
+    Prometheus scrape endpoint: per-node (agent), per-model, and per-query
+    latency histograms with p50/p95/p99, model tokens and estimated cost,
+    and router hop counts per chat turn.
+    """
+    from fastapi.responses import PlainTextResponse
+    from core.metrics import metrics
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/api/traces/{trace_id}")
+async def get_trace(trace_id: str):
+    """
+    Span waterfall of one request (by its X-Trace-Id): graph nodes, model
+    calls and DB queries with their offsets and durations.
+    """
+    from core.tracing import tracer, waterfall
+    # Older traces are read back from the trace file: off the event loop
+    spans = await asyncio.to_thread(tracer.get, trace_id)
+    if not spans:
+        raise HTTPException(status_code=404, detail="Trace not found (expired or never recorded)")
+    spans = waterfall(spans)
+    return {
+        "trace_id": trace_id,
+        "duration_ms": max(s["offset_ms"] + (s["duration_ms"] or 0) for s in spans),
+        "spans": spans
+    }
+
+@app.get("/api/profiles/{trace_id}")
+async def get_profile(trace_id: str, x_admin_token: Optional[str] = Header(None)):
+    """
+    The stored profile of a request profiled with X-Profile: collapsed stacks
+    (feed to flamegraph.pl / speedscope) or a pstats dump. Admin only.
+    """
+    from fastapi.responses import FileResponse
+    from core.profiling import is_authorized, profile_store
+    if not is_authorized(x_admin_token):
+        raise HTTPException(status_code=403, detail="Profiling is disabled or the admin token is wrong")
+    try:
+        found = profile_store.find(trace_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if found is None:
+        raise HTTPException(status_code=404, detail="No profile stored for this trace")
+    path, media_type = found
+    return FileResponse(path, media_type=media_type, filename=os.path.basename(path))
+
+@app.get("/api/metrics/rate-limits")
+async def rate_limit_metrics():
+    """
+    Per-model limiter state: calls, 429s and retries, the adaptive concurrency
+    window, and queue wait percentiles (time spent waiting for quota or a slot);
+    per priority class, end-to-end latency percentiles.
+    """
+    from core.ratelimit import rate_limiter
+    return {"models": rate_limiter.stats(), "classes": rate_limiter.class_stats()}
+
+@app.get("/api/artist/jobs/{job_id}")
+async def artist_job(job_id: str):
+    """
+    Status of an image generation job (queued/running/done/failed) and the
+    URL its image is (or will be) served from.
+    """
+    from services.imaging import image_jobs
+    job = image_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return {k: job[k] for k in ("id", "status", "url", "cached", "error")}
+
+@app.get("/api/media/{name}")
+async def media_object(name: str):
+    """
+    Generated media from the content-addressed store. Objects never change,
+    so clients may cache them forever.
+    """
+    from fastapi.responses import FileResponse
+    from services.object_store import get_media_store
+    found = get_media_store().resolve(name)
+    if found is None:
+        raise HTTPException(status_code=404, detail="Not found")
+    return FileResponse(
+        found["path"],
+        media_type=found["media_type"],
+        headers={"Cache-Control": "public, max-age=31536000, immutable"}
+    )
+
 @app.post("/api/agent/transcribe")
 async def transcribe_audio(
     audio: UploadFile = File(...),
@@ -204,34 +548,93 @@ async def transcribe_audio(
 async def gemini_proxy(request: GeminiRequest, x_custom_gemini_key: Optional[str] = Header(None)):
     """
     Bridge endpoint to Vertex AI.
-    Executes Gemini 1.5 Flash via Google Cloud Vertex AI.
+    Executes a configured Gemini model (aliases map to it) via Google Cloud Vertex AI.
     """
+    from core.ratelimit import rate_limiter, estimate_call_tokens, UnknownModelError
+    requested_model = request.model or "gemini-2.0-flash"
+    try:
+        model_name = rate_limiter.canonical(requested_model)
+    except UnknownModelError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if model_name != requested_model:
+        print(f"🔀 {requested_model} requested, served by {model_name}")
+
     try:
         from langchain_google_genai import ChatGoogleGenerativeAI
         from langchain_core.messages import HumanMessage
         
         # Initialize Chat Model
         # When GOOGLE_GENAI_USE_VERTEXAI=True is in env, it uses Vertex AI via Service Account
-        model_name = request.model if request.model else "gemini-2.0-flash"
         
+        max_output_tokens = request.config.get("maxOutputTokens", 2048) if request.config else 2048
         llm = ChatGoogleGenerativeAI(
             model=model_name,
             temperature=request.config.get("temperature", 0.7) if request.config else 0.7,
-            max_output_tokens=request.config.get("maxOutputTokens", 2048) if request.config else 2048,
+            max_output_tokens=max_output_tokens,
             location=os.environ.get("GCP_LOCATION", "us-central1")
         )
         
-        # Execute chain
-        response = await llm.ainvoke([HumanMessage(content=request.contents)])
+        # Execute chain (through the shared per-model rate limiter)
+        response = await rate_limiter.call(
+            model_name,
+            lambda: llm.ainvoke([HumanMessage(content=request.contents)]),
+            tokens=estimate_call_tokens(request.contents, output=max_output_tokens)
+        )
         
+        # A remapped alias is visible to the caller: `model` is what served (and was billed)
         return {
             "text": response.content,
-            "model": model_name
+            "model": model_name,
+            "requested_model": requested_model
         }
         
     except Exception as e:
         print(f"Vertex AI Error: {e}")
-        raise HTTPException(status_code=500, detail=f"Vertex AI Error: {str(e)}")
+        raise api_error(e, "Vertex AI Error: ")
+
+@app.websocket("/ws/graph/{topic}")
+async def websocket_graph_updates(websocket: WebSocket, topic: str):
+    """
+    Live knowledge-graph updates for everyone viewing a class graph.
+    topic is e.g. "session:<session_id>". Updates arrive in batches; a
+    {"type": "resync"} entry means this client fell behind and should
+    re-fetch via /api/graph/changes.
+    """
+    from services.pubsub import broker
+
+    await websocket.accept()
+    subscription = broker.subscribe(topic)
+
+    async def sender():
+        while True:
+            batch = await subscription.next_batch()
+            await websocket.send_json({"type": "graph_updates", "topic": topic, "updates": batch})
+
+    async def receiver():
+        # Drain client frames (pings) until the socket closes
+        try:
+            while True:
+                await websocket.receive_text()
+        except WebSocketDisconnect:
+            pass
+
+    send_task = asyncio.create_task(sender())
+    receive_task = asyncio.create_task(receiver())
+    try:
+        # Whichever side ends first ends the subscription: a failed sender must not leave it open
+        await asyncio.wait({send_task, receive_task}, return_when=asyncio.FIRST_COMPLETED)
+        if send_task.done() and not send_task.cancelled() and send_task.exception():
+            e = send_task.exception()
+            print(f"⚠️ Graph updates for {topic} failed, closing socket: {type(e).__name__}: {e}")
+            try:
+                await websocket.close(code=1011)
+            except Exception:
+                pass  # already closed by the client
+    finally:
+        for task in (send_task, receive_task):
+            task.cancel()
+        await asyncio.gather(send_task, receive_task, return_exceptions=True)
+        broker.unsubscribe(subscription)
 
 # Temporarily disabled - uncomment after installing google-cloud-speech
 # @app.websocket("/ws/audio/{session_id}")
@@ -299,6 +702,8 @@ async def gemini_proxy(request: GeminiRequest, x_custom_gemini_key: Optional[str
 #             except Exception as e:
 #                 print(f"⚠️ Scribe Error: {e}")
 
+startup_state.mark_imported(_import_started)
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,159 @@
+import time
+import asyncio
+import numpy as np
+import scipy.sparse as sp
+from typing import List, Dict, Any, Optional
+from core.events import GRAPH_CHANNEL
+from core.scope import GraphScope, ScopedRegistry
+from services.graph_snapshot import GraphSnapshot, RELATION_CODES, graph_store
+
+# How the three signals mix into one "exam-critical" score (each scaled to [0, 1]).
+CRITICALITY_WEIGHTS = {"pagerank": 0.5, "dependents": 0.3, "mentions": 0.2}
+
+# Ranked list kept precomputed so top-N is a slice.
+MAX_TOP = 200
+
+
+def pagerank(
+    n: int,
+    src: np.ndarray,
+    dst: np.ndarray,
+    weight: Optional[np.ndarray] = None,
+    damping: float = 0.85,
+    init: Optional[np.ndarray] = None,
+    tol: float = 1e-9,
+    max_iter: int = 100
+):
+    """
+    Weighted PageRank by sparse power iteration (rank flows src -> dst).
+    `init` warm-starts from a previous vector, which after a small graph
+    change converges in a handful of iterations. Returns (ranks, iterations).
+    """
+    if n == 0:
+        return np.zeros(0), 0
+    weight = np.ones(len(src)) if weight is None else np.asarray(weight, dtype=np.float64)
+    out_weight = np.bincount(src, weights=weight, minlength=n)
+    # Column-stochastic transition matrix; dangling nodes spread their rank uniformly
+    transition = sp.csr_matrix((weight / np.maximum(out_weight[src], 1e-12), (dst, src)), shape=(n, n))
+    dangling = out_weight == 0
+
+    ranks = np.full(n, 1.0 / n) if init is None else np.asarray(init, dtype=np.float64) / init.sum()
+    for iteration in range(1, max_iter + 1):
+        updated = damping * (transition @ ranks + ranks[dangling].sum() / n) + (1 - damping) / n
+        delta = np.abs(updated - ranks).sum()
+        ranks = updated
+        if delta < tol:
+            break
+    return ranks, iteration
+
+
+def _scaled(values: np.ndarray) -> np.ndarray:
+    top = values.max() if len(values) else 0
+    return values / top if top > 0 else np.zeros_like(values, dtype=np.float64)
+
+
+class ConceptRanking:
+    """
+    Centrality signals for one graph snapshot, plus the ranked top list.
+    - pagerank: computed on reversed edges, so rank flows from dependent
+      concepts to the foundations they build on.
+    - dependents: number of concepts that list this one as a prerequisite
+      (Prerequisite edges point prerequisite -> dependent, so out-degree).
+    - mentions: how often the Scribe has seen the concept, log-scaled.
+    """
+    def __init__(self, snapshot: GraphSnapshot, previous: Optional["ConceptRanking"] = None):
+        n = snapshot.num_nodes
+        self.node_ids = snapshot.node_ids
+        self.version = snapshot.version
+        self.num_nodes = n
+        self.computed_at = time.time()
+
+        src, dst, rel, weight = snapshot.edge_arrays()
+        init = None
+        if previous is not None and previous.node_ids is snapshot.node_ids:
+            # Same builder: indices line up, new nodes start at the average rank
+            init = np.full(n, 1.0 / n)
+            init[:previous.num_nodes] = previous.pagerank[:n]
+        self.pagerank, self.iterations = pagerank(n, dst, src, weight.astype(np.float64), init=init)
+
+        prerequisite = rel == RELATION_CODES["Prerequisite"]
+        self.dependents = np.bincount(src[prerequisite], minlength=n)[:n]
+        self.mentions = np.asarray(snapshot.mentions[:n], dtype=np.float64)
+
+        self.score = (
+            CRITICALITY_WEIGHTS["pagerank"] * _scaled(self.pagerank)
+            + CRITICALITY_WEIGHTS["dependents"] * _scaled(self.dependents.astype(np.float64))
+            + CRITICALITY_WEIGHTS["mentions"] * _scaled(np.log1p(self.mentions))
+        )
+        order = np.argsort(-self.score, kind="stable")[:MAX_TOP]
+        self._top = [
+            snapshot.node_payload(
+                i,
+                score=round(float(self.score[i]), 4),
+                pagerank=round(float(self.pagerank[i]), 6),
+                dependents=int(self.dependents[i]),
+                mentions=int(self.mentions[i])
+            )
+            for i in order.tolist()
+        ]
+
+    def top(self, limit: int = 10) -> List[Dict[str, Any]]:
+        return self._top[:limit]
+
+
+class CentralityStore:
+    """
+    Keeps one scope's concept ranking in step with its graph snapshot.
+    A graph change marks the ranking stale; the next read schedules a
+    warm-started recompute in the background and meanwhile serves the last
+    ranking, so callers never wait on the graph. Rankings older than
+    `max_age` are re-checked too, for writes made by other workers.
+    """
+    def __init__(self, scope: Optional[GraphScope] = None, max_age: float = 60.0):
+        self.scope = scope
+        self.max_age = max_age
+        self.current: Optional[ConceptRanking] = None
+        self._refreshing: Optional[asyncio.Task] = None
+        self._stale = True
+
+    def _on_graph_changed(self, payload: Dict[str, Any]):
+        self._stale = True
+
+    async def refresh(self, snapshot: Optional[GraphSnapshot] = None) -> ConceptRanking:
+        self._stale = False
+        snapshot = snapshot or await graph_store.get(self.scope)
+        current = self.current
+        if current is not None and current.node_ids is snapshot.node_ids and current.version == snapshot.version:
+            current.computed_at = time.time()
+            return current
+        start = time.perf_counter()
+        ranking = await asyncio.to_thread(ConceptRanking, snapshot, current)
+        self.current = ranking
+        print(f"📈 Ranked {ranking.num_nodes} concepts ({ranking.iterations} PageRank iterations) "
+              f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return ranking
+
+    def cached_top(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Constant-time read of the latest ranking; kicks off a refresh if stale."""
+        current = self.current
+        due = self._stale or current is None or time.time() - current.computed_at > self.max_age
+        if due and (self._refreshing is None or self._refreshing.done()):
+            self._refreshing = asyncio.create_task(self._refresh_quietly())
+        return current.top(limit) if current is not None else []
+
+    async def top(self, limit: int = 10) -> List[Dict[str, Any]]:
+        """Like cached_top, but waits for the first ranking if there is none yet."""
+        if self.current is None:
+            await self.refresh()
+        return self.cached_top(limit)
+
+    async def _refresh_quietly(self):
+        try:
+            await self.refresh()
+        except Exception as e:
+            self._stale = True
+            print(f"⚠️ Concept ranking refresh failed: {e}")
+
+
+# Rankings per graph scope; graph-change events mark the affected scopes stale.
+centrality_stores = ScopedRegistry(CentralityStore, channel=GRAPH_CHANNEL)
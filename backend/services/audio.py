@@ -15,11 +15,18 @@ class AudioStreamer:
     def __init__(self):
         self.project_id = os.getenv("GCP_PROJECT")
         self.location = os.getenv("GCP_LOCATION", "us-central1")
-        self.client = speech_v2.SpeechAsyncClient()
+        self._client = None
         
         # Recognize config for Chirp v2
         self.recognizer_id = "chirp-v2-recognizer"
         
+    @property
+    def client(self) -> speech_v2.SpeechAsyncClient:
+        """Created on first use: constructing it resolves credentials."""
+        if self._client is None:
+            self._client = speech_v2.SpeechAsyncClient()
+        return self._client
+
     async def transcribe_stream(self, audio_generator):
         """
         Processes an async generator of audio chunks and yields transcription results.
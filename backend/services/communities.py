@@ -0,0 +1,319 @@
+import time
+import asyncio
+import numpy as np
+from typing import Dict, Any, Optional, Iterable
+from core.scope import GraphScope, ScopedRegistry
+from services.graph_snapshot import GraphSnapshot, RELATIONS, graph_store
+
+# Upper bound on real nodes returned when clusters are expanded.
+MAX_EXPANDED_NODES = 2000
+
+PREVIOUS_ASSIGNMENT_SQL = (
+    "SELECT nc.node_id, nc.community_id FROM node_communities nc "
+    "JOIN knowledge_nodes k ON k.id = nc.node_id WHERE {scope}"
+)
+
+
+def label_propagation(
+    n: int,
+    src: np.ndarray,
+    dst: np.ndarray,
+    weight: Optional[np.ndarray] = None,
+    init: Optional[np.ndarray] = None,
+    max_iter: int = 30,
+    seed: int = 0
+) -> np.ndarray:
+    """
+    Weighted label propagation over the undirected graph, vectorized per
+    sweep: every node adopts the label with the largest total edge weight
+    among its neighbours (keeping its own label on ties). A random half of
+    the nodes updates each sweep, which stops two-colour oscillation.
+    `init` warm-starts from a previous assignment. Returns an int label per node.
+    """
+    labels = np.arange(n, dtype=np.int64) if init is None else np.asarray(init, dtype=np.int64).copy()
+    if n == 0 or not len(src):
+        return labels
+    rng = np.random.default_rng(seed)
+    weight = np.ones(len(src)) if weight is None else np.asarray(weight, dtype=np.float64)
+    node = np.concatenate([src, dst]).astype(np.int64)
+    other = np.concatenate([dst, src]).astype(np.int64)
+    w = np.concatenate([weight, weight])
+    label_span = int(labels.max()) + 1
+
+    for _ in range(max_iter):
+        # Total weight per (node, neighbour label) pair
+        pair_keys, inverse = np.unique(node * label_span + labels[other], return_inverse=True)
+        score = np.bincount(inverse, weights=w)
+        pair_node, pair_label = pair_keys // label_span, pair_keys % label_span
+        score += 1e-6 * (pair_label == labels[pair_node]) + 1e-9 * rng.random(len(score))
+
+        # Best-scoring label per node: sort by node, then by score descending
+        order = np.lexsort((-score, pair_node))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair_node[order[1:]] != pair_node[order[:-1]]
+        proposal = labels.copy()
+        proposal[pair_node[order[first]]] = pair_label[order[first]]
+
+        changed = proposal != labels
+        if not changed.any():
+            break
+        labels = np.where(changed & (rng.random(n) < 0.5), proposal, labels)
+    return labels
+
+
+class Communities:
+    """
+    Community assignment for one graph snapshot. Communities are numbered
+    0..C-1 by size and identified externally by their best-connected
+    member's node id, which stays stable while the cluster does.
+    """
+    def __init__(self, snapshot: GraphSnapshot, raw_labels: np.ndarray):
+        self.node_ids = snapshot.node_ids  # identifies the builder these indices belong to
+        self.version = snapshot.version
+        self.num_nodes = snapshot.num_nodes
+        self.computed_at = time.time()
+
+        _, labels, sizes = np.unique(raw_labels, return_inverse=True, return_counts=True)
+        by_size = np.argsort(-sizes, kind="stable")
+        rank = np.empty_like(by_size)
+        rank[by_size] = np.arange(len(by_size))
+        self.labels = rank[labels.reshape(-1)]
+        self.sizes = sizes[by_size]
+
+        # Members grouped by community, best-connected first
+        degree = snapshot.degree()[:self.num_nodes]
+        self.member_order = np.lexsort((-degree, self.labels))
+        self.indptr = np.concatenate([[0], np.cumsum(self.sizes)])
+        representatives = self.member_order[self.indptr[:-1]]
+        self.ids = [snapshot.node_ids[i] for i in representatives]
+        self.names = [snapshot.labels[i] for i in representatives]
+        self.index_of = {cid: c for c, cid in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def members(self, c: int) -> np.ndarray:
+        return self.member_order[self.indptr[c]:self.indptr[c + 1]]
+
+    def assignment(self) -> Dict[str, str]:
+        """{node id: community id}"""
+        return {self.node_ids[i]: self.ids[c] for i, c in enumerate(self.labels.tolist())}
+
+
+def detect_communities(snapshot: GraphSnapshot, previous: Optional[Dict[str, str]] = None, seed: int = 0) -> Communities:
+    """
+    Runs label propagation on the snapshot, warm-started from a previous
+    {node id: community id} assignment when given (new nodes start alone).
+    """
+    n = snapshot.num_nodes
+    init = None
+    if previous:
+        start_label = {}
+        init = np.arange(n, dtype=np.int64)
+        for i in range(n):
+            cid = previous.get(snapshot.node_ids[i])
+            if cid is not None:
+                init[i] = start_label.setdefault(cid, i)
+    src, dst, _, weight = snapshot.edge_arrays()
+    return Communities(snapshot, label_propagation(n, src, dst, weight, init=init, seed=seed))
+
+
+def level_of_detail(
+    snapshot: GraphSnapshot,
+    communities: Communities,
+    expand: Iterable[str] = (),
+    max_nodes: int = MAX_EXPANDED_NODES
+) -> Dict[str, Any]:
+    """
+    UI payload mixing real nodes (members of expanded communities, plus any
+    node newer than the clustering) with one supernode per collapsed
+    community. Edges are aggregated to whatever their endpoints display as;
+    aggregated edges carry the number of underlying edges.
+    """
+    n = snapshot.num_nodes
+    expanded = np.zeros(len(communities), dtype=bool)
+    budget = max_nodes
+    for cid in expand:
+        c = communities.index_of.get(cid)
+        if c is not None and communities.sizes[c] <= budget:
+            expanded[c] = True
+            budget -= communities.sizes[c]
+
+    labels = np.full(n, -1, dtype=np.int64)
+    labels[:communities.num_nodes] = communities.labels
+    collapsed = labels >= 0
+    collapsed[collapsed] = ~expanded[labels[collapsed]]
+    # Display code: the node itself, or n + community for collapsed members
+    code = np.where(collapsed, n + labels, np.arange(n))
+
+    src, dst, rel, weight = snapshot.edge_arrays()
+    a, b = code[src], code[dst]
+    keep = a != b
+    a, b, rel, weight = a[keep], b[keep], rel[keep].astype(np.int64), weight[keep]
+    # Real-to-real edges keep their relation; anything touching a supernode is aggregated
+    rel = np.where((a < n) & (b < n), rel, -1)
+    keys, inverse = np.unique(np.stack([a, b, rel], axis=1), axis=0, return_inverse=True)
+    inverse = inverse.reshape(-1)
+    totals = np.bincount(inverse, weights=weight, minlength=len(keys))
+    counts = np.bincount(inverse, minlength=len(keys))
+
+    def display_id(x: int) -> str:
+        return snapshot.node_ids[x] if x < n else f"community:{communities.ids[x - n]}"
+
+    nodes = [
+        {
+            "id": f"community:{cid}",
+            "label": communities.names[c],
+            "type": "Community",
+            "community": cid,
+            "size": int(communities.sizes[c])
+        }
+        for c, cid in enumerate(communities.ids) if not expanded[c]
+    ]
+    nodes.extend(
+        snapshot.node_payload(i, community=communities.ids[labels[i]] if labels[i] >= 0 else None)
+        for i in np.flatnonzero(~collapsed).tolist()
+    )
+    edges = [
+        {
+            "source": display_id(s),
+            "target": display_id(t),
+            "relation": RELATIONS[r] if r >= 0 else "Aggregated",
+            "weight": round(float(total), 4),
+            "count": int(count)
+        }
+        for (s, t, r), total, count in zip(keys.tolist(), totals.tolist(), counts.tolist())
+    ]
+    return {
+        "version": snapshot.version,
+        "communities": len(communities),
+        "expanded": [communities.ids[c] for c in np.flatnonzero(expanded).tolist()],
+        "nodes": nodes,
+        "edges": edges
+    }
+
+
+class CommunityStore:
+    """
+    Holds the latest clustering of one scope's graph snapshot.
+    Re-clusters (warm-started) when the graph has changed and the last run is
+    older than `min_interval`; in between, nodes added since the last run are
+    shown individually. `run_job` also persists the result.
+    """
+    def __init__(self, scope: Optional[GraphScope] = None, min_interval: float = 300.0):
+        self.scope = scope
+        self.min_interval = min_interval
+        self.current: Optional[Communities] = None
+        self._lock = asyncio.Lock()
+
+    def _is_stale(self, snapshot: GraphSnapshot) -> bool:
+        current = self.current
+        if current is None or current.node_ids is not snapshot.node_ids:
+            return True
+        return current.version != snapshot.version and time.time() - current.computed_at > self.min_interval
+
+    async def get(self, snapshot: GraphSnapshot) -> Communities:
+        if self._is_stale(snapshot):
+            async with self._lock:
+                if self._is_stale(snapshot):
+                    await self.recompute(snapshot)
+        return self.current
+
+    async def recompute(self, snapshot: GraphSnapshot, previous: Optional[Dict[str, str]] = None) -> Communities:
+        if previous is None and self.current is not None:
+            previous = self.current.assignment()
+        start = time.perf_counter()
+        communities = await asyncio.to_thread(detect_communities, snapshot, previous)
+        self.current = communities
+        print(f"🧩 Clustered {snapshot.num_nodes} nodes into {len(communities)} communities "
+              f"in {(time.perf_counter() - start) * 1000:.0f}ms")
+        return communities
+
+    async def run_job(self) -> Communities:
+        """Clusters the current graph (warm-started from the stored assignment) and persists it."""
+        from core.db import get_db_connection
+
+        scope = self.scope or GraphScope()
+        snapshot = await graph_store.get(scope)
+        previous = None
+        if self.current is None:
+            predicate, params = scope.filter(1, alias="k")
+            conn = await get_db_connection()
+            try:
+                rows = await conn.fetch(PREVIOUS_ASSIGNMENT_SQL.format(scope=predicate), *params)
+            finally:
+                await conn.close()
+            previous = {str(r["node_id"]): str(r["community_id"]) for r in rows}
+        communities = await self.recompute(snapshot, previous)
+        await persist_communities(snapshot, communities, scope)
+        return communities
+
+    async def run_periodic(self):
+        """Background clustering loop (started from the app's startup hook)."""
+        while True:
+            try:
+                await self.run_job()
+            except Exception as e:
+                print(f"⚠️ Community detection failed: {e}")
+            await asyncio.sleep(self.min_interval)
+
+
+async def persist_communities(snapshot: GraphSnapshot, communities: Communities, scope: Optional[GraphScope] = None):
+    """
+    Stores node assignments, one row per community (its supernode) and the
+    aggregated community-to-community edges, replacing the previous run of
+    the same scope only (a tenant-wide run replaces all of its tenant's rows).
+    """
+    from core.db import get_db_connection
+
+    scope = scope or GraphScope()
+    coarse = level_of_detail(snapshot, communities)
+    supernode_edges = [e for e in coarse["edges"] if e["source"].startswith("community:") and e["target"].startswith("community:")]
+    assignment = communities.assignment()
+    predicate, params = scope.filter(1)
+
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            await conn.execute(f"DELETE FROM graph_community_edges WHERE {predicate}", *params)
+            await conn.execute(f"DELETE FROM graph_communities WHERE {predicate}", *params)
+            # A subject run may take over communities a tenant-wide run stored
+            await conn.execute(
+                "INSERT INTO graph_communities (id, label, size, tenant_id, subject) "
+                "SELECT *, $4::text, $5::text FROM unnest($1::uuid[], $2::text[], $3::int[]) "
+                "ON CONFLICT (id) DO UPDATE SET label = EXCLUDED.label, size = EXCLUDED.size, "
+                "tenant_id = EXCLUDED.tenant_id, subject = EXCLUDED.subject, computed_at = NOW()",
+                communities.ids, communities.names, communities.sizes.tolist(), scope.tenant_id, scope.subject
+            )
+            await conn.execute(
+                "INSERT INTO graph_community_edges (source_id, target_id, weight, edge_count, tenant_id, subject) "
+                "SELECT *, $5::text, $6::text FROM unnest($1::uuid[], $2::uuid[], $3::float8[], $4::int[]) "
+                "ON CONFLICT (source_id, target_id) DO UPDATE SET weight = EXCLUDED.weight, "
+                "edge_count = EXCLUDED.edge_count, tenant_id = EXCLUDED.tenant_id, subject = EXCLUDED.subject",
+                [e["source"].split(":", 1)[1] for e in supernode_edges],
+                [e["target"].split(":", 1)[1] for e in supernode_edges],
+                [e["weight"] for e in supernode_edges],
+                [e["count"] for e in supernode_edges],
+                scope.tenant_id, scope.subject
+            )
+            await conn.execute(
+                """
+                INSERT INTO node_communities (node_id, community_id)
+                SELECT * FROM unnest($1::uuid[], $2::uuid[])
+                ON CONFLICT (node_id) DO UPDATE SET community_id = EXCLUDED.community_id, assigned_at = NOW()
+                WHERE node_communities.community_id IS DISTINCT FROM EXCLUDED.community_id
+                """,
+                list(assignment.keys()), list(assignment.values())
+            )
+    finally:
+        await conn.close()
+
+
+# Clusterings per graph scope. The persisted job runs on the tenant-wide
+# default scope; communities never span subjects, so it covers every course.
+community_stores = ScopedRegistry(CommunityStore)
+
+
+if __name__ == "__main__":
+    result = asyncio.run(community_stores.for_scope(GraphScope()).run_job())
+    print(f"✅ Stored {len(result)} communities.")
@@ -0,0 +1,40 @@
+from typing import List
+
+# Rough Gemini tokenizer ratio for English prose; good enough for budgeting.
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+
+def pack_lines(lines: List[str], token_budget: int) -> str:
+    """
+    Keeps lines in priority order until the token budget is spent.
+    Callers put the most important lines first.
+    """
+    packed, used = [], 0
+    for line in lines:
+        cost = estimate_tokens(line) + 1  # newline
+        if used + cost > token_budget:
+            break
+        packed.append(line)
+        used += cost
+    return "\n".join(packed)
+
+
+def truncate(text: str, max_chars: int) -> str:
+    text = " ".join((text or "").split())
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+
+def encode_table(columns: List[str], rows: List[tuple]) -> str:
+    """
+    Compact pipe-separated table: one header line, one line per row.
+    Roughly a third of the tokens of the equivalent JSON list of objects.
+    """
+    def cell(value) -> str:
+        return str(value).replace("|", "/").replace("\n", " ")
+    lines = ["|".join(columns)]
+    lines.extend("|".join(cell(v) for v in row) for row in rows)
+    return "\n".join(lines)
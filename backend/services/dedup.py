@@ -0,0 +1,305 @@
+import json
+import time
+import asyncio
+import numpy as np
+from datetime import datetime
+from typing import List, Dict, Any, Optional, Tuple
+from core.db import get_db_connection
+from core.events import event_bus, GRAPH_CHANNEL, MASTERY_CHANNEL
+from core.scope import GraphScope, DEFAULT_TENANT
+from services.labels import labels_compatible, normalize_label
+
+# Cosine at or above which two embeddings are merge candidates; label rules then confirm.
+CANDIDATE_THRESHOLD = 0.88
+# Near-identical embeddings merge even when the labels share no form.
+AUTO_MERGE_THRESHOLD = 0.97
+BLOCK_ROWS = 1024
+
+NODES_SQL = """
+    SELECT id, label, type, mention_count, created_at, tenant_id, subject, embedding::text AS embedding
+    FROM knowledge_nodes
+    WHERE {scope} AND embedding IS NOT NULL
+"""
+LAST_RUN_SQL = "SELECT max(started_at) FROM dedup_runs WHERE NOT dry_run"
+
+
+def similar_pairs(
+    embeddings: np.ndarray,
+    threshold: float = CANDIDATE_THRESHOLD,
+    rows: Optional[np.ndarray] = None,
+    block: int = BLOCK_ROWS
+) -> List[Tuple[int, int, float]]:
+    """
+    (i, j, cosine) for every pair at or above `threshold`, with i < j.
+    Compares `rows` (default: all) against every embedding one block of rows
+    at a time, so peak memory is block x n rather than n x n.
+    """
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    unit = (embeddings / np.maximum(norms, 1e-12)).astype(np.float32)
+    rows = np.arange(len(unit)) if rows is None else np.asarray(rows)
+    in_rows = np.zeros(len(unit), dtype=bool)
+    in_rows[rows] = True
+
+    pairs = []
+    for start in range(0, len(rows), block):
+        chunk = rows[start:start + block]
+        sims = unit[chunk] @ unit.T
+        hit_r, hit_c = np.nonzero(sims >= threshold)
+        i, j = chunk[hit_r], hit_c
+        # Drop self-matches; a pair of two queried rows is reported once (i < j)
+        keep = (i != j) & ((i < j) | ~in_rows[j])
+        for a, b, s in zip(i[keep].tolist(), j[keep].tolist(), sims[hit_r[keep], hit_c[keep]].tolist()):
+            pairs.append((min(a, b), max(a, b), s))
+    return pairs
+
+
+def _group(n: int, pairs: List[Tuple[int, int]]) -> List[List[int]]:
+    """Connected components of the confirmed pairs (union-find)."""
+    parent = list(range(n))
+
+    def find(x):
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for a, b in pairs:
+        ra, rb = find(a), find(b)
+        if ra != rb:
+            parent[max(ra, rb)] = min(ra, rb)
+    groups: Dict[int, List[int]] = {}
+    for x in sorted({x for pair in pairs for x in pair}):
+        groups.setdefault(find(x), []).append(x)
+    return list(groups.values())
+
+
+def plan_merges(
+    nodes: List[Dict[str, Any]],
+    embeddings: np.ndarray,
+    new_rows: Optional[np.ndarray] = None,
+    threshold: float = CANDIDATE_THRESHOLD
+) -> Dict[str, Any]:
+    """
+    Finds duplicate groups and picks the survivor of each (most mentioned,
+    then oldest). Pure: returns the plan / dry-run report without writing.
+    """
+    candidates = similar_pairs(embeddings, threshold, rows=new_rows)
+    confirmed, rejected = [], []
+    similarity = {}
+    for i, j, s in candidates:
+        if labels_compatible(nodes[i]["label"], nodes[j]["label"]) or s >= AUTO_MERGE_THRESHOLD:
+            confirmed.append((i, j))
+            similarity[(i, j)] = s
+        else:
+            rejected.append({"labels": [nodes[i]["label"], nodes[j]["label"]], "similarity": round(s, 4)})
+
+    # Identical normalized labels are duplicates whatever their embeddings say
+    scope = set(range(len(nodes))) if new_rows is None else set(np.asarray(new_rows).tolist())
+    by_form: Dict[str, List[int]] = {}
+    for i, node in enumerate(nodes):
+        by_form.setdefault(normalize_label(node["label"]), []).append(i)
+    for members in by_form.values():
+        if len(members) > 1 and any(m in scope for m in members):
+            confirmed.extend((members[0], m) for m in members[1:])
+
+    groups = []
+    for members in _group(len(nodes), confirmed):
+        members.sort(key=lambda k: (-(nodes[k].get("mention_count") or 1), nodes[k]["created_at"]))
+        keep, drop = members[0], members[1:]
+        groups.append({
+            "keep": {"id": str(nodes[keep]["id"]), "label": nodes[keep]["label"]},
+            "merge": [
+                {
+                    "id": str(nodes[k]["id"]),
+                    "label": nodes[k]["label"],
+                    "tenant_id": nodes[k].get("tenant_id"),
+                    "subject": nodes[k].get("subject"),
+                    "similarity": round(similarity.get((min(k, keep), max(k, keep)), 1.0), 4)
+                }
+                for k in drop
+            ]
+        })
+    return {
+        "nodes_scanned": len(nodes),
+        "nodes_queried": len(scope),
+        "candidates": len(candidates),
+        "rejected": rejected[:50],
+        "groups": groups,
+        "nodes_merged": sum(len(g["merge"]) for g in groups)
+    }
+
+
+def plan_scoped_merges(
+    nodes: List[Dict[str, Any]],
+    embeddings: np.ndarray,
+    new_rows: Optional[np.ndarray] = None,
+    threshold: float = CANDIDATE_THRESHOLD
+) -> Dict[str, Any]:
+    """
+    plan_merges run separately per (tenant, subject): concepts of different
+    courses never merge, and each comparison is one course's size squared.
+    """
+    partitions: Dict[Tuple[str, str], List[int]] = {}
+    for i, node in enumerate(nodes):
+        partitions.setdefault((node.get("tenant_id"), node.get("subject")), []).append(i)
+    queried = None if new_rows is None else set(np.asarray(new_rows).tolist())
+
+    report = {"nodes_scanned": 0, "nodes_queried": 0, "candidates": 0, "rejected": [], "groups": [], "nodes_merged": 0}
+    for members in partitions.values():
+        part_rows = None
+        if queried is not None:
+            part_rows = np.array([k for k, i in enumerate(members) if i in queried], dtype=np.int64)
+            if not len(part_rows):
+                report["nodes_scanned"] += len(members)
+                continue
+        part = plan_merges([nodes[i] for i in members], embeddings[members], part_rows, threshold)
+        for key in ("nodes_scanned", "nodes_queried", "candidates", "nodes_merged"):
+            report[key] += part[key]
+        report["rejected"].extend(part["rejected"])
+        report["groups"].extend(part["groups"])
+    report["rejected"] = report["rejected"][:50]
+    return report
+
+
+async def merge_group(conn, keep_id: str, drop_ids: List[str]) -> List[str]:
+    """
+    Folds `drop_ids` into `keep_id` in one transaction: edges are re-pointed
+    (dropping resulting self-loops and duplicates), mastery rows move to the
+    survivor keeping each user's best score, mentions are summed and the
+    merged labels are kept as aliases. Returns the users whose mastery moved.
+    """
+    async with conn.transaction():
+        await conn.execute("UPDATE knowledge_edges SET source_id = $1 WHERE source_id = ANY($2::uuid[])", keep_id, drop_ids)
+        await conn.execute("UPDATE knowledge_edges SET target_id = $1 WHERE target_id = ANY($2::uuid[])", keep_id, drop_ids)
+        await conn.execute("DELETE FROM knowledge_edges WHERE source_id = $1 AND target_id = $1", keep_id)
+        await conn.execute(
+            """
+            DELETE FROM knowledge_edges a USING knowledge_edges b
+            WHERE (a.source_id = $1 OR a.target_id = $1)
+              AND a.source_id = b.source_id AND a.target_id = b.target_id
+              AND a.relation = b.relation AND a.id > b.id
+            """,
+            keep_id
+        )
+
+        users = await conn.fetch("SELECT DISTINCT user_id FROM user_mastery WHERE node_id = ANY($1::uuid[])", drop_ids)
+        await conn.execute(
+            """
+            INSERT INTO user_mastery (user_id, node_id, mastery_level, score, last_updated)
+            SELECT DISTINCT ON (user_id) user_id, $1::uuid, mastery_level, score, last_updated
+            FROM user_mastery WHERE node_id = ANY($2::uuid[])
+            ORDER BY user_id, score DESC
+            ON CONFLICT (user_id, node_id) DO UPDATE
+            SET mastery_level = EXCLUDED.mastery_level, score = EXCLUDED.score, last_updated = NOW()
+            WHERE EXCLUDED.score > user_mastery.score
+            """,
+            keep_id, drop_ids
+        )
+        await conn.execute("DELETE FROM user_mastery WHERE node_id = ANY($1::uuid[])", drop_ids)
+
+        await conn.execute(
+            """
+            UPDATE knowledge_nodes k SET
+                mention_count = k.mention_count + d.mentions,
+                metadata = coalesce(k.metadata, '{}'::jsonb)
+                    || jsonb_build_object('aliases', coalesce(k.metadata->'aliases', '[]'::jsonb) || d.labels),
+                updated_at = NOW()
+            FROM (
+                SELECT coalesce(sum(mention_count), 0) AS mentions, to_jsonb(array_agg(label)) AS labels
+                FROM knowledge_nodes WHERE id = ANY($2::uuid[])
+            ) d
+            WHERE k.id = $1
+            """,
+            keep_id, drop_ids
+        )
+        await conn.execute("DELETE FROM knowledge_nodes WHERE id = ANY($1::uuid[])", drop_ids)
+    return [str(r["user_id"]) for r in users]
+
+
+async def run_dedup(
+    dry_run: bool = True,
+    incremental: bool = False,
+    threshold: float = CANDIDATE_THRESHOLD,
+    scope: Optional[GraphScope] = None
+) -> Dict[str, Any]:
+    """
+    Scans node embeddings for near-duplicates and merges them (or, with
+    dry_run, only reports what would be merged), one course at a time.
+    `incremental` compares just the nodes created since the last applied run
+    against the rest of their course.
+    """
+    predicate, params = (scope or GraphScope()).filter(1)
+    started_at = datetime.now().astimezone()
+    start = time.perf_counter()
+    conn = await get_db_connection()
+    try:
+        rows = await conn.fetch(NODES_SQL.format(scope=predicate), *params)
+        nodes = [dict(r) for r in rows]
+        embeddings = (
+            np.array([np.fromstring(r["embedding"][1:-1], sep=",") for r in nodes], dtype=np.float32)
+            if nodes else np.zeros((0, 1), dtype=np.float32)
+        )
+
+        new_rows = None
+        if incremental:
+            since = await conn.fetchval(LAST_RUN_SQL)
+            if since is not None:
+                new_rows = np.array([i for i, r in enumerate(nodes) if r["created_at"] > since], dtype=np.int64)
+
+        report = await asyncio.to_thread(plan_scoped_merges, nodes, embeddings, new_rows, threshold)
+        report.update({"dry_run": dry_run, "incremental": new_rows is not None})
+
+        users = set()
+        if not dry_run:
+            for group in report["groups"]:
+                users.update(await merge_group(conn, group["keep"]["id"], [m["id"] for m in group["merge"]]))
+            await conn.execute(
+                "INSERT INTO dedup_runs (started_at, dry_run, merged) VALUES ($1, $2, $3)",
+                started_at, dry_run, report["nodes_merged"]
+            )
+    finally:
+        await conn.close()
+
+    report["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    if not dry_run and report["groups"]:
+        _forget_merged(report["groups"])
+        # Deletes aren't visible to watermark queries: snapshots rebuild from scratch
+        await event_bus.publish(GRAPH_CHANNEL, {"full": True, "reason": "dedup"})
+        for user_id in users:
+            await event_bus.publish(MASTERY_CHANNEL, {"user_id": user_id})
+    print(f"🧹 Dedup {'(dry run) ' if dry_run else ''}scanned {report['nodes_scanned']} nodes: "
+          f"{len(report['groups'])} groups, {report['nodes_merged']} merged in {report['elapsed_ms']}ms")
+    return report
+
+
+def _forget_merged(groups: List[Dict[str, Any]]):
+    """
+    Drops merged-away nodes from their course's local search index. A merged
+    node labelled exactly like the survivor of its course shares its document,
+    which stays.
+    """
+    def scope_of(node):
+        return GraphScope(node.get("tenant_id") or DEFAULT_TENANT, node.get("subject")).writable()
+
+    try:
+        from services.search_index import get_course_index, schedule_save
+        indexes = {}
+        for group in groups:
+            keep = group["keep"]
+            for merged in group["merge"]:
+                scope = scope_of(merged)
+                if merged["label"] == keep["label"] and scope == scope_of(keep):
+                    continue
+                index = indexes.setdefault(scope, get_course_index(scope))
+                index.remove(f"node:{merged['label']}")
+        for index in indexes.values():
+            schedule_save(index)
+    except Exception as e:
+        print(f"⚠️ Could not update search index after dedup: {e}")
+
+
+if __name__ == "__main__":
+    import sys
+
+    report = asyncio.run(run_dedup(dry_run="--apply" not in sys.argv, incremental="--incremental" in sys.argv))
+    print(json.dumps(report, indent=2, default=str))
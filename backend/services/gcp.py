@@ -3,23 +3,40 @@ import vertexai
 from vertexai.generative_models import GenerativeModel, Part, FinishReason
 import vertexai.preview.generative_models as preview_generative_models
 from dotenv import load_dotenv
+from core.ratelimit import rate_limiter, estimate_call_tokens
+from core.registry import registry
 
 load_dotenv()
 
 GCP_PROJECT = os.getenv("GCP_PROJECT")
 GCP_LOCATION = os.getenv("GCP_LOCATION", "us-central1")
 
-# When running on Cloud Run, GCP will automatically provide credentials to the service account.
-# We only need the project ID.
-if GCP_PROJECT:
-    print(f"✨ Initializing Vertex AI for project: {GCP_PROJECT}")
-    vertexai.init(project=GCP_PROJECT, location=GCP_LOCATION)
-else:
+def init_vertexai() -> bool:
+    """
+    When running on Cloud Run, GCP will automatically provide credentials to the service account.
+    We only need the project ID. Runs once, on first use of a Vertex model (see core.registry).
+    """
+    if GCP_PROJECT:
+        print(f"✨ Initializing Vertex AI for project: {GCP_PROJECT}")
+        vertexai.init(project=GCP_PROJECT, location=GCP_LOCATION)
+        return True
     print("⚠️ GCP_PROJECT not found. Vertex AI may not initialize correctly.")
+    return False
+
+registry.register("vertexai", init_vertexai)
 
 class VertexService:
     def __init__(self, model_name: str = "gemini-2.0-flash"):
-        self.model = GenerativeModel(model_name)
+        self.model_name = model_name
+        self._model = None
+
+    @property
+    def model(self):
+        """The GenerativeModel, created (after vertexai.init) on first use."""
+        if self._model is None:
+            registry.get("vertexai")
+            self._model = GenerativeModel(self.model_name)
+        return self._model
 
     async def generate_content(self, prompt: str, system_instruction: str = None):
         if system_instruction:
@@ -30,7 +47,11 @@ class VertexService:
         else:
             model = self.model
             
-        response = await model.generate_content_async(prompt)
+        response = await rate_limiter.call(
+            self.model_name,
+            lambda: model.generate_content_async(prompt),
+            tokens=estimate_call_tokens(prompt, system_instruction or "", output=2048)
+        )
         return response.text
 
 vertex_service = VertexService()
@@ -0,0 +1,550 @@
+import re
+import time
+import asyncio
+import numpy as np
+from datetime import datetime, timedelta, timezone
+from typing import List, Dict, Any, Optional, Iterable
+from core.events import GRAPH_CHANNEL
+from core.scope import GraphScope, ScopedRegistry
+
+# Relation codes stored per edge (int8). Unknown relations fall back to "Related".
+RELATIONS = ["Prerequisite", "Extends", "Contradicts", "Related"]
+RELATION_CODES = {name: code for code, name in enumerate(RELATIONS)}
+
+# Watermark queries: only rows of one scope written since the last refresh
+# (served by the (tenant_id, subject, updated_at / created_at) indexes).
+NODES_SINCE_SQL = (
+    "SELECT id, label, type, mention_count, updated_at FROM knowledge_nodes "
+    "WHERE {scope} AND updated_at > $1 ORDER BY updated_at"
+)
+EDGES_SINCE_SQL = (
+    "SELECT id, source_id, target_id, relation, weight, created_at FROM knowledge_edges "
+    "WHERE {scope} AND created_at > $1 ORDER BY created_at"
+)
+
+# NOW() is the transaction start time, so a slow transaction can commit rows
+# stamped slightly before the watermark. Re-reading this window (idempotently) covers it.
+WATERMARK_OVERLAP = timedelta(seconds=5)
+EPOCH = datetime.fromtimestamp(0, timezone.utc)
+
+
+def relation_code(relation: str) -> int:
+    return RELATION_CODES.get(relation, RELATION_CODES["Related"])
+
+
+class GrowableArray:
+    """
+    Append-only numpy buffer with capacity doubling (amortized O(1) appends).
+    Views handed out earlier stay valid: appends only write past their end,
+    and growth copies into a new buffer.
+    """
+    def __init__(self, dtype, capacity: int = 1024):
+        self._buf = np.empty(capacity, dtype=dtype)
+        self._n = 0
+
+    def __len__(self):
+        return self._n
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self._buf.dtype)
+        needed = self._n + len(values)
+        if needed > len(self._buf):
+            capacity = len(self._buf)
+            while capacity < needed:
+                capacity *= 2
+            grown = np.empty(capacity, dtype=self._buf.dtype)
+            grown[:self._n] = self._buf[:self._n]
+            self._buf = grown
+        self._buf[self._n:needed] = values
+        self._n = needed
+
+    def view(self, start: int = 0) -> np.ndarray:
+        return self._buf[start:self._n]
+
+
+class CSRAdjacency:
+    """
+    Compressed sparse rows over the first `n` nodes, in both directions
+    (indptr / neighbour index / relation code / weight).
+    """
+    def __init__(self, n: int, src: np.ndarray, dst: np.ndarray, rel: np.ndarray, weight: np.ndarray):
+        self.n = n
+        self.out_indptr, order = self._group(src, n)
+        self.out_indices, self.out_rel, self.out_weight = dst[order], rel[order], weight[order]
+        self.in_indptr, order = self._group(dst, n)
+        self.in_indices, self.in_rel, self.in_weight = src[order], rel[order], weight[order]
+
+    @staticmethod
+    def _group(keys: np.ndarray, n: int):
+        order = np.argsort(keys, kind="stable")
+        indptr = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(np.bincount(keys, minlength=n), out=indptr[1:])
+        return indptr, order
+
+    @property
+    def num_edges(self) -> int:
+        return len(self.out_indices)
+
+
+class GraphSnapshot:
+    """
+    Immutable, compact view of the knowledge graph at one version.
+    Nodes are dense integer indices. Edges are a CSR base (built at the last
+    compaction) plus a short append-only delta of edges added since, so
+    neighbour lookups are array slices rather than DB queries.
+    """
+    def __init__(
+        self,
+        node_ids: List[str],
+        labels: List[str],
+        types: List[str],
+        index_of: Dict[str, int],
+        label_index: Dict[str, int],
+        num_nodes: int,
+        base: CSRAdjacency,
+        delta: tuple,
+        version: int = 0,
+        max_label_words: int = 1,
+        mentions: Optional[List[int]] = None
+    ):
+        # `node_ids` and `index_of` are shared with the builder, which only
+        # appends to them (`num_nodes` bounds what this version sees); labels,
+        # types, mentions and the label index are this version's own copies,
+        # since later updates change them in place.
+        self.node_ids = node_ids
+        self.labels = labels
+        self.types = types
+        self.mentions = mentions if mentions is not None else [1] * num_nodes
+        self.index_of = index_of
+        self.label_index = label_index
+        self.num_nodes = num_nodes
+        self.base = base
+        self.delta_src, self.delta_dst, self.delta_rel, self.delta_weight = delta
+        self.version = version
+        self.max_label_words = max_label_words
+        self.loaded_at = time.time()
+        self._degree = None
+
+    @property
+    def num_edges(self) -> int:
+        return self.base.num_edges + len(self.delta_src)
+
+    @classmethod
+    def from_rows(cls, node_rows: Iterable[Dict[str, Any]], edge_rows: Iterable[Dict[str, Any]]):
+        builder = GraphBuilder()
+        builder.apply(node_rows, edge_rows)
+        builder.compact()
+        return builder.snapshot()
+
+    # ─── Lookup ───
+
+    def resolve(self, key: str) -> Optional[int]:
+        """Node index for an id or a (case-insensitive) label."""
+        i = self.index_of.get(key)
+        if i is None:
+            i = self.label_index.get(key.strip().lower())
+        return i if i is not None and i < self.num_nodes else None
+
+    def find_labels(self, text: str) -> List[int]:
+        """
+        Node indices whose label appears in the text, longest match first.
+        Looks up word n-grams, so cost depends on the text, not the graph.
+        """
+        words = re.findall(r"[\w'-]+", text.lower())
+        found = []
+        for size in range(min(self.max_label_words, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                i = self.label_index.get(" ".join(words[start:start + size]))
+                if i is not None and i < self.num_nodes and i not in found:
+                    found.append(i)
+        return found
+
+    # ─── Traversal ───
+
+    def neighbors(self, i: int, direction: str = "out", relations: Optional[List[str]] = None):
+        """
+        (neighbour indices, relation codes, weights) of node i.
+        direction: 'out' (i -> x), 'in' (x -> i) or 'both'.
+        """
+        base = self.base
+        parts = []
+        if direction in ("out", "both"):
+            if i < base.n:
+                a, b = base.out_indptr[i], base.out_indptr[i + 1]
+                parts.append((base.out_indices[a:b], base.out_rel[a:b], base.out_weight[a:b]))
+            mask = self.delta_src == i
+            parts.append((self.delta_dst[mask], self.delta_rel[mask], self.delta_weight[mask]))
+        if direction in ("in", "both"):
+            if i < base.n:
+                a, b = base.in_indptr[i], base.in_indptr[i + 1]
+                parts.append((base.in_indices[a:b], base.in_rel[a:b], base.in_weight[a:b]))
+            mask = self.delta_dst == i
+            parts.append((self.delta_src[mask], self.delta_rel[mask], self.delta_weight[mask]))
+
+        idx = np.concatenate([p[0] for p in parts])
+        rel = np.concatenate([p[1] for p in parts])
+        weight = np.concatenate([p[2] for p in parts])
+        if relations is not None:
+            mask = np.isin(rel, [relation_code(r) for r in relations])
+            idx, rel, weight = idx[mask], rel[mask], weight[mask]
+        return idx, rel, weight
+
+    def k_hop(
+        self,
+        i: int,
+        k: int = 1,
+        direction: str = "both",
+        relations: Optional[List[str]] = None,
+        limit: int = 200
+    ) -> Dict[int, int]:
+        """
+        Breadth-first expansion up to k hops. Returns {node index: hop distance}.
+        """
+        depth = {i: 0}
+        frontier = [i]
+        for hop in range(1, k + 1):
+            next_frontier = []
+            for node in frontier:
+                idx, _, _ = self.neighbors(node, direction, relations)
+                for j in idx.tolist():
+                    if j not in depth:
+                        depth[j] = hop
+                        next_frontier.append(j)
+                        if len(depth) >= limit:
+                            return depth
+            if not next_frontier:
+                break
+            frontier = next_frontier
+        return depth
+
+    def shortest_path(
+        self,
+        source: int,
+        target: int,
+        relations: Optional[List[str]] = ("Prerequisite",),
+        direction: str = "out"
+    ) -> List[int]:
+        """
+        Unweighted shortest path source -> target (BFS). Prerequisite edges
+        point from the prerequisite to the dependent concept, so the default
+        returns a learning order. Empty list when unreachable.
+        """
+        if source == target:
+            return [source]
+        parent = {source: -1}
+        frontier = [source]
+        while frontier:
+            next_frontier = []
+            for node in frontier:
+                idx, _, _ = self.neighbors(node, direction, list(relations) if relations else None)
+                for j in idx.tolist():
+                    if j in parent:
+                        continue
+                    parent[j] = node
+                    if j == target:
+                        path = [j]
+                        while parent[path[-1]] != -1:
+                            path.append(parent[path[-1]])
+                        return path[::-1]
+                    next_frontier.append(j)
+            frontier = next_frontier
+        return []
+
+    def edge_arrays(self):
+        """All edges as flat (src, dst, relation code, weight) arrays, base then delta."""
+        base = self.base
+        base_src = np.repeat(np.arange(base.n, dtype=np.int32), np.diff(base.out_indptr))
+        return (
+            np.concatenate([base_src, self.delta_src]),
+            np.concatenate([base.out_indices, self.delta_dst]),
+            np.concatenate([base.out_rel, self.delta_rel]),
+            np.concatenate([base.out_weight, self.delta_weight]),
+        )
+
+    def degree(self) -> np.ndarray:
+        if self._degree is None:
+            degree = np.zeros(self.num_nodes, dtype=np.int64)
+            degree[:self.base.n] = np.diff(self.base.out_indptr) + np.diff(self.base.in_indptr)
+            degree += np.bincount(self.delta_src, minlength=self.num_nodes)[:self.num_nodes]
+            degree += np.bincount(self.delta_dst, minlength=self.num_nodes)[:self.num_nodes]
+            self._degree = degree
+        return self._degree
+
+    def rank_neighbors(self, i: int, top: int = 10, direction: str = "both") -> List[int]:
+        """
+        Neighbours ordered by edge weight, tie-broken by how connected they are.
+        """
+        idx, _, weight = self.neighbors(i, direction)
+        if not len(idx):
+            return []
+        score = weight + 0.01 * np.log1p(self.degree()[idx])
+        best = {}
+        for j, s in zip(idx.tolist(), score.tolist()):
+            best[j] = max(best.get(j, s), s)
+        return sorted(best, key=best.get, reverse=True)[:top]
+
+    # ─── Payloads ───
+
+    def node_payload(self, i: int, **extra) -> Dict[str, Any]:
+        return {"id": self.node_ids[i], "label": self.labels[i], "type": self.types[i], **extra}
+
+    def subgraph_payload(self, indices: Iterable[int], depth: Optional[Dict[int, int]] = None) -> Dict[str, Any]:
+        """
+        UI-ready {nodes, edges} for the induced subgraph over `indices`.
+        """
+        indices = list(indices)
+        members = np.zeros(self.num_nodes, dtype=bool)
+        members[indices] = True
+
+        edges = []
+        for i in indices:
+            idx, rel, weight = self.neighbors(i, "out")
+            for j, r, w in zip(idx.tolist(), rel.tolist(), weight.tolist()):
+                if members[j]:
+                    edges.append({
+                        "source": self.node_ids[i],
+                        "target": self.node_ids[j],
+                        "relation": RELATIONS[r],
+                        "weight": w
+                    })
+
+        nodes = [
+            self.node_payload(i, **({"depth": depth[i]} if depth is not None else {}))
+            for i in indices
+        ]
+        return {"nodes": nodes, "edges": edges}
+
+
+class GraphBuilder:
+    """
+    Mutable side of the snapshot: applies new/updated rows in place and
+    hands out immutable GraphSnapshot versions. The delta of edges added since
+    the last compaction is folded into a fresh CSR base once it outgrows a
+    fraction of the graph, so rebuild cost is amortized over the changes.
+    """
+    def __init__(self, compact_min: int = 4096, compact_ratio: float = 0.25, max_pending_edges: int = 10000):
+        self.compact_min = compact_min
+        self.compact_ratio = compact_ratio
+        self.max_pending_edges = max_pending_edges
+        self.node_ids: List[str] = []
+        self.labels: List[str] = []
+        self.types: List[str] = []
+        self.mentions: List[int] = []
+        self.index_of: Dict[str, int] = {}
+        self.label_index: Dict[str, int] = {}
+        self.max_label_words = 1
+
+        self.edge_ids = set()
+        # Edges read before one of their endpoints: applied once both are loaded
+        self.pending_edges: Dict[str, Dict[str, Any]] = {}
+        self.src = GrowableArray(np.int32)
+        self.dst = GrowableArray(np.int32)
+        self.rel = GrowableArray(np.int8)
+        self.weight = GrowableArray(np.float32)
+        self.base = CSRAdjacency(0, *(np.empty(0, dtype=t) for t in (np.int32, np.int32, np.int8, np.float32)))
+        self.base_edges = 0
+        self.version = 0
+
+    def apply(self, node_rows: Iterable[Dict[str, Any]], edge_rows: Iterable[Dict[str, Any]]) -> int:
+        """
+        Upserts nodes and appends unseen edges. Returns the number of changes.
+        Re-applying rows already seen is a no-op, so overlapping reads are safe.
+        Edges whose endpoints aren't loaded yet are held (up to
+        `max_pending_edges`, oldest dropped) and retried on later applies.
+        """
+        changes = 0
+        for row in node_rows:
+            node_id = str(row["id"])
+            label, node_type = row["label"], row["type"]
+            mentions = row.get("mention_count") or 1
+            i = self.index_of.get(node_id)
+            if i is None:
+                i = len(self.node_ids)
+                self.node_ids.append(node_id)
+                self.labels.append(label)
+                self.types.append(node_type)
+                self.mentions.append(mentions)
+                self.index_of[node_id] = i
+            elif (self.labels[i], self.types[i], self.mentions[i]) != (label, node_type, mentions):
+                if self.label_index.get(self.labels[i].lower()) == i:
+                    del self.label_index[self.labels[i].lower()]
+                self.labels[i], self.types[i], self.mentions[i] = label, node_type, mentions
+            else:
+                continue
+            self.label_index[label.lower()] = i
+            self.max_label_words = max(self.max_label_words, len(label.split()))
+            changes += 1
+
+        src, dst, rel, weight = [], [], [], []
+        held, self.pending_edges = self.pending_edges, {}
+        for row in [*held.values(), *edge_rows]:
+            edge_id = str(row.get("id") or (row["source_id"], row["target_id"], row["relation"]))
+            if edge_id in self.edge_ids:
+                continue
+            s = self.index_of.get(str(row["source_id"]))
+            t = self.index_of.get(str(row["target_id"]))
+            if s is None or t is None:
+                self.pending_edges[edge_id] = row
+                continue
+            self.edge_ids.add(edge_id)
+            src.append(s)
+            dst.append(t)
+            rel.append(relation_code(row["relation"]))
+            weight.append(row["weight"] if row.get("weight") is not None else 1.0)
+
+        while len(self.pending_edges) > self.max_pending_edges:
+            self.pending_edges.pop(next(iter(self.pending_edges)))
+
+        if src:
+            self.src.extend(src)
+            self.dst.extend(dst)
+            self.rel.extend(rel)
+            self.weight.extend(weight)
+            changes += len(src)
+
+        if changes:
+            self.version += 1
+            if len(self.src) - self.base_edges > max(self.compact_min, self.compact_ratio * self.base_edges):
+                self.compact()
+        return changes
+
+    def compact(self):
+        """Folds every edge into a new CSR base."""
+        self.base = CSRAdjacency(len(self.node_ids), self.src.view(), self.dst.view(), self.rel.view(), self.weight.view())
+        self.base_edges = len(self.src)
+
+    def snapshot(self) -> GraphSnapshot:
+        start = self.base_edges
+        return GraphSnapshot(
+            self.node_ids, list(self.labels), list(self.types), self.index_of, dict(self.label_index),
+            len(self.node_ids),
+            self.base,
+            (self.src.view(start), self.dst.view(start), self.rel.view(start), self.weight.view(start)),
+            version=self.version,
+            max_label_words=self.max_label_words,
+            mentions=list(self.mentions)
+        )
+
+
+class SnapshotManager:
+    """
+    Keeps the in-process snapshot of one graph scope fresh incrementally.
+    Tracks the newest node `updated_at` and edge `created_at` it has applied
+    and only pulls rows past those watermarks, either on a timer or when a
+    graph write is announced on the event bus (NOTIFY). Readers call `get()`
+    and keep the returned snapshot; refreshes swap in a new object.
+    """
+    def __init__(self, scope: Optional[GraphScope] = None, refresh_interval: float = 30.0):
+        self.scope = scope or GraphScope()
+        self.refresh_interval = refresh_interval
+        self.builder = GraphBuilder()
+        self.snapshot: Optional[GraphSnapshot] = None
+        self.node_watermark = EPOCH
+        self.edge_watermark = EPOCH
+        self.last_refresh = 0.0
+        self._dirty = True
+        # Bumped by reset(): rows fetched under an older generation are discarded
+        self.generation = 0
+        self._snapshot_generation = 0
+        self._lock = asyncio.Lock()
+        predicate, self._scope_params = self.scope.filter(2)
+        self._nodes_sql = NODES_SINCE_SQL.format(scope=predicate)
+        self._edges_sql = EDGES_SINCE_SQL.format(scope=predicate)
+
+    def _on_graph_changed(self, payload: Dict[str, Any]):
+        if payload.get("full"):
+            # Deletes and merges aren't visible to watermark queries
+            self.reset()
+        self._dirty = True
+
+    def reset(self):
+        """
+        Starts over from an empty builder. Called from event handlers, which
+        can't take the lock: a refresh in flight sees the new generation and
+        refetches instead of applying its rows to the fresh builder.
+        """
+        self.generation += 1
+        self.builder = GraphBuilder()
+        self.node_watermark = EPOCH
+        self.edge_watermark = EPOCH
+
+    async def get(self) -> GraphSnapshot:
+        due = time.monotonic() - self.last_refresh > self.refresh_interval
+        if self.snapshot is None or self._dirty or due:
+            await self.refresh()
+        return self.snapshot
+
+    async def refresh(self) -> int:
+        async with self._lock:
+            # Another caller may have refreshed while we waited
+            if self.snapshot is not None and not self._dirty and time.monotonic() - self.last_refresh < 1.0:
+                return 0
+
+            from core.db import get_db_connection
+
+            for _ in range(3):
+                generation = self.generation
+                self._dirty = False
+                conn = await get_db_connection()
+                try:
+                    nodes = await conn.fetch(self._nodes_sql, self.node_watermark - WATERMARK_OVERLAP, *self._scope_params)
+                    edges = await conn.fetch(self._edges_sql, self.edge_watermark - WATERMARK_OVERLAP, *self._scope_params)
+                except Exception:
+                    self._dirty = True
+                    raise
+                finally:
+                    await conn.close()
+                if generation == self.generation:
+                    break
+            else:
+                # Reset on every attempt (a burst of merges): leave it to the next read
+                self._dirty = True
+                return 0
+
+            changes = self.builder.apply(nodes, edges)
+            if nodes:
+                self.node_watermark = max(self.node_watermark, nodes[-1]["updated_at"])
+            if edges:
+                self.edge_watermark = max(self.edge_watermark, edges[-1]["created_at"])
+            if changes or self.snapshot is None or self._snapshot_generation != generation:
+                self.snapshot = self.builder.snapshot()
+                self._snapshot_generation = generation
+                print(f"🗺️ Graph snapshot {self.scope.tenant_id}/{self.scope.subject or '*'} v{self.snapshot.version}: "
+                      f"+{changes} changes ({self.snapshot.num_nodes} nodes, {self.snapshot.num_edges} edges)")
+            self.last_refresh = time.monotonic()
+            return changes
+
+
+class GraphStore:
+    """
+    One SnapshotManager per graph scope (tenant + subject), created on first
+    read and evicted least-recently-used, so each snapshot holds one course's
+    graph and refresh cost tracks that course rather than the platform.
+    Graph-change events only dirty the scopes they touch.
+    """
+    def __init__(self, refresh_interval: float = 30.0, max_scopes: int = 64):
+        self.refresh_interval = refresh_interval
+        self.managers = ScopedRegistry(
+            lambda scope: SnapshotManager(scope, self.refresh_interval),
+            maxsize=max_scopes,
+            channel=GRAPH_CHANNEL
+        )
+
+    def manager(self, scope: Optional[GraphScope] = None) -> SnapshotManager:
+        return self.managers.for_scope(scope)
+
+    async def get(self, scope: Optional[GraphScope] = None) -> GraphSnapshot:
+        return await self.manager(scope).get()
+
+    async def run_periodic(self):
+        """Background refresh loop over the live scopes (started from the app's startup hook)."""
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            for scope, manager in self.managers.items():
+                try:
+                    await manager.refresh()
+                except Exception as e:
+                    print(f"⚠️ Graph snapshot refresh failed for {scope}: {e}")
+
+
+graph_store = GraphStore()
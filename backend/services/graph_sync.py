@@ -0,0 +1,145 @@
+from typing import Dict, Any, List, Optional
+from core.db import get_db_connection
+from core.scope import GraphScope
+
+# Compact wire format: field names once, then positional rows.
+NODE_FIELDS = ["id", "label", "type"]
+EDGE_FIELDS = ["id", "source", "target", "relation", "weight"]
+
+# Above this many changed entities a full snapshot is usually the smaller payload.
+MAX_DELTA_ENTITIES = 5000
+
+# Every transaction older than xmin has finished, so changes logged with a
+# txid below it are final. That makes xmin a gap-free sync cursor, unlike the
+# sequence number (which commits out of order).
+CURSOR_SQL = "SELECT pg_snapshot_xmin(pg_current_snapshot())::text::bigint"
+
+# Changes of one graph scope ({scope} is filled from GraphScope.filter, from $3)
+CHANGES_SQL = """
+    SELECT DISTINCT ON (entity, entity_id) entity, entity_id, op
+    FROM graph_changes
+    WHERE txid >= $1::text::xid8 AND txid < $2::text::xid8 AND {scope}
+    ORDER BY entity, entity_id, version DESC
+"""
+
+HORIZON_SQL = "SELECT horizon::text::bigint FROM graph_change_horizon WHERE id = 1"
+
+# Reads are limited to one graph scope ({scope} is filled from GraphScope.filter).
+NODES_BY_ID_SQL = "SELECT id, label, type FROM knowledge_nodes WHERE id = ANY($1::uuid[]) AND {scope}"
+EDGES_BY_ID_SQL = (
+    "SELECT id, source_id, target_id, relation, weight FROM knowledge_edges WHERE id = ANY($1::uuid[]) AND {scope}"
+)
+ALL_NODES_SQL = "SELECT id, label, type FROM knowledge_nodes WHERE {scope}"
+ALL_EDGES_SQL = "SELECT id, source_id, target_id, relation, weight FROM knowledge_edges WHERE {scope}"
+
+
+def _node_row(r) -> List[Any]:
+    return [str(r["id"]), r["label"], r["type"]]
+
+
+def _edge_row(r) -> List[Any]:
+    return [str(r["id"]), str(r["source_id"]), str(r["target_id"]), r["relation"], r["weight"]]
+
+
+def _payload(version: int, full: bool, nodes, edges, deleted_nodes=(), deleted_edges=()) -> Dict[str, Any]:
+    return {
+        "version": version,
+        "full": full,
+        "nodes": {"fields": NODE_FIELDS, "rows": [_node_row(r) for r in nodes]},
+        "edges": {"fields": EDGE_FIELDS, "rows": [_edge_row(r) for r in edges]},
+        "deleted": {"nodes": list(deleted_nodes), "edges": list(deleted_edges)},
+    }
+
+
+async def full_graph_state(conn=None, scope: Optional[GraphScope] = None) -> Dict[str, Any]:
+    scope = scope or GraphScope()
+    predicate, params = scope.filter(1)
+    own_conn = conn is None
+    if own_conn:
+        conn = await get_db_connection()
+    try:
+        # Cursor first: anything committed after it is re-sent on the next poll
+        version = await conn.fetchval(CURSOR_SQL)
+        nodes = await conn.fetch(ALL_NODES_SQL.format(scope=predicate), *params)
+        edges = await conn.fetch(ALL_EDGES_SQL.format(scope=predicate), *params)
+    finally:
+        if own_conn:
+            await conn.close()
+    return _payload(version, True, nodes, edges)
+
+
+async def graph_changes_since(since: Optional[int], scope: Optional[GraphScope] = None) -> Dict[str, Any]:
+    """
+    Nodes/edges of the scope added or updated since `since` plus tombstones
+    for deletions, or a full snapshot when `since` is missing, older than the
+    retained changelog, or the delta would be larger than the graph is worth.
+    The changelog records each change's scope, so tombstones (and the delta
+    size) only cover this scope's rows.
+    """
+    scope = scope or GraphScope()
+    predicate, params = scope.filter(2)
+    changes_predicate, changes_params = scope.filter(3)
+    conn = await get_db_connection()
+    try:
+        if not since:
+            return await full_graph_state(conn, scope)
+
+        horizon = await conn.fetchval(HORIZON_SQL)
+        if horizon is not None and since <= horizon:
+            return await full_graph_state(conn, scope)
+
+        version = await conn.fetchval(CURSOR_SQL)
+        changes = await conn.fetch(CHANGES_SQL.format(scope=changes_predicate), str(since), str(version), *changes_params)
+        if len(changes) > MAX_DELTA_ENTITIES:
+            return await full_graph_state(conn, scope)
+
+        upserts = {"node": [], "edge": []}
+        deletes = {"node": [], "edge": []}
+        for c in changes:
+            (deletes if c["op"] == "D" else upserts)[c["entity"]].append(c["entity_id"])
+
+        nodes, edges = [], []
+        if upserts["node"]:
+            nodes = await conn.fetch(NODES_BY_ID_SQL.format(scope=predicate), upserts["node"], *params)
+        if upserts["edge"]:
+            edges = await conn.fetch(EDGES_BY_ID_SQL.format(scope=predicate), upserts["edge"], *params)
+    finally:
+        await conn.close()
+
+    return _payload(
+        version, False, nodes, edges,
+        [str(i) for i in deletes["node"]],
+        [str(i) for i in deletes["edge"]]
+    )
+
+
+async def prune_changes(keep_days: int = 7) -> int:
+    """
+    Drops changelog rows older than `keep_days` and advances the horizon so
+    clients with older cursors get a full snapshot instead.
+    """
+    conn = await get_db_connection()
+    try:
+        async with conn.transaction():
+            horizon = await conn.fetchval(
+                "SELECT max(txid)::text FROM graph_changes WHERE changed_at < NOW() - make_interval(days => $1)",
+                keep_days
+            )
+            if horizon is None:
+                return 0
+            deleted = await conn.execute("DELETE FROM graph_changes WHERE txid <= $1::xid8", horizon)
+            await conn.execute(
+                "INSERT INTO graph_change_horizon (id, horizon) VALUES (1, $1::xid8) "
+                "ON CONFLICT (id) DO UPDATE SET horizon = EXCLUDED.horizon",
+                horizon
+            )
+    finally:
+        await conn.close()
+    return int(deleted.split()[-1])
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    removed = asyncio.run(prune_changes())
+    print(f"✅ Pruned {removed} graph change rows.")
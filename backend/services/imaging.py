@@ -0,0 +1,176 @@
+import os
+import time
+import zlib
+import uuid
+import struct
+import asyncio
+import hashlib
+from abc import ABC, abstractmethod
+import contextvars
+from typing import Any, Dict, Optional
+from core.cache import TTLCache
+from core.tracing import span, current_trace_id
+from services.object_store import LocalObjectStore, content_key, get_media_store
+
+
+class ImageProvider(ABC):
+    """
+    Interface for text-to-image backends. `generate` is blocking (vendor SDKs
+    are synchronous); the job queue runs it in a worker thread.
+    """
+    model = "unknown"
+    ext = "png"
+
+    @abstractmethod
+    def generate(self, prompt: str, params: Dict[str, Any]) -> bytes:
+        ...
+
+
+class ImagenProvider(ImageProvider):
+    """Vertex AI Imagen. The SDK and model are loaded on first use, not at import."""
+    def __init__(self, model: str = "imagen-3.0-generate-001"):
+        self.model = model
+        self._client = None
+
+    def _load(self):
+        if self._client is None:
+            import vertexai
+            from vertexai.vision_models import ImageGenerationModel
+            vertexai.init(
+                project=os.getenv("GCP_PROJECT", "mba-copilot-485805"),
+                location=os.getenv("GCP_LOCATION", "us-central1")
+            )
+            self._client = ImageGenerationModel.from_pretrained(self.model)
+        return self._client
+
+    def generate(self, prompt: str, params: Dict[str, Any]) -> bytes:
+        response = self._load().generate_images(prompt=prompt, number_of_images=1, **params)
+        if not response.images:
+            raise RuntimeError("Image model returned no image (prompt may have been filtered)")
+        return response.images[0]._image_bytes
+
+
+class FakeImageProvider(ImageProvider):
+    """
+    Local stand-in for development and tests: a small solid-colour PNG derived
+    from the prompt, after an optional simulated delay.
+    """
+    model = "fake-image"
+
+    def __init__(self, delay: float = 0.0, size: int = 16):
+        self.delay = delay
+        self.size = size
+        self.calls = 0
+
+    def generate(self, prompt: str, params: Dict[str, Any]) -> bytes:
+        self.calls += 1
+        if self.delay:
+            time.sleep(self.delay)
+        r, g, b = hashlib.sha1(prompt.encode("utf-8")).digest()[:3]
+        row = b"\x00" + bytes((r, g, b)) * self.size
+
+        def chunk(kind: bytes, data: bytes) -> bytes:
+            return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+        header = struct.pack(">IIBBBBB", self.size, self.size, 8, 2, 0, 0, 0)
+        return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+                + chunk(b"IDAT", zlib.compress(row * self.size)) + chunk(b"IEND", b""))
+
+
+def default_image_provider() -> ImageProvider:
+    """IMAGE_PROVIDER=fake selects the local fake; anything else uses Imagen."""
+    if os.environ.get("IMAGE_PROVIDER", "imagen") == "fake":
+        return FakeImageProvider()
+    return ImagenProvider(os.environ.get("IMAGE_MODEL", "imagen-3.0-generate-001"))
+
+
+class ImageJobQueue:
+    """
+    Asynchronous image generation. `submit` returns a job at once: already
+    stored images come back done (cached), an identical request in flight is
+    shared, anything else is queued for a fixed pool of workers, so slow
+    model calls never block a graph turn. Results are stored by content key
+    (prompt, model, params), which also makes the final URL known up front.
+    """
+    def __init__(
+        self,
+        provider: Optional[ImageProvider] = None,
+        store: Optional[LocalObjectStore] = None,
+        workers: int = 2,
+        max_queued: int = 100
+    ):
+        self.provider = provider
+        self.store = store
+        self.workers = workers
+        self.queue: Optional[asyncio.Queue] = None
+        self.max_queued = max_queued
+        self.jobs = TTLCache(maxsize=4096, ttl=3600)
+        self.in_flight: Dict[str, Dict[str, Any]] = {}
+        self._tasks = []
+
+    def _ensure_started(self):
+        if self.provider is None:
+            self.provider = default_image_provider()
+        if self.store is None:
+            self.store = get_media_store()
+        if self.queue is None:
+            self.queue = asyncio.Queue(maxsize=self.max_queued)
+        self._tasks = [t for t in self._tasks if not t.done()]
+        while len(self._tasks) < self.workers:
+            # Workers outlive the request that started them: don't inherit its trace
+            self._tasks.append(asyncio.create_task(self._worker(), context=contextvars.Context()))
+
+    def submit(self, prompt: str, **params) -> Dict[str, Any]:
+        self._ensure_started()
+        key = content_key("image", prompt=prompt, model=self.provider.model, params=params)
+        ext = self.provider.ext
+        url = self.store.url(key, ext)
+
+        if key in self.in_flight:
+            return self.in_flight[key]
+
+        job = {"id": uuid.uuid4().hex, "key": key, "url": url, "status": "queued", "cached": False, "error": None}
+        trace_id = current_trace_id()
+        if self.store.exists(key, ext):
+            job.update(status="done", cached=True)
+        else:
+            try:
+                self.queue.put_nowait((job, prompt, params, trace_id))
+                self.in_flight[key] = job
+            except asyncio.QueueFull:
+                job.update(status="failed", error="Image queue is full, try again shortly")
+        self.jobs.set(job["id"], job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.jobs.get(job_id)
+
+    async def wait(self, job_id: str, timeout: float = 30.0) -> Optional[Dict[str, Any]]:
+        """Polls until the job finishes (for tests and CLI use; the API returns immediately)."""
+        deadline = time.monotonic() + timeout
+        job = self.get(job_id)
+        while job is not None and job["status"] in ("queued", "running") and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+        return job
+
+    async def _worker(self):
+        while True:
+            job, prompt, params, trace_id = await self.queue.get()
+            job["status"] = "running"
+            start = time.perf_counter()
+            try:
+                # Joins the submitting request's trace, after its response was sent
+                with span("image.generate", trace_id=trace_id, model=self.provider.model, job_id=job["id"]):
+                    data = await asyncio.to_thread(self.provider.generate, prompt, params)
+                    await asyncio.to_thread(self.store.put, job["key"], self.provider.ext, data)
+                job["status"] = "done"
+                print(f"🎨 Image {job['key'][:12]} generated in {(time.perf_counter() - start) * 1000:.0f}ms")
+            except Exception as e:
+                job.update(status="failed", error=str(e))
+                print(f"❌ Image generation failed: {e}")
+            finally:
+                self.in_flight.pop(job["key"], None)
+                self.queue.task_done()
+
+
+image_jobs = ImageJobQueue(workers=int(os.environ.get("ARTIST_WORKERS", "2")))
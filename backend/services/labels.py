@@ -0,0 +1,352 @@
+import re
+import json
+import time
+import asyncio
+import numpy as np
+from typing import List, Dict, Any, Optional, Set, Tuple, Iterable
+from core.events import GRAPH_CHANNEL
+from core.scope import GraphScope, ScopedRegistry
+from services.graph_snapshot import EPOCH, WATERMARK_OVERLAP
+
+# Words skipped when forming an acronym ("Cost of Capital" -> "cc").
+ACRONYM_SKIP = {"a", "an", "and", "for", "in", "of", "on", "the", "to", "vs"}
+
+PARENTHETICAL_RE = re.compile(r"\(([^)]*)\)")
+NON_WORD_RE = re.compile(r"[^a-z0-9]+")
+
+# Embedding fallback: cosine needed to treat a new concept as an existing one.
+NN_MATCH_THRESHOLD = 0.95
+# Cosine that confirms a trie prefix / abbreviation candidate ("Cap. Budg." ->
+# Capital Budgeting). Lower than the blind threshold because the label agrees
+# too, but required: "Risk" is a prefix of "Risk Premium" and not the same concept.
+CANDIDATE_MATCH_THRESHOLD = 0.85
+
+LABELS_SINCE_SQL = """
+    SELECT id, label, metadata->'aliases' AS aliases, embedding::text AS embedding, updated_at
+    FROM knowledge_nodes
+    WHERE {scope} AND updated_at > $1
+    ORDER BY updated_at
+"""
+
+
+def _singular(word: str) -> str:
+    if len(word) > 3 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def normalize_label(label: str) -> str:
+    """
+    Canonical comparison form: lowercase, parentheticals and punctuation
+    dropped, leading article removed, simple plurals singularized.
+    "The Net Present Values (NPV)" -> "net present value"
+    """
+    text = PARENTHETICAL_RE.sub(" ", label.lower())
+    words = NON_WORD_RE.sub(" ", text).split()
+    if len(words) > 1 and words[0] in ("the", "a", "an"):
+        words = words[1:]
+    return " ".join(_singular(w) for w in words)
+
+
+def acronym(label: str) -> str:
+    """Initials of a multi-word label ("" for single words)."""
+    words = [w for w in normalize_label(label).split() if w not in ACRONYM_SKIP]
+    return "".join(w[0] for w in words) if len(words) > 1 else ""
+
+
+def label_forms(label: str) -> Set[str]:
+    """
+    Every form a label may be written in: its normalized form, the text of
+    any parenthetical, and the acronym of a multi-word label.
+    "Net present value (NPV)" -> {"net present value", "npv"}
+    """
+    forms = {normalize_label(label), acronym(label)}
+    for inner in PARENTHETICAL_RE.findall(label):
+        forms.add(normalize_label(inner))
+    forms.discard("")
+    return forms
+
+
+def labels_compatible(a: str, b: str) -> bool:
+    """True when two labels plausibly name the same concept (a shared form)."""
+    return bool(label_forms(a) & label_forms(b))
+
+
+END = "$"  # trie terminal key (normalized forms never contain "$")
+
+
+class LabelTrie:
+    """
+    Character trie over normalized labels. Terminals hold node ids.
+    Supports prefix completion ("capital budg") and per-word abbreviation
+    matching ("cap. budg." -> "capital budgeting").
+    """
+    def __init__(self):
+        self.root: Dict[str, Any] = {}
+
+    def insert(self, form: str, node_id: str):
+        node = self.root
+        for ch in form:
+            node = node.setdefault(ch, {})
+        node.setdefault(END, set()).add(node_id)
+
+    def remove(self, form: str, node_id: str):
+        node = self.root
+        for ch in form:
+            node = node.get(ch)
+            if node is None:
+                return
+        node.get(END, set()).discard(node_id)
+
+    def _walk(self, prefix: str) -> Optional[Dict[str, Any]]:
+        node = self.root
+        for ch in prefix:
+            node = node.get(ch)
+            if node is None:
+                return None
+        return node
+
+    def complete(self, prefix: str, limit: int = 2) -> Set[str]:
+        """Ids of labels starting with `prefix` (stops once `limit` are found)."""
+        found: Set[str] = set()
+        start = self._walk(prefix)
+        stack = [start] if start is not None else []
+        while stack and len(found) < limit:
+            node = stack.pop()
+            found |= node.get(END, set())
+            stack.extend(child for ch, child in node.items() if ch != END)
+        return found
+
+    def abbreviations(self, words: List[str], limit: int = 2) -> Set[str]:
+        """Ids of labels with the same word count where each word starts with the matching query word."""
+        found: Set[str] = set()
+
+        def match(node, wi, pos):
+            if len(found) >= limit:
+                return
+            word = words[wi]
+            if pos < len(word):
+                child = node.get(word[pos])
+                if child is not None:
+                    match(child, wi, pos + 1)
+                return
+            # Query word used up: skip the rest of this label word
+            stack = [node]
+            while stack:
+                n = stack.pop()
+                if wi == len(words) - 1:
+                    found.update(n.get(END, ()))
+                for ch, child in n.items():
+                    if ch == " ":
+                        if wi + 1 < len(words):
+                            match(child, wi + 1, 0)
+                    elif ch != END:
+                        stack.append(child)
+
+        if words:
+            match(self.root, 0, 0)
+        return found
+
+
+class LabelIndex:
+    """
+    In-memory canonical index of concept labels, so the Scribe can map an
+    extracted label to an existing node without a DB round trip or an
+    embedding. `resolve` matches the normalized form, then aliases (acronyms,
+    parentheticals, labels merged by dedup). Trie prefix and abbreviation
+    matches are only `candidates`: `nearest` accepts one when the embeddings
+    agree, and otherwise falls back to the nearest neighbour overall.
+    Holds one scope's labels, synced incrementally from knowledge_nodes by
+    `updated_at` watermark.
+    """
+    def __init__(self, scope: Optional[GraphScope] = None, refresh_interval: float = 30.0):
+        self.scope = scope or GraphScope()
+        self.refresh_interval = refresh_interval
+        # Bumped by reset(): rows fetched under an older generation are discarded
+        self.generation = 0
+        self.reset()
+        self._dirty = True
+        self._lock = asyncio.Lock()
+        predicate, self._scope_params = self.scope.filter(2)
+        self._sql = LABELS_SINCE_SQL.format(scope=predicate)
+
+    def reset(self):
+        self.generation += 1
+        self.primary: Dict[str, List[str]] = {}
+        self.aliases: Dict[str, List[str]] = {}
+        self.entries: Dict[str, Tuple[str, Set[str]]] = {}
+        self.trie = LabelTrie()
+        self.vector_ids: List[str] = []
+        self.vector_row: Dict[str, int] = {}
+        self.vectors = np.zeros((0, 0), dtype=np.float32)
+        self.watermark = EPOCH
+        self.last_refresh = 0.0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def _on_graph_changed(self, payload: Dict[str, Any]):
+        if payload.get("full"):
+            self.reset()
+        self._dirty = True
+
+    # ─── Maintenance ───
+
+    def add(self, node_id: str, label: str, embedding=None, aliases: Iterable[str] = ()):
+        node_id = str(node_id)
+        if node_id in self.entries:
+            # A relabel without a new embedding keeps the node's vector
+            if embedding is None and node_id in self.vector_row:
+                embedding = self.vectors[self.vector_row[node_id]].copy()
+            self.remove(node_id)
+        primary = normalize_label(label)
+        forms = set(label_forms(label))
+        for alias in aliases:
+            forms |= label_forms(alias)
+        self.primary.setdefault(primary, []).append(node_id)
+        for form in forms - {primary}:
+            self.aliases.setdefault(form, []).append(node_id)
+        self.trie.insert(primary, node_id)
+        self.entries[node_id] = (primary, forms)
+        if embedding is not None:
+            self._set_vector(node_id, embedding)
+
+    def remove(self, node_id: str):
+        entry = self.entries.pop(str(node_id), None)
+        if entry is None:
+            return
+        primary, forms = entry
+        self.primary.get(primary, []).remove(node_id)
+        for form in forms - {primary}:
+            if node_id in self.aliases.get(form, ()):
+                self.aliases[form].remove(node_id)
+        self.trie.remove(primary, node_id)
+        self._drop_vector(node_id)
+
+    def _drop_vector(self, node_id: str):
+        """Removes the node's row so `nearest` can't return it; the last row fills the gap."""
+        row = self.vector_row.pop(node_id, None)
+        if row is None:
+            return
+        last = len(self.vector_ids) - 1
+        if row != last:
+            moved = self.vector_ids[last]
+            self.vectors[row] = self.vectors[last]
+            self.vector_ids[row] = moved
+            self.vector_row[moved] = row
+        self.vector_ids.pop()
+
+    def _set_vector(self, node_id: str, embedding):
+        vec = np.asarray(embedding, dtype=np.float32)
+        vec = vec / max(float(np.linalg.norm(vec)), 1e-12)
+        row = self.vector_row.get(node_id)
+        if row is None:
+            if len(self.vector_ids) == len(self.vectors):
+                # Capacity doubling keeps appends amortized O(1)
+                grown = np.zeros((max(64, 2 * len(self.vectors)), len(vec)), dtype=np.float32)
+                if self.vector_ids:
+                    grown[:len(self.vector_ids)] = self.vectors[:len(self.vector_ids)]
+                self.vectors = grown
+            row = len(self.vector_ids)
+            self.vector_ids.append(node_id)
+            self.vector_row[node_id] = row
+        self.vectors[row] = vec
+
+    # ─── Lookup ───
+
+    def resolve(self, label: str) -> Optional[str]:
+        """Id of the existing node this label names (normalized form or alias), or None."""
+        primary = normalize_label(label)
+        if self.primary.get(primary):
+            return self.primary[primary][0]
+
+        # Two multi-word labels sharing initials ("Market Mix", "Marketing Mix")
+        # are not the same concept: the query's own acronym only matches a label
+        # written as that acronym.
+        initials = acronym(label)
+        matches: Set[str] = set(self.primary.get(initials, ())) if initials else set()
+        written = {normalize_label(inner) for inner in PARENTHETICAL_RE.findall(label)}
+        for form in label_forms(label) - ({initials} - written):
+            matches.update(self.primary.get(form, ()))
+            matches.update(self.aliases.get(form, ()))
+        # Several matches: ambiguous (e.g. an acronym shared by two concepts)
+        return matches.pop() if len(matches) == 1 else None
+
+    def candidates(self, label: str) -> Set[str]:
+        """
+        Ids of labels this one may abbreviate: trie completions of a single
+        word ("capital budg") or per-word abbreviations ("Cap. Budg.").
+        Not matches by themselves; `nearest` confirms them by embedding.
+        """
+        words = normalize_label(label).split()
+        if len(words) == 1 and len(words[0]) >= 4:
+            return self.trie.complete(words[0])
+        if len(words) > 1 and all(len(w) >= 3 for w in words):
+            return self.trie.abbreviations(words)
+        return set()
+
+    def nearest(
+        self,
+        embeddings,
+        threshold: float = NN_MATCH_THRESHOLD,
+        candidates: Optional[List[Set[str]]] = None
+    ) -> List[Optional[str]]:
+        """
+        For each embedding, the id of the most similar indexed node at or
+        above `threshold`. With `candidates` (one set per embedding), the most
+        similar candidate at or above CANDIDATE_MATCH_THRESHOLD is preferred.
+        """
+        if not len(self.vector_ids) or not len(embeddings):
+            return [None] * len(embeddings)
+        queries = np.asarray(embeddings, dtype=np.float32)
+        queries = queries / np.maximum(np.linalg.norm(queries, axis=1, keepdims=True), 1e-12)
+        sims = queries @ self.vectors[:len(self.vector_ids)].T
+        best = sims.argmax(axis=1)
+        matches = []
+        for i, j in enumerate(best.tolist()):
+            rows = [self.vector_row[c] for c in (candidates[i] if candidates else ()) if c in self.vector_row]
+            confirmed = max(rows, key=lambda r: sims[i, r], default=None)
+            if confirmed is not None and sims[i, confirmed] >= CANDIDATE_MATCH_THRESHOLD:
+                matches.append(self.vector_ids[confirmed])
+            else:
+                matches.append(self.vector_ids[j] if sims[i, j] >= threshold else None)
+        return matches
+
+    # ─── Sync ───
+
+    async def refresh(self) -> int:
+        """Applies rows changed since the last sync. Returns how many were applied."""
+        if not self._dirty and time.monotonic() - self.last_refresh < self.refresh_interval:
+            return 0
+        async with self._lock:
+            from core.db import get_db_connection
+
+            generation = self.generation
+            self._dirty = False
+            conn = await get_db_connection()
+            try:
+                rows = await conn.fetch(self._sql, self.watermark - WATERMARK_OVERLAP, *self._scope_params)
+            except Exception:
+                self._dirty = True
+                raise
+            finally:
+                await conn.close()
+            if generation != self.generation:
+                # Reset (a "full" graph event) while fetching: these rows belong to the old index
+                self._dirty = True
+                return 0
+
+            for r in rows:
+                aliases = json.loads(r["aliases"]) if r["aliases"] else []
+                embedding = np.fromstring(r["embedding"][1:-1], sep=",") if r["embedding"] else None
+                self.add(str(r["id"]), r["label"], embedding, aliases)
+            if rows:
+                self.watermark = max(self.watermark, rows[-1]["updated_at"])
+            self.last_refresh = time.monotonic()
+            return len(rows)
+
+
+# One index per graph scope: a label only resolves to a concept of the same course.
+label_indexes = ScopedRegistry(LabelIndex, channel=GRAPH_CHANNEL)
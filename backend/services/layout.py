@@ -0,0 +1,204 @@
+import hashlib
+import asyncio
+import numpy as np
+from typing import List, Dict, Any, Optional, Tuple
+from core.cache import TTLCache
+
+# Above this many nodes, repulsion is approximated through grid-cell centroids.
+EXACT_REPULSION_MAX_NODES = 400
+MAX_GRID_SIDE = 16
+
+
+def _pull_from(pos: np.ndarray, points: np.ndarray, masses: np.ndarray, k: float) -> np.ndarray:
+    """Repulsion on every row of `pos` from weighted `points`; x and y kept separate to avoid 3-D temporaries."""
+    dx = pos[:, 0:1] - points[None, :, 0]
+    dy = pos[:, 1:2] - points[None, :, 1]
+    scale = (k * k) * masses / np.maximum(dx * dx + dy * dy, 1e-4)
+    return np.stack([(dx * scale).sum(axis=1), (dy * scale).sum(axis=1)], axis=1)
+
+
+def _repulsion_exact(pos: np.ndarray, k: float) -> np.ndarray:
+    # The self term has dx = dy = 0, so it contributes nothing
+    return _pull_from(pos, pos, np.ones(len(pos)), k)
+
+
+def _repulsion_grid(pos: np.ndarray, k: float) -> np.ndarray:
+    """
+    Each node is repelled by the mass-weighted centroid of every grid cell
+    (its own cell's centroid excludes itself). O(n * cells) instead of O(n^2).
+    """
+    n = len(pos)
+    side = int(min(MAX_GRID_SIDE, max(2, np.ceil(np.sqrt(n / 16)))))
+    lo = pos.min(axis=0)
+    span = np.maximum(pos.max(axis=0) - lo, 1e-6)
+    cell_xy = np.minimum((((pos - lo) / span) * side).astype(np.int64), side - 1)
+    cell = cell_xy[:, 0] * side + cell_xy[:, 1]
+
+    counts = np.bincount(cell, minlength=side * side).astype(np.float64)
+    sums = np.zeros((side * side, 2))
+    np.add.at(sums, cell, pos)
+    occupied = counts > 0
+    centroids = sums[occupied] / counts[occupied, None]
+    masses = counts[occupied]
+
+    force = _pull_from(pos, centroids, masses, k)
+
+    # Replace the own-cell term with the centroid of the cell's *other* nodes
+    occupied_index = np.cumsum(occupied) - 1
+    own = occupied_index[cell]
+    own_delta = pos - centroids[own]
+    own_dist2 = np.maximum((own_delta ** 2).sum(-1), 1e-4)
+    force -= own_delta * (masses[own] * k * k / own_dist2)[:, None]
+    others = masses[own] - 1
+    has_others = others > 0
+    other_centroid = np.where(
+        has_others[:, None],
+        (sums[cell] - pos) / np.maximum(others, 1)[:, None],
+        pos
+    )
+    other_delta = pos - other_centroid
+    other_dist2 = np.maximum((other_delta ** 2).sum(-1), 1e-4)
+    force += np.where(has_others[:, None], other_delta * (others * k * k / other_dist2)[:, None], 0.0)
+    return force
+
+
+def force_layout(
+    n: int,
+    src: np.ndarray,
+    dst: np.ndarray,
+    weight: Optional[np.ndarray] = None,
+    init: Optional[np.ndarray] = None,
+    iterations: int = 150,
+    temperature: float = 0.1,
+    seed: int = 7
+) -> np.ndarray:
+    """
+    Fruchterman–Reingold layout, fully vectorized with NumPy. Returns raw
+    (n, 2) coordinates; `init` warm-starts from a previous run's raw output,
+    paired with a low temperature so the picture barely moves.
+    """
+    if n == 0:
+        return np.zeros((0, 2))
+    rng = np.random.default_rng(seed)
+    pos = init.copy() if init is not None else rng.uniform(-1, 1, size=(n, 2))
+    k = np.sqrt(4.0 / n)
+    weight = np.ones(len(src)) if weight is None else np.asarray(weight, dtype=np.float64)
+    repulsion = _repulsion_exact if n <= EXACT_REPULSION_MAX_NODES else _repulsion_grid
+
+    for step in range(iterations):
+        disp = repulsion(pos, k)
+
+        if len(src):
+            delta = pos[dst] - pos[src]
+            dist = np.maximum(np.sqrt((delta ** 2).sum(-1)), 1e-4)
+            pull = delta * (dist * weight / k)[:, None]
+            np.add.at(disp, src, pull)
+            np.add.at(disp, dst, -pull)
+
+        # Cool linearly; cap each node's move at the current temperature
+        t = temperature * (1 - step / iterations)
+        length = np.maximum(np.sqrt((disp ** 2).sum(-1)), 1e-9)
+        pos += disp * (np.minimum(length, t) / length)[:, None]
+    return pos
+
+
+def normalize(pos: np.ndarray) -> np.ndarray:
+    """Centers and scales coordinates into [-1, 1]."""
+    if not len(pos):
+        return pos
+    pos = pos - pos.mean(axis=0)
+    scale = np.abs(pos).max()
+    return pos / scale if scale > 0 else pos
+
+
+def subgraph_hash(node_ids: List[str], edges: List[Tuple[str, str]]) -> str:
+    h = hashlib.sha1()
+    for node_id in sorted(node_ids):
+        h.update(node_id.encode())
+        h.update(b"\0")
+    h.update(b"|")
+    for s, t in sorted(edges):
+        h.update(f"{s}>{t}".encode())
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class LayoutService:
+    """
+    Computes and caches node coordinates for graph views.
+    Results are cached by (subgraph hash, params). When a view changes by a
+    few nodes, the last layout of the same scope seeds the new one: known
+    nodes keep their positions, new nodes start beside their neighbours, and
+    a short low-temperature run settles them.
+    """
+    def __init__(self, warm_start_min_overlap: float = 0.5):
+        self.cache = TTLCache(maxsize=256, ttl=3600)
+        self.last_by_scope = TTLCache(maxsize=256, ttl=24 * 3600)
+        self.warm_start_min_overlap = warm_start_min_overlap
+
+    async def layout(
+        self,
+        node_ids: List[str],
+        edges: List[Tuple[str, str, float]],
+        scope: str = "global",
+        iterations: int = 150,
+        seed: int = 7
+    ) -> Dict[str, Any]:
+        key = (subgraph_hash(node_ids, [(s, t) for s, t, _ in edges]), iterations, seed)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return {**cached, "cached": True}
+
+        previous = self.last_by_scope.get(scope) or {}
+        # CPU-bound: keep it off the event loop
+        raw, warm = await asyncio.to_thread(self._compute, node_ids, edges, previous, iterations, seed)
+
+        # Warm starts need the raw coordinates: rescaled ones are off-equilibrium
+        self.last_by_scope.set(scope, dict(zip(node_ids, raw)))
+        positions = {
+            node_id: [round(float(x), 4), round(float(y), 4)]
+            for node_id, (x, y) in zip(node_ids, normalize(raw))
+        }
+        result = {"hash": key[0], "positions": positions, "warm_start": warm}
+        self.cache.set(key, result)
+        return {**result, "cached": False}
+
+    def _compute(self, node_ids, edges, previous, iterations, seed):
+        index = {node_id: i for i, node_id in enumerate(node_ids)}
+        pairs = [(index[s], index[t], w) for s, t, w in edges if s in index and t in index]
+        src = np.array([p[0] for p in pairs], dtype=np.int64)
+        dst = np.array([p[1] for p in pairs], dtype=np.int64)
+        weight = np.array([p[2] for p in pairs], dtype=np.float64)
+
+        known = [node_id in previous for node_id in node_ids]
+        warm = bool(node_ids) and sum(known) / len(node_ids) >= self.warm_start_min_overlap
+        init = None
+        if warm:
+            init = self._seed_positions(node_ids, previous, src, dst, seed)
+            # Mostly-settled picture: short, cool run so known nodes barely move
+            iterations, temperature = max(20, iterations // 4), 0.02
+        else:
+            temperature = 0.1
+
+        pos = force_layout(len(node_ids), src, dst, weight, init=init, iterations=iterations, temperature=temperature, seed=seed)
+        return pos, warm
+
+    def _seed_positions(self, node_ids, previous, src, dst, seed) -> np.ndarray:
+        rng = np.random.default_rng(seed)
+        pos = np.zeros((len(node_ids), 2))
+        placed = np.zeros(len(node_ids), dtype=bool)
+        for i, node_id in enumerate(node_ids):
+            if node_id in previous:
+                pos[i] = previous[node_id]
+                placed[i] = True
+
+        # New nodes: centroid of already-placed neighbours, else anywhere
+        for i in np.flatnonzero(~placed):
+            neighbours = np.concatenate([dst[src == i], src[dst == i]])
+            neighbours = neighbours[placed[neighbours]]
+            centre = pos[neighbours].mean(axis=0) if len(neighbours) else rng.uniform(-1, 1, 2)
+            pos[i] = centre + rng.normal(0, 0.05, 2)
+        return pos
+
+
+layout_service = LayoutService()
@@ -0,0 +1,79 @@
+from typing import List, Dict, Any
+from core.cache import TTLCache
+from core.db import get_db_connection
+from core.events import event_bus, MASTERY_CHANNEL
+
+MASTERY_SQL = (
+    "SELECT m.node_id, n.label, m.mastery_level, m.score "
+    "FROM user_mastery m "
+    "JOIN knowledge_nodes n ON m.node_id = n.id "
+    "WHERE m.user_id = $1"
+)
+
+UPSERT_MASTERY_SQL = (
+    "INSERT INTO user_mastery (user_id, node_id, mastery_level, score, last_updated) "
+    "VALUES ($1, $2, $3, $4, NOW()) "
+    "ON CONFLICT (user_id, node_id) DO UPDATE SET "
+    "mastery_level = EXCLUDED.mastery_level, score = EXCLUDED.score, last_updated = NOW()"
+)
+
+
+class MasteryStore:
+    """
+    Per-user mastery rows with a TTL + LRU cache in front of Cloud SQL.
+    Writes go through `update`, which writes the DB, patches the local cache
+    and broadcasts an invalidation so other workers drop their copy.
+    """
+    def __init__(self, maxsize: int = 2048, ttl: float = 300.0):
+        self.cache = TTLCache(maxsize=maxsize, ttl=ttl)
+        # Bumped on every invalidation so an in-flight read can't re-cache stale rows.
+        # Bounded like the rows: a read outlives neither the TTL nor `maxsize` invalidations.
+        self._generation = TTLCache(maxsize=maxsize, ttl=ttl)
+        event_bus.subscribe(MASTERY_CHANNEL, self._on_mastery_changed)
+
+    async def get(self, user_id: str) -> List[Dict[str, Any]]:
+        rows = self.cache.get(user_id)
+        if rows is not None:
+            return rows
+
+        generation = self._generation.get(user_id, 0)
+        conn = await get_db_connection()
+        try:
+            rows = [dict(r) for r in await conn.fetch(MASTERY_SQL, user_id)]
+        finally:
+            await conn.close()
+
+        for row in rows:
+            row["node_id"] = str(row["node_id"])
+        if self._generation.get(user_id, 0) == generation:
+            self.cache.set(user_id, rows)
+        return rows
+
+    async def update(self, user_id: str, node_id: str, mastery_level: str, score: float):
+        conn = await get_db_connection()
+        try:
+            await conn.execute(UPSERT_MASTERY_SQL, user_id, node_id, mastery_level, score)
+        finally:
+            await conn.close()
+
+        # Broadcast first: this drops the entry on every worker, ours included,
+        # and bumps the generation so in-flight reads can't re-cache old rows.
+        rows = self.cache.get(user_id)
+        await event_bus.publish(MASTERY_CHANNEL, {"user_id": str(user_id), "node_id": str(node_id)})
+
+        # Write-through: re-cache our copy with the new row when we already held it
+        if rows is not None and any(r["node_id"] == str(node_id) for r in rows):
+            self.cache.set(user_id, [
+                {**r, "mastery_level": mastery_level, "score": score} if r["node_id"] == str(node_id) else r
+                for r in rows
+            ])
+
+    def invalidate(self, user_id: str):
+        self._generation.set(user_id, self._generation.get(user_id, 0) + 1)
+        self.cache.invalidate(user_id)
+
+    def _on_mastery_changed(self, payload: Dict[str, Any]):
+        self.invalidate(payload["user_id"])
+
+
+mastery_store = MasteryStore()
@@ -0,0 +1,92 @@
+import os
+import json
+import hashlib
+import tempfile
+from typing import Any, Dict, Optional
+
+# URL prefix the API serves stored objects under (see /api/media in main.py).
+MEDIA_URL_PREFIX = "/api/media"
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "jpg": "image/jpeg",
+    "svg": "image/svg+xml",
+    "mp3": "audio/mpeg",
+}
+
+
+def content_key(namespace: str, **parts: Any) -> str:
+    """
+    Stable key for a generated artifact: a hash of everything that determines
+    its bytes (prompt or text, model, parameters). Same inputs, same key.
+    """
+    canonical = json.dumps({"ns": namespace, **parts}, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class LocalObjectStore:
+    """
+    Content-addressed blob store on the local filesystem.
+    Objects are immutable: a key is written once (atomically, via rename) and
+    never changes, so readers and caches can trust any file they find.
+    Files are fanned out by key prefix to keep directories small.
+    """
+    def __init__(self, root: str):
+        self.root = root
+
+    def path(self, key: str, ext: str) -> str:
+        return os.path.join(self.root, key[:2], f"{key}.{ext}")
+
+    def url(self, key: str, ext: str) -> str:
+        return f"{MEDIA_URL_PREFIX}/{key}.{ext}"
+
+    def exists(self, key: str, ext: str) -> bool:
+        return os.path.exists(self.path(key, ext))
+
+    def get(self, key: str, ext: str) -> Optional[bytes]:
+        try:
+            with open(self.path(key, ext), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, key: str, ext: str, data: bytes) -> str:
+        """Stores the bytes under the key (no-op if present) and returns the object's URL."""
+        path = self.path(key, ext)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".part")
+            try:
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp, path)
+            except BaseException:
+                if os.path.exists(tmp):
+                    os.remove(tmp)
+                raise
+        return self.url(key, ext)
+
+    def resolve(self, name: str) -> Optional[Dict[str, str]]:
+        """Maps a served name ("<key>.<ext>") back to its file, or None if unknown/invalid."""
+        key, _, ext = name.partition(".")
+        if ext not in CONTENT_TYPES or len(key) != 64 or any(c not in "0123456789abcdef" for c in key):
+            return None
+        path = self.path(key, ext)
+        if not os.path.exists(path):
+            return None
+        return {"path": path, "media_type": CONTENT_TYPES[ext]}
+
+
+_media_store = None
+
+def get_media_store() -> LocalObjectStore:
+    """
+    Lazily creates the shared store for generated media (diagrams, audio).
+    """
+    global _media_store
+    if _media_store is None:
+        _media_store = LocalObjectStore(os.environ.get(
+            "MEDIA_STORE_PATH",
+            os.path.join(tempfile.gettempdir(), "vidyos", "media")
+        ))
+    return _media_store
@@ -0,0 +1,123 @@
+import json
+import asyncio
+import itertools
+from collections import OrderedDict
+from typing import Dict, Any, List, Set
+from core.events import event_bus, LIVE_GRAPH_CHANNEL
+
+# Postgres caps NOTIFY payloads at 8000 bytes; bigger updates cross workers as a resync hint.
+MAX_BRIDGE_PAYLOAD = 7000
+
+
+class Subscription:
+    """
+    One subscriber's bounded outbox.
+    Messages sharing a `key` (e.g. a node id) replace each other while
+    unsent, so a slow client receives the latest state of each entity rather
+    than every intermediate version. When the outbox is full the oldest
+    message is dropped and the client is told to resync.
+    """
+    _ids = itertools.count()
+
+    def __init__(self, topic: str, maxlen: int = 256):
+        self.topic = topic
+        self.maxlen = maxlen
+        self.id = next(self._ids)
+        self._pending: "OrderedDict[Any, Dict[str, Any]]" = OrderedDict()
+        self._ready = asyncio.Event()
+        self._seq = itertools.count()
+        self.lagged = False
+        self.coalesced = 0
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._pending)
+
+    def offer(self, message: Dict[str, Any]):
+        key = message.get("key")
+        if key is None:
+            key = ("_seq", next(self._seq))
+        if key in self._pending:
+            self._pending[key] = message
+            self.coalesced += 1
+        else:
+            if len(self._pending) >= self.maxlen:
+                self._pending.popitem(last=False)
+                self.dropped += 1
+                self.lagged = True
+            self._pending[key] = message
+        self._ready.set()
+
+    async def next_batch(self, max_items: int = 64) -> List[Dict[str, Any]]:
+        """Waits for at least one message, then drains up to max_items."""
+        await self._ready.wait()
+        batch = []
+        if self.lagged:
+            batch.append({"type": "resync", "topic": self.topic})
+            self.lagged = False
+        while self._pending and len(batch) < max_items:
+            batch.append(self._pending.popitem(last=False)[1])
+        if not self._pending:
+            self._ready.clear()
+        return batch
+
+
+class Broker:
+    """
+    In-process topic fan-out (topics like "session:<id>" or "subject:<name>").
+    Publishing only appends to subscriber outboxes, so it never waits on a
+    slow socket. With the event bridge enabled, messages are relayed to the
+    other workers over LISTEN/NOTIFY.
+    """
+    def __init__(self):
+        self._topics: Dict[str, Set[Subscription]] = {}
+        event_bus.subscribe(LIVE_GRAPH_CHANNEL, self._on_remote)
+
+    def subscriber_count(self, topic: str = None) -> int:
+        if topic is not None:
+            return len(self._topics.get(topic, ()))
+        return sum(len(subs) for subs in self._topics.values())
+
+    def subscribe(self, topic: str, maxlen: int = 256) -> Subscription:
+        sub = Subscription(topic, maxlen=maxlen)
+        self._topics.setdefault(topic, set()).add(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        subs = self._topics.get(sub.topic)
+        if subs is None:
+            return
+        subs.discard(sub)
+        if not subs:
+            del self._topics[sub.topic]
+
+    def publish_local(self, topic: str, message: Dict[str, Any]) -> int:
+        subs = self._topics.get(topic, ())
+        for sub in subs:
+            sub.offer(message)
+        return len(subs)
+
+    async def publish(self, topic: str, message: Dict[str, Any]) -> int:
+        delivered = self.publish_local(topic, message)
+        if event_bus.bridged:
+            payload = {"topic": topic, "message": message}
+            if len(json.dumps(payload, default=str)) > MAX_BRIDGE_PAYLOAD:
+                payload = {"topic": topic, "message": {"type": "resync", "topic": topic}}
+            await event_bus.publish(LIVE_GRAPH_CHANNEL, payload, local=False)
+        return delivered
+
+    def _on_remote(self, payload: Dict[str, Any]):
+        self.publish_local(payload["topic"], payload["message"])
+
+
+broker = Broker()
+
+
+def graph_update_messages(nodes: List[Dict[str, Any]], edges: List[Dict[str, Any]] = ()) -> List[Dict[str, Any]]:
+    """One message per entity, keyed so repeated updates coalesce per subscriber."""
+    messages = [{"type": "node", "key": f"node:{n['id']}", "node": n} for n in nodes]
+    messages.extend(
+        {"type": "edge", "key": f"edge:{e['source']}:{e['target']}:{e['relation']}", "edge": e}
+        for e in edges
+    )
+    return messages
@@ -0,0 +1,189 @@
+import random
+from typing import List, Dict, Any, Optional, Tuple
+from core.db import get_db_connection
+from core.scope import GraphScope
+from core.ratelimit import rate_limiter, estimate_call_tokens
+
+# Standard RRF damping constant: keeps a single first place from dominating.
+RRF_K = 60
+
+HYBRID_SEARCH_SQL = """
+    WITH lexical AS (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY rank DESC) AS rank
+        FROM (
+            SELECT n.id, ts_rank_cd(n.search_tsv, q) AS rank
+            FROM knowledge_nodes n, websearch_to_tsquery('english', $1) q
+            WHERE {lexical_scope} AND n.search_tsv @@ q
+            ORDER BY rank DESC
+            LIMIT $3
+        ) l
+    ),
+    semantic AS (
+        SELECT id, ROW_NUMBER() OVER (ORDER BY distance) AS rank
+        FROM (
+            SELECT id, embedding <=> $2::vector AS distance
+            FROM knowledge_nodes
+            WHERE {vector_scope} AND embedding IS NOT NULL
+            ORDER BY embedding <=> $2::vector
+            LIMIT $3
+        ) s
+    )
+    SELECT n.id, n.label, n.type, n.content, c.lexical_rank, c.vector_rank
+    FROM (
+        SELECT COALESCE(l.id, s.id) AS id, l.rank AS lexical_rank, s.rank AS vector_rank
+        FROM lexical l
+        FULL OUTER JOIN semantic s ON l.id = s.id
+    ) c
+    JOIN knowledge_nodes n ON n.id = c.id
+"""
+
+
+def reciprocal_rank_fusion(
+    rankings: Dict[str, Dict[Any, int]],
+    weights: Dict[str, float],
+    k: int = RRF_K
+) -> List[Tuple[Any, float]]:
+    """
+    Fuses several 1-based rankings ({retriever: {doc_id: rank}}) into one list
+    of (doc_id, score), best first. score = sum(weight / (k + rank)).
+    """
+    scores: Dict[Any, float] = {}
+    for name, ranks in rankings.items():
+        weight = weights.get(name, 1.0)
+        if not weight:
+            continue
+        for doc_id, rank in ranks.items():
+            scores[doc_id] = scores.get(doc_id, 0.0) + weight / (k + rank)
+    return sorted(scores.items(), key=lambda item: item[1], reverse=True)
+
+
+def to_pgvector(embedding: List[float]) -> str:
+    """Serializes an embedding to pgvector's text form for a `$n::vector` cast."""
+    return "[" + ",".join(f"{x:.7g}" for x in embedding) + "]"
+
+
+PREREQUISITES_SQL = """
+    SELECT e.target_id AS for_id, n.id, n.label, n.type, n.content
+    FROM knowledge_edges e
+    JOIN knowledge_nodes n ON n.id = e.source_id
+    WHERE e.target_id = ANY($1::uuid[]) AND e.relation = 'Prerequisite'
+"""
+
+async def fetch_prerequisites(node_ids: List[str], conn=None) -> List[Dict[str, Any]]:
+    """
+    1-hop prerequisites of the given nodes. Scribe stores prerequisite edges
+    as (source = prerequisite, target = dependent concept).
+    """
+    if not node_ids:
+        return []
+
+    own_conn = conn is None
+    if own_conn:
+        conn = await get_db_connection()
+    try:
+        rows = await conn.fetch(PREREQUISITES_SQL, list(node_ids))
+    finally:
+        if own_conn:
+            await conn.close()
+
+    return [
+        {"for_id": str(r["for_id"]), "id": str(r["id"]), "label": r["label"], "type": r["type"], "content": r["content"]}
+        for r in rows
+    ]
+
+
+_bucket_planes: Dict[Tuple[int, int], List[List[float]]] = {}
+
+def embedding_bucket(embedding: List[float], bits: int = 16) -> int:
+    """
+    Locality-sensitive hash of an embedding (random-hyperplane signs), so that
+    near-identical queries share a cache bucket.
+    """
+    key = (len(embedding), bits)
+    planes = _bucket_planes.get(key)
+    if planes is None:
+        rng = random.Random(1729)  # fixed seed: buckets must agree across workers
+        planes = [[rng.gauss(0.0, 1.0) for _ in range(len(embedding))] for _ in range(bits)]
+        _bucket_planes[key] = planes
+
+    bucket = 0
+    for plane in planes:
+        bucket = (bucket << 1) | (sum(p * x for p, x in zip(plane, embedding)) >= 0)
+    return bucket
+
+
+_query_embeddings = None
+
+def get_query_embeddings():
+    global _query_embeddings
+    if _query_embeddings is None:
+        from langchain_google_genai import GoogleGenerativeAIEmbeddings
+        _query_embeddings = GoogleGenerativeAIEmbeddings(
+            model="models/text-embedding-004",
+            task_type="retrieval_query"
+        )
+    return _query_embeddings
+
+
+async def embed_query(text: str) -> List[float]:
+    return await rate_limiter.call(
+        "text-embedding-004",
+        lambda: get_query_embeddings().aembed_query(text),
+        tokens=estimate_call_tokens(text, output=0)
+    )
+
+
+async def hybrid_search(
+    query: str,
+    k: int = 8,
+    lexical_weight: float = 1.0,
+    vector_weight: float = 1.0,
+    candidates: int = 50,
+    embedding: Optional[List[float]] = None,
+    conn=None,
+    scope: Optional[GraphScope] = None
+) -> List[Dict[str, Any]]:
+    """
+    Hybrid retrieval over one scope of `knowledge_nodes` (default: the whole
+    default tenant). Runs a GIN-indexed full-text match on label+content and
+    an HNSW-indexed pgvector similarity search in one round trip, then fuses
+    both rankings with reciprocal rank fusion. Lexical catches exact acronyms
+    ("WACC"), vector catches paraphrases.
+    """
+    if embedding is None:
+        embedding = await embed_query(query)
+
+    scope = scope or GraphScope()
+    lexical_scope, scope_params = scope.filter(4, alias="n")
+    sql = HYBRID_SEARCH_SQL.format(lexical_scope=lexical_scope, vector_scope=scope.literal_filter())
+
+    own_conn = conn is None
+    if own_conn:
+        conn = await get_db_connection()
+    try:
+        rows = await conn.fetch(sql, query, to_pgvector(embedding), candidates, *scope_params)
+    finally:
+        if own_conn:
+            await conn.close()
+
+    by_id = {row["id"]: row for row in rows}
+    fused = reciprocal_rank_fusion(
+        {
+            "lexical": {r["id"]: r["lexical_rank"] for r in rows if r["lexical_rank"] is not None},
+            "vector": {r["id"]: r["vector_rank"] for r in rows if r["vector_rank"] is not None},
+        },
+        {"lexical": lexical_weight, "vector": vector_weight}
+    )
+
+    return [
+        {
+            "id": str(node_id),
+            "label": by_id[node_id]["label"],
+            "type": by_id[node_id]["type"],
+            "content": by_id[node_id]["content"],
+            "score": score,
+            "lexical_rank": by_id[node_id]["lexical_rank"],
+            "vector_rank": by_id[node_id]["vector_rank"],
+        }
+        for node_id, score in fused[:k]
+    ]
@@ -0,0 +1,323 @@
+import os
+import re
+import json
+import math
+import asyncio
+import hashlib
+import tempfile
+from collections import Counter
+from typing import List, Dict, Any, Optional
+from core.scope import GraphScope, ScopedRegistry
+
+# Very common words carry no signal for BM25 and only bloat the postings.
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "how", "in",
+    "is", "it", "of", "on", "or", "that", "the", "this", "to", "was", "what",
+    "when", "where", "which", "who", "why", "with", "does", "do", "can", "you",
+}
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+# Index writes are batched: a changed index is written at most once per this
+# many seconds, however many transcript chunks or Master Docs it received.
+SAVE_DELAY = float(os.environ.get("SEARCH_INDEX_SAVE_DELAY", "5"))
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercases and splits text into index terms (stopwords removed)."""
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+
+class BM25Index:
+    """
+    In-process inverted index with Okapi BM25 scoring.
+    Holds course material (transcripts, Master Docs, graph node content) so
+    research questions can be answered without a network call.
+    """
+    def __init__(self, k1: float = 1.5, b: float = 0.75, path: Optional[str] = None):
+        self.k1 = k1
+        self.b = b
+        self.path = path
+        self.postings: Dict[str, Dict[str, int]] = {}
+        self.doc_terms: Dict[str, Counter] = {}
+        self.doc_lens: Dict[str, int] = {}
+        self.docs: Dict[str, Dict[str, Any]] = {}
+        self.total_len = 0
+        self.dirty = False
+
+    def __len__(self):
+        return len(self.docs)
+
+    def add(self, doc_id: str, text: str, metadata: Optional[Dict[str, Any]] = None):
+        """
+        Indexes a document. Re-adding an existing id replaces it.
+        """
+        if doc_id in self.docs:
+            self.remove(doc_id)
+
+        terms = Counter(tokenize(text))
+        for term, tf in terms.items():
+            self.postings.setdefault(term, {})[doc_id] = tf
+
+        self.doc_terms[doc_id] = terms
+        self.doc_lens[doc_id] = sum(terms.values())
+        self.docs[doc_id] = {"text": text, "metadata": metadata or {}}
+        self.total_len += self.doc_lens[doc_id]
+        self.dirty = True
+
+    def remove(self, doc_id: str) -> bool:
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return False
+
+        for term in terms:
+            docs = self.postings.get(term)
+            if docs is None:
+                continue
+            docs.pop(doc_id, None)
+            if not docs:
+                del self.postings[term]
+
+        self.docs.pop(doc_id, None)
+        self.total_len -= self.doc_lens.pop(doc_id)
+        self.dirty = True
+        return True
+
+    def search(self, query: str, k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Returns the top-k documents for the query, best first.
+        Each hit carries its score, the matched query terms and a snippet.
+        """
+        query_terms = list(dict.fromkeys(tokenize(query)))
+        n_docs = len(self.docs)
+        if not query_terms or not n_docs:
+            return []
+
+        avg_len = self.total_len / n_docs
+        scores: Dict[str, float] = {}
+        matched: Dict[str, List[str]] = {}
+
+        for term in query_terms:
+            docs = self.postings.get(term)
+            if not docs:
+                continue
+            idf = math.log(1 + (n_docs - len(docs) + 0.5) / (len(docs) + 0.5))
+            for doc_id, tf in docs.items():
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_id] / avg_len)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.k1 + 1) / (tf + norm)
+                matched.setdefault(doc_id, []).append(term)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+        return [
+            {
+                "id": doc_id,
+                "score": score,
+                "matched_terms": matched[doc_id],
+                "snippet": self.snippet(doc_id, query_terms),
+                "metadata": self.docs[doc_id]["metadata"],
+            }
+            for doc_id, score in ranked
+        ]
+
+    def snippet(self, doc_id: str, query_terms: List[str], width: int = 40) -> str:
+        """
+        Extracts the `width`-token window of the document that covers the
+        most distinct query terms.
+        """
+        text = self.docs[doc_id]["text"]
+        spans = [(m.group(0).lower(), m.start(), m.end()) for m in re.finditer(r"[A-Za-z0-9]+", text)]
+        if len(spans) <= width:
+            return text.strip()
+
+        # Sliding window over token positions, tracking distinct query-term hits.
+        wanted = set(query_terms)
+        window = Counter(tok for tok, _, _ in spans[:width] if tok in wanted)
+        best_start, best_hits = 0, len(window)
+        for start in range(1, len(spans) - width + 1):
+            leaving, entering = spans[start - 1][0], spans[start + width - 1][0]
+            if leaving in wanted:
+                window[leaving] -= 1
+                if not window[leaving]:
+                    del window[leaving]
+            if entering in wanted:
+                window[entering] += 1
+            if len(window) > best_hits:
+                best_start, best_hits = start, len(window)
+
+        begin = spans[best_start][1]
+        end = spans[best_start + width - 1][2]
+        prefix = "..." if begin > 0 else ""
+        suffix = "..." if end < len(text) else ""
+        return f"{prefix}{text[begin:end].strip()}{suffix}"
+
+    def save(self, path: Optional[str] = None):
+        """
+        Persists the documents to disk. Postings are rebuilt on load.
+        """
+        path = path or self.path
+        if not path:
+            return
+        self._write(path, self._state())
+        self.dirty = False
+
+    async def save_async(self, path: Optional[str] = None):
+        """
+        `save` with the file write in a worker thread. The document table is
+        copied first, on the loop, so adds during the write don't race it.
+        """
+        path = path or self.path
+        if not path:
+            return
+        state = self._state()
+        self.dirty = False
+        try:
+            await asyncio.to_thread(self._write, path, state)
+        except Exception:
+            self.dirty = True
+            raise
+
+    def _state(self) -> Dict[str, Any]:
+        # Document entries are replaced, never mutated: a shallow copy is a consistent view
+        return {"k1": self.k1, "b": self.b, "docs": dict(self.docs)}
+
+    @staticmethod
+    def _write(path: str, state: Dict[str, Any]):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        index = cls(k1=data.get("k1", 1.5), b=data.get("b", 0.75), path=path)
+        for doc_id, doc in data.get("docs", {}).items():
+            index.add(doc_id, doc["text"], doc.get("metadata"))
+        index.dirty = False
+        return index
+
+
+async def sync_nodes_from_db(scope: Optional[GraphScope] = None) -> int:
+    """
+    Indexes every node of one course (scope) into its index. Used to bootstrap an empty index.
+    """
+    from core.db import get_db_connection
+
+    scope = (scope or GraphScope()).writable()
+    index = get_course_index(scope)
+    predicate, params = scope.filter(1)
+    conn = await get_db_connection()
+    try:
+        rows = await conn.fetch(f"SELECT label, type, content FROM knowledge_nodes WHERE {predicate}", *params)
+    finally:
+        await conn.close()
+
+    for row in rows:
+        index.add(
+            f"node:{row['label']}",
+            f"{row['label']}. {row['content'] or ''}",
+            {"source": "knowledge_node", "label": row["label"], "type": row["type"]}
+        )
+    index.save()
+    return len(rows)
+
+
+def course_index_path(scope: GraphScope) -> str:
+    """
+    File of one course's index: SEARCH_INDEX_PATH with the tenant and subject
+    spliced in ("search_index.json" -> "search_index.acme.finance-1a2b3c4d.json").
+    """
+    base = os.environ.get(
+        "SEARCH_INDEX_PATH",
+        os.path.join(tempfile.gettempdir(), "vidyos", "search_index.json")
+    )
+    root, ext = os.path.splitext(base)
+    slug = lambda value: re.sub(r"[^a-z0-9]+", "-", value.lower()).strip("-")[:40] or "x"
+    digest = hashlib.sha1(f"{scope.tenant_id}/{scope.subject}".encode("utf-8")).hexdigest()[:8]
+    return f"{root}.{slug(scope.tenant_id)}.{slug(scope.subject)}-{digest}{ext or '.json'}"
+
+
+def _load_course_index(scope: GraphScope) -> BM25Index:
+    path = course_index_path(scope)
+    try:
+        return BM25Index.load(path)
+    except FileNotFoundError:
+        return BM25Index(path=path)
+    except Exception as e:
+        print(f"⚠️ Search index at {path} unreadable, starting empty: {e}")
+        return BM25Index(path=path)
+
+
+_pending_saves: Dict[int, BM25Index] = {}
+_flush_task: Optional["asyncio.Task"] = None
+
+
+def schedule_save(index: BM25Index, delay: Optional[float] = None):
+    """
+    Writes `index` within `delay` seconds (default SAVE_DELAY), together with
+    every other index changed meanwhile, off the event loop. Without a running
+    loop (scripts) it is written at once.
+    """
+    global _flush_task
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        try:
+            index.save()
+        except OSError as e:
+            print(f"⚠️ Could not persist search index: {e}")
+        return
+    _pending_saves[id(index)] = index
+    # A task of another (closed) loop would never run
+    if _flush_task is None or _flush_task.done() or _flush_task.get_loop() is not loop:
+        _flush_task = asyncio.create_task(_flush_later(SAVE_DELAY if delay is None else delay))
+
+
+async def _flush_later(delay: float):
+    await asyncio.sleep(delay)
+    await flush_indexes()
+
+
+async def flush_indexes():
+    """Writes every index with pending changes now (also called at shutdown)."""
+    while _pending_saves:
+        _, index = _pending_saves.popitem()
+        if not index.dirty:
+            continue
+        try:
+            await index.save_async()
+        except OSError as e:
+            print(f"⚠️ Could not persist search index {index.path}: {e}")
+
+
+# One index per course: material of one tenant / subject never answers another's questions.
+# An evicted index still gets its pending write.
+_course_indexes = ScopedRegistry(_load_course_index, on_evict=schedule_save)
+
+def get_course_index(scope: Optional[GraphScope] = None) -> BM25Index:
+    """
+    Lazily loads one course's (tenant + subject) material index from disk.
+    Material is always written with a concrete subject, so a subject-less
+    scope reads the tenant's default subject, like graph writes.
+    """
+    return _course_indexes.for_scope((scope or GraphScope()).writable())
+
+
+if __name__ == "__main__":
+    import asyncio
+
+    async def sync_all() -> int:
+        from core.db import get_db_connection
+
+        conn = await get_db_connection()
+        try:
+            rows = await conn.fetch("SELECT DISTINCT tenant_id, subject FROM knowledge_nodes")
+        finally:
+            await conn.close()
+        counts = [await sync_nodes_from_db(GraphScope(r["tenant_id"], r["subject"])) for r in rows]
+        return sum(counts)
+
+    count = asyncio.run(sync_all())
+    print(f"✅ Indexed {count} knowledge nodes.")
@@ -0,0 +1,221 @@
+import os
+import re
+import time
+import asyncio
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+from services.object_store import LocalObjectStore, content_key, get_media_store
+
+# Cloud TTS rejects requests over 5000 bytes of input; leave headroom.
+MAX_SEGMENT_BYTES = 4500
+
+SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s+")
+PARAGRAPH_RE = re.compile(r"\n\s*\n")
+
+
+def _size(text: str) -> int:
+    return len(text.encode("utf-8"))
+
+
+def _split_long(sentence: str, limit: int) -> List[str]:
+    """Breaks an over-long sentence at clause boundaries, then at spaces."""
+    pieces, current = [], ""
+    for word in re.split(r"(?<=[,;:])\s+|\s+", sentence):
+        candidate = f"{current} {word}" if current else word
+        if current and _size(candidate) > limit:
+            pieces.append(current)
+            current = word
+        else:
+            current = candidate
+    if current:
+        pieces.append(current)
+    return pieces
+
+
+def split_segments(text: str, limit: int = MAX_SEGMENT_BYTES) -> List[str]:
+    """
+    Splits text into TTS-sized segments on sentence boundaries.
+    Every paragraph starts a new segment, so editing one paragraph leaves the
+    segments (and cache keys) of the others unchanged.
+    """
+    segments = []
+    for paragraph in PARAGRAPH_RE.split(text):
+        current = ""
+        for sentence in SENTENCE_END_RE.split(" ".join(paragraph.split())):
+            if not sentence:
+                continue
+            parts = _split_long(sentence, limit) if _size(sentence) > limit else [sentence]
+            for part in parts:
+                candidate = f"{current} {part}" if current else part
+                if current and _size(candidate) > limit:
+                    segments.append(current)
+                    current = part
+                else:
+                    current = candidate
+        if current:
+            segments.append(current)
+    return segments
+
+
+def _strip_tags(mp3: bytes) -> bytes:
+    """Drops a leading ID3v2 tag and a trailing ID3v1 tag, leaving only MPEG frames."""
+    if mp3[:3] == b"ID3" and len(mp3) >= 10:
+        size = (mp3[6] << 21) | (mp3[7] << 14) | (mp3[8] << 7) | mp3[9]
+        mp3 = mp3[10 + size + (10 if mp3[5] & 0x10 else 0):]
+    if len(mp3) >= 128 and mp3[-128:-125] == b"TAG":
+        mp3 = mp3[:-128]
+    return mp3
+
+
+def concat_mp3(parts: List[bytes]) -> bytes:
+    """
+    Joins MP3 segments by concatenating their frames (no re-encoding).
+    MPEG frames are self-contained, so players decode the result seamlessly
+    once per-file tags are removed.
+    """
+    return b"".join(_strip_tags(p) for p in parts)
+
+
+class SpeechProvider(ABC):
+    """
+    Interface for text-to-speech backends. `synthesize` is blocking (the
+    vendor SDK is synchronous); callers run it in a worker thread.
+    """
+    ext = "mp3"
+
+    @abstractmethod
+    def config_key(self) -> Dict[str, Any]:
+        """Everything besides the text that determines the audio bytes."""
+
+    @abstractmethod
+    def synthesize(self, text: str) -> bytes:
+        ...
+
+
+class GoogleSpeechProvider(SpeechProvider):
+    """Google Cloud Text-to-Speech, MP3 output. The client is created on first use."""
+    def __init__(self, language_code: str = "en-IN", voice_name: Optional[str] = None, speaking_rate: float = 1.0):
+        self.language_code = language_code
+        self.voice_name = voice_name
+        self.speaking_rate = speaking_rate
+        self._client = None
+
+    def config_key(self) -> Dict[str, Any]:
+        return {
+            "provider": "google",
+            "voice": {"language_code": self.language_code, "name": self.voice_name, "gender": "NEUTRAL"},
+            "audio": {"encoding": "MP3", "speaking_rate": self.speaking_rate},
+        }
+
+    def synthesize(self, text: str) -> bytes:
+        from google.cloud import texttospeech
+
+        if self._client is None:
+            self._client = texttospeech.TextToSpeechClient()
+        voice = texttospeech.VoiceSelectionParams(
+            language_code=self.language_code,  # Hinglish friendly or standard Indian English
+            name=self.voice_name,
+            ssml_gender=texttospeech.SsmlVoiceGender.NEUTRAL
+        )
+        audio_config = texttospeech.AudioConfig(
+            audio_encoding=texttospeech.AudioEncoding.MP3,
+            speaking_rate=self.speaking_rate
+        )
+        response = self._client.synthesize_speech(
+            input=texttospeech.SynthesisInput(text=text), voice=voice, audio_config=audio_config
+        )
+        return response.audio_content
+
+
+class FakeSpeechProvider(SpeechProvider):
+    """
+    Local stand-in for development and tests: silent MPEG-1 Layer III frames
+    (one per 100 bytes of text), after an optional simulated delay.
+    """
+    # 128 kbps, 44.1 kHz, no padding: 417-byte frames
+    FRAME = bytes((0xFF, 0xFB, 0x90, 0x64)) + bytes(413)
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls: List[str] = []
+
+    def config_key(self) -> Dict[str, Any]:
+        return {"provider": "fake"}
+
+    def synthesize(self, text: str) -> bytes:
+        self.calls.append(text)
+        if self.delay:
+            time.sleep(self.delay)
+        return self.FRAME * (1 + _size(text) // 100)
+
+
+def default_speech_provider() -> SpeechProvider:
+    """TTS_PROVIDER=fake selects the local fake; anything else uses Cloud TTS."""
+    if os.environ.get("TTS_PROVIDER", "google") == "fake":
+        return FakeSpeechProvider()
+    return GoogleSpeechProvider(os.environ.get("TTS_LANGUAGE", "en-IN"), os.environ.get("TTS_VOICE") or None)
+
+
+class PodcastSynthesizer:
+    """
+    Long-form TTS: splits the script into request-sized segments, synthesizes
+    the missing ones concurrently (at most `concurrency` calls at a time),
+    caches each by (text, voice, audio config) and stitches the MP3 frames.
+    Re-rendering an edited script only synthesizes the segments that changed.
+    Object-store reads and writes run in worker threads, like synthesis.
+    """
+    def __init__(
+        self,
+        provider: Optional[SpeechProvider] = None,
+        store: Optional[LocalObjectStore] = None,
+        concurrency: int = 4,
+        segment_bytes: int = MAX_SEGMENT_BYTES
+    ):
+        self.provider = provider
+        self.store = store
+        self.concurrency = concurrency
+        self.segment_bytes = segment_bytes
+
+    async def synthesize(self, text: str) -> Dict[str, Any]:
+        if self.provider is None:
+            self.provider = default_speech_provider()
+        if self.store is None:
+            self.store = get_media_store()
+        provider, store, ext = self.provider, self.store, self.provider.ext
+
+        segments = split_segments(text, self.segment_bytes)
+        config = provider.config_key()
+        keys = [content_key("tts-segment", text=s, config=config) for s in segments]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        synthesized = 0
+
+        async def render(segment: str, key: str) -> bytes:
+            nonlocal synthesized
+            audio = await asyncio.to_thread(store.get, key, ext)
+            if audio is not None:
+                return audio
+            async with semaphore:
+                audio = await asyncio.to_thread(provider.synthesize, segment)
+            await asyncio.to_thread(store.put, key, ext, audio)
+            synthesized += 1
+            return audio
+
+        start = time.perf_counter()
+        # Duplicate segments (a repeated paragraph) render once
+        unique = dict(zip(keys, segments))
+        rendered = dict(zip(unique, await asyncio.gather(*(render(s, k) for k, s in unique.items()))))
+
+        podcast_key = content_key("podcast", segments=keys)
+        url = store.url(podcast_key, ext)
+        if not await asyncio.to_thread(store.exists, podcast_key, ext):
+            url = await asyncio.to_thread(store.put, podcast_key, ext, concat_mp3([rendered[k] for k in keys]))
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        print(f"🎙️ Podcast: {len(segments)} segments, {synthesized} synthesized, "
+              f"{len(unique) - synthesized} cached in {elapsed_ms:.0f}ms")
+        return {
+            "url": url,
+            "segments": len(segments),
+            "synthesized": synthesized,
+            "cached": len(unique) - synthesized,
+            "elapsed_ms": round(elapsed_ms, 1)
+        }
@@ -5,6 +5,7 @@ import asyncio
 import os
 import sys
 import json
+import tempfile
 
 # Add backend to path so we can import agents
 backend_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -15,6 +16,7 @@ if backend_path not in sys.path:
 os.environ["GCP_PROJECT"] = "test-project"
 os.environ["GCP_LOCATION"] = "us-central1"
 os.environ["GOOGLE_API_KEY"] = "dummy-api-key"
+os.environ["SEARCH_INDEX_PATH"] = os.path.join(tempfile.mkdtemp(), "search_index.json")
 
 # Helper to mock before imports
 def setup_mocks():
@@ -42,13 +44,13 @@ class TestVidyosAgentsMocked(unittest.IsolatedAsyncioTestCase):
 
     async def test_mastermind_routing(self):
         """Tests that MasterMind correctly routes to the Professor agent."""
-        with patch('agents.mastermind.chain.invoke') as mock_invoke:
-            mock_invoke.return_value = MagicMock(content="Professor")
+        with patch('agents.mastermind.chain') as mock_chain:
+            mock_chain.ainvoke = AsyncMock(return_value=MagicMock(content="Professor"))
             state = {
                 "messages": [MagicMock(content="Explain the Capital Asset Pricing Model")],
                 "user_context": {"current_page": "Finance"}
             }
-            result = supervisor_node(state)
+            result = await supervisor_node(state)
             self.assertEqual(result["next"], "ProfessorAgent")
 
     async def test_professor_agent(self):
@@ -56,8 +58,11 @@ class TestVidyosAgentsMocked(unittest.IsolatedAsyncioTestCase):
         agent = ProfessorAgent()
         mock_response = MagicMock(content="CAPM is a model that describes the relationship between systematic risk and expected return.")
         
-        with patch.object(agent.llm, 'ainvoke', new_callable=AsyncMock) as mock_ainvoke:
+        with patch.object(agent.llm, 'ainvoke', new_callable=AsyncMock) as mock_ainvoke, \
+             patch.object(agent, '_retrieve_context', new_callable=AsyncMock) as mock_retrieve, \
+             patch.object(agent, '_critical_concepts', return_value=[]):
             mock_ainvoke.return_value = mock_response
+            mock_retrieve.return_value = ("", False)
             state = {
                 "messages": [MagicMock(content="What is CAPM?")],
                 "user_context": {"current_page": "Finance"}
@@ -66,6 +71,41 @@ class TestVidyosAgentsMocked(unittest.IsolatedAsyncioTestCase):
             self.assertEqual(len(result["messages"]), 1)
             self.assertIn("CAPM", result["messages"][0].content)
 
+    async def test_professor_retrieval_is_cached_per_bucket(self):
+        """Tests that graph context is packed with prerequisites and cached per (scope, bucket)."""
+        from core.scope import GraphScope
+        agent = ProfessorAgent()
+        scope = GraphScope(subject="Finance")
+        nodes = [{"id": "n1", "label": "WACC", "type": "Concept", "content": "Weighted average cost of capital."}]
+        prereqs = [{"for_id": "n1", "id": "n2", "label": "Cost of Equity", "type": "Concept", "content": "CAPM return."}]
+
+        with patch('agents.professor.embed_query', new_callable=AsyncMock) as mock_embed, \
+             patch('agents.professor.get_db_connection', new_callable=AsyncMock) as mock_conn, \
+             patch('agents.professor.hybrid_search', new_callable=AsyncMock) as mock_search, \
+             patch('agents.professor.fetch_prerequisites', new_callable=AsyncMock) as mock_prereqs:
+            mock_embed.return_value = [0.1] * 8
+            mock_search.return_value = nodes
+            mock_prereqs.return_value = prereqs
+
+            context, cached = await agent._retrieve_context(scope, "What is WACC?")
+            self.assertFalse(cached)
+            self.assertIn("WACC [Concept]", context)
+            self.assertIn("requires: Cost of Equity", context)
+
+            again, cached = await agent._retrieve_context(scope, "What is WACC?")
+            self.assertTrue(cached)
+            self.assertEqual(again, context)
+            self.assertEqual(mock_search.call_count, 1)
+            self.assertEqual(mock_search.await_args.kwargs["scope"], scope)
+            mock_conn.return_value.close.assert_awaited_once()
+
+            # New concepts in another course keep this context; in this course they drop it
+            agent._on_graph_changed({"tenant_id": scope.tenant_id, "subject": "Marketing"})
+            self.assertTrue((await agent._retrieve_context(scope, "What is WACC?"))[1])
+            agent._on_graph_changed({"tenant_id": scope.tenant_id, "subject": "Finance", "nodes": 1})
+            self.assertFalse((await agent._retrieve_context(scope, "What is WACC?"))[1])
+            self.assertEqual(mock_search.call_count, 2)
+
     async def test_scribe_agent(self):
         """Tests that the ScribeAgent extracts and 'stores' concepts."""
         agent = ScribeAgent()
@@ -74,7 +114,8 @@ class TestVidyosAgentsMocked(unittest.IsolatedAsyncioTestCase):
             "edges": []
         }
         
-        with patch.object(agent, '_extract_knowledge', new_callable=AsyncMock) as mock_extract:
+        with patch.object(agent, '_extract_knowledge', new_callable=AsyncMock) as mock_extract, \
+             patch.object(agent, '_resolve_nodes', new_callable=AsyncMock, return_value=[(None, [0.1])]):
             mock_extract.return_value = mock_extraction
             with patch.object(agent, '_upsert_node', new_callable=AsyncMock) as mock_upsert:
                 mock_upsert.return_value = "uuid-123"
@@ -87,6 +128,64 @@ class TestVidyosAgentsMocked(unittest.IsolatedAsyncioTestCase):
                 self.assertIn("Extracted 1 new concepts", result["messages"][0])
                 self.assertEqual(result["payload"]["nodes"][0]["id"], "uuid-123")
 
+    async def test_scribe_resolves_known_concepts_without_writing(self):
+        """Tests that labels matching existing nodes of the same course are resolved in bulk and only new ones are embedded and inserted."""
+        from services.labels import LabelIndex
+        from core.scope import GraphScope
+        agent = ScribeAgent()
+        index = LabelIndex()
+        index.add("npv-id", "Net Present Value")
+        index._dirty = False
+        index.last_refresh = float("inf")
+        extraction = {
+            "nodes": [
+                {"label": "NPV", "type": "Concept", "content": "Discounted cash flows."},
+                {"label": "Real Options", "type": "Concept", "content": "Flexibility value."}
+            ],
+            "edges": []
+        }
+
+        with patch('agents.scribe.label_indexes') as mock_indexes, \
+             patch.object(agent, '_extract_knowledge', new_callable=AsyncMock, return_value=extraction), \
+             patch.object(agent, 'embeddings') as mock_embeddings, \
+             patch.object(agent, '_touch_nodes', new_callable=AsyncMock) as mock_touch, \
+             patch.object(agent, '_upsert_node', new_callable=AsyncMock, return_value="ro-id") as mock_upsert, \
+             patch.object(agent, '_broadcast', new_callable=AsyncMock), \
+             patch.object(agent, '_index_segment'):
+            mock_indexes.for_scope.return_value = index
+            mock_embeddings.aembed_documents = AsyncMock(return_value=[[0.0, 1.0]])
+            nodes = await agent.process_transcript("s1", "NPV and real options", GraphScope("t1", "Finance"))
+
+        self.assertEqual([n["id"] for n in nodes], ["npv-id", "ro-id"])
+        mock_touch.assert_awaited_once_with(["npv-id"])
+        mock_embeddings.aembed_documents.assert_awaited_once_with(["Flexibility value."])
+        self.assertEqual(mock_upsert.await_args.args[1:], ([0.0, 1.0], GraphScope("t1", "Finance"), "s1"))
+        mock_indexes.for_scope.assert_called_with(GraphScope("t1", "Finance"))
+
+    async def test_scribe_resolution_survives_batch_embedding_failure(self):
+        """Tests that a failed batch embedding falls back to one call per concept, and a node without content still resolves."""
+        from services.labels import LabelIndex
+        agent = ScribeAgent()
+        index = LabelIndex()
+        index.add("rp-id", "Risk Premium", [0.0, 1.0])
+        index._dirty = False
+        index.last_refresh = float("inf")
+        nodes = [
+            {"label": "Risk", "type": "Concept", "content": "Uncertainty of returns."},
+            {"label": "Beta", "type": "Concept"},
+        ]
+
+        with patch('agents.scribe.label_indexes') as mock_indexes, \
+             patch.object(agent, 'embeddings') as mock_embeddings:
+            mock_indexes.for_scope.return_value = index
+            mock_embeddings.aembed_documents = AsyncMock(side_effect=RuntimeError("quota"))
+            mock_embeddings.aembed_query = AsyncMock(side_effect=[[1.0, 0.0], RuntimeError("quota")])
+            resolved = await agent._resolve_nodes(nodes)
+
+        # "Risk" is only a prefix of "Risk Premium" and its embedding disagrees: a new concept
+        self.assertEqual(resolved, [(None, [1.0, 0.0]), (None, None)])
+        self.assertEqual(mock_embeddings.aembed_query.await_args_list[1].args, ("Beta",))
+
     async def test_research_agent(self):
         """Tests that the ResearchAgent performs search and synthesis."""
         agent = ResearchAgent()
@@ -105,6 +204,44 @@ class TestVidyosAgentsMocked(unittest.IsolatedAsyncioTestCase):
                 self.assertEqual(len(result["messages"]), 1)
                 self.assertIn("market is volatile", result["messages"][0].content)
 
+    async def test_research_agent_prefers_local_index(self):
+        """Tests that good local recall skips hybrid search, query generation and external search."""
+        from services.search_index import get_course_index
+        get_course_index().add("node:WACC", "WACC. Weighted average cost of capital.")
+
+        agent = ResearchAgent()
+        with patch('agents.researcher.hybrid_search', new_callable=AsyncMock) as mock_hybrid, \
+             patch.object(agent, 'llm') as mock_llm:
+            mock_ainvoke = mock_llm.ainvoke = AsyncMock(return_value=MagicMock(content="WACC blends debt and equity costs."))
+            with patch.object(agent, 'search_google', new_callable=AsyncMock) as mock_search:
+                state = {
+                    "messages": [MagicMock(content="Explain weighted average cost of capital")],
+                    "user_context": {}
+                }
+                await agent.run(state)
+                mock_search.assert_not_called()
+                mock_hybrid.assert_not_called()
+                self.assertEqual(mock_ainvoke.call_count, 1)
+                self.assertIn("node:WACC", mock_ainvoke.call_args[0][0])
+
+    async def test_research_agent_fuses_hybrid_search_on_poor_recall(self):
+        """Tests that poor course-index recall adds scoped hybrid search, fused with the BM25 hits."""
+        from core.scope import GraphScope
+        from services.search_index import get_course_index
+        get_course_index(GraphScope("t1", "Finance")).add("segment:1", "Beta measures systematic market risk.")
+        node = {"id": "n1", "label": "CAPM", "type": "Concept", "content": "Capital asset pricing model uses beta.", "score": 0.03}
+
+        agent = ResearchAgent()
+        scope = GraphScope("t1", "Finance")
+        with patch('agents.researcher.hybrid_search', new_callable=AsyncMock, return_value=[node]) as mock_hybrid:
+            hits = await agent.search_local("capital asset pricing beta", scope)
+        self.assertEqual(mock_hybrid.call_args.kwargs["scope"], scope)
+        self.assertEqual({hit["id"] for hit in hits}, {"segment:1", "node:CAPM"})
+
+        with patch('agents.researcher.hybrid_search', new_callable=AsyncMock, side_effect=OSError("db down")):
+            hits = await agent.search_local("capital asset pricing beta", scope)
+        self.assertEqual([hit["id"] for hit in hits], ["segment:1"])
+
     async def test_curriculum_master(self):
         """Tests that the CurriculumMaster adjusts content level."""
         agent = CurriculumMaster()
@@ -122,9 +259,28 @@ class TestVidyosAgentsMocked(unittest.IsolatedAsyncioTestCase):
                 result = await agent.run(state)
                 self.assertIn("beginner", result["messages"][0].content.lower())
 
+    async def test_curriculum_prunes_mastery_to_relevant_rows(self):
+        """Tests that large mastery profiles are pruned to retrieval hits and prerequisites."""
+        agent = CurriculumMaster()
+        rows = [
+            {"node_id": f"n{i}", "label": f"Concept {i}", "mastery_level": "Beginner", "score": 0.5}
+            for i in range(400)
+        ]
+        with patch('agents.curriculum.hybrid_search', new_callable=AsyncMock) as mock_search, \
+             patch('agents.curriculum.fetch_prerequisites', new_callable=AsyncMock) as mock_prereqs:
+            mock_search.return_value = [{"id": "n42"}]
+            mock_prereqs.return_value = [{"for_id": "n42", "id": "n7"}]
+            context = await agent._select_mastery_context("Explain concept 42", rows)
+
+        self.assertEqual(context.splitlines(), ["Concept 42|Beginner|0.50", "Concept 7|Beginner|0.50"])
+
     async def test_artist_agent(self):
-        """Tests that the ArtistAgent returns an image payload."""
-        agent = ArtistAgent()
+        """Tests that the ArtistAgent queues an image job and serves repeats from the cache."""
+        from services.imaging import ImageJobQueue, FakeImageProvider
+        from services.object_store import LocalObjectStore
+        provider = FakeImageProvider()
+        store = LocalObjectStore(tempfile.mkdtemp())
+        agent = ArtistAgent(jobs=ImageJobQueue(provider, store, workers=2))
         
         state = {
             "messages": [MagicMock(content="Draw a supply and demand curve")],
@@ -134,16 +290,71 @@ class TestVidyosAgentsMocked(unittest.IsolatedAsyncioTestCase):
         response_data = json.loads(result["messages"][0])
         self.assertEqual(response_data["type"], "image")
         self.assertIn("generating a visual diagram", response_data["text"])
+        self.assertEqual(response_data["payload"]["status"], "queued")
+
+        job = await agent.jobs.wait(response_data["payload"]["job_id"])
+        self.assertEqual(job["status"], "done")
+        self.assertTrue(store.get(job["key"], "png").startswith(b"\x89PNG"))
+
+        again = json.loads((await agent.run(state))["messages"][0])
+        self.assertTrue(again["payload"]["cached"])
+        self.assertEqual(again["payload"]["url"], response_data["payload"]["url"])
+        self.assertEqual(provider.calls, 1)
+
+    async def test_image_jobs_share_identical_requests_in_flight(self):
+        """Tests that identical prompts submitted together run the model once."""
+        from services.imaging import ImageJobQueue, FakeImageProvider
+        from services.object_store import LocalObjectStore
+        provider = FakeImageProvider(delay=0.05)
+        jobs = ImageJobQueue(provider, LocalObjectStore(tempfile.mkdtemp()), workers=2)
+
+        first = jobs.submit("NPV diagram")
+        second = jobs.submit("NPV diagram")
+        other = jobs.submit("WACC diagram")
+        self.assertIs(first, second)
+        await jobs.wait(first["id"])
+        await jobs.wait(other["id"])
+        self.assertEqual(provider.calls, 2)
+        self.assertNotEqual(first["url"], other["url"])
 
     async def test_composer_agent(self):
-        """Tests that the ComposerAgent returns an audio composition message."""
-        agent = ComposerAgent()
+        """Tests that the ComposerAgent synthesizes the summary and returns an audio payload."""
+        from services.speech import PodcastSynthesizer, FakeSpeechProvider
+        from services.object_store import LocalObjectStore
+        agent = ComposerAgent(PodcastSynthesizer(FakeSpeechProvider(), LocalObjectStore(tempfile.mkdtemp())))
         state = {
             "messages": [MagicMock(content="Summarize the lecture in a 2-minute audio")],
             "user_context": {}
         }
         result = await agent.run(state)
-        self.assertIn("composing a voice summary", result["messages"][0])
+        response_data = json.loads(result["messages"][0])
+        self.assertEqual(response_data["type"], "audio")
+        self.assertIn("composed a voice summary", response_data["text"])
+        self.assertTrue(response_data["payload"]["url"].endswith(".mp3"))
+
+    async def test_podcast_edit_resynthesizes_only_changed_segments(self):
+        """Tests chunked synthesis: limit-sized segments, frame concatenation, per-segment cache."""
+        from services.speech import PodcastSynthesizer, FakeSpeechProvider, split_segments
+        from services.object_store import LocalObjectStore
+        paragraphs = [" ".join(f"Paragraph {p} sentence {i} explains a concept." for i in range(12)) for p in range(4)]
+        script = "\n\n".join(paragraphs)
+        segments = split_segments(script, limit=200)
+        self.assertTrue(all(len(seg.encode()) <= 200 for seg in segments))
+        self.assertTrue(all(seg.endswith(".") for seg in segments))
+
+        provider = FakeSpeechProvider(delay=0.01)
+        synthesizer = PodcastSynthesizer(provider, LocalObjectStore(tempfile.mkdtemp()), concurrency=3, segment_bytes=200)
+        first = await synthesizer.synthesize(script)
+        self.assertEqual(first["synthesized"], len(segments))
+        audio = synthesizer.store.get(first["url"].rsplit("/", 1)[1][:-4], "mp3")
+        self.assertEqual(len(audio) % len(FakeSpeechProvider.FRAME), 0)
+
+        paragraphs[2] = paragraphs[2].replace("sentence 3 explains", "sentence 3 now explains")
+        provider.calls.clear()
+        edited = await synthesizer.synthesize("\n\n".join(paragraphs))
+        self.assertEqual(edited["synthesized"], 1)
+        self.assertIn("sentence 3 now explains", provider.calls[0])
+        self.assertNotEqual(edited["url"], first["url"])
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,552 @@
+import unittest
+import asyncio
+import time
+import os
+import sys
+from unittest.mock import patch, AsyncMock, MagicMock
+
+# Add backend to path so we can import core
+backend_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+from core.cache import TTLCache
+from core.events import EventBus, MASTERY_CHANNEL
+from core.scope import GraphScope, ScopedRegistry
+from core.ratelimit import RateLimiter, RateLimitedError, AdaptiveConcurrency, TokenBucket
+from core.scheduler import work_class, INTERACTIVE, LIVE, BATCH
+from core import metrics as m
+from core import tracing
+from core import profiling
+
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_lru_eviction_respects_recent_use(self):
+        cache = TTLCache(maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        self.assertIn("a", cache)
+        self.assertNotIn("b", cache)
+
+    def test_entries_expire_after_ttl(self):
+        cache = TTLCache(maxsize=8, ttl=10)
+        with patch('core.cache.time.monotonic', return_value=100.0):
+            cache.set("a", 1)
+        with patch('core.cache.time.monotonic', return_value=105.0):
+            self.assertEqual(cache.get("a"), 1)
+        with patch('core.cache.time.monotonic', return_value=111.0):
+            self.assertIsNone(cache.get("a"))
+        self.assertEqual(len(cache), 0)
+
+
+class TestEventBus(unittest.IsolatedAsyncioTestCase):
+
+    async def test_publish_delivers_locally_without_bridge(self):
+        bus = EventBus()
+        received = []
+        bus.subscribe("ch", received.append)
+        await bus.publish("ch", {"x": 1})
+        self.assertEqual(received, [{"x": 1}])
+
+    async def test_bridge_skips_own_notifications(self):
+        bus = EventBus()
+        received = []
+        bus.subscribe("ch", received.append)
+        bus._on_notify(None, 1, "ch", f'{{"x": 1, "_origin": "{bus.worker_id}"}}')
+        bus._on_notify(None, 1, "ch", '{"x": 2, "_origin": "other-worker"}')
+        self.assertEqual(received, [{"x": 2}])
+
+
+class TestGraphScope(unittest.TestCase):
+
+    def test_filter_numbers_parameters_from_start(self):
+        sql, params = GraphScope("t1", "Finance").filter(3, alias="n")
+        self.assertEqual(sql, "n.tenant_id = $3 AND n.subject = $4")
+        self.assertEqual(params, ["t1", "Finance"])
+        self.assertEqual(GraphScope("t1").filter(1), ("tenant_id = $1", ["t1"]))
+        self.assertEqual(GraphScope("t'1", "O'Neil").literal_filter(), "tenant_id = 't''1' AND subject = 'O''Neil'")
+
+    def test_from_context_and_writable_default(self):
+        scope = GraphScope.from_context({"current_page": "Finance", "tenant_id": "t1"})
+        self.assertEqual(scope, GraphScope("t1", "Finance"))
+        self.assertEqual(GraphScope.from_context({}), GraphScope("default", None))
+        self.assertEqual(GraphScope.from_context({}).writable().subject, "General")
+
+    def test_registry_dispatches_events_to_affected_scopes_only(self):
+        class Item:
+            def __init__(self, scope):
+                self.events = []
+
+            def _on_graph_changed(self, payload):
+                self.events.append(payload)
+
+        registry = ScopedRegistry(Item, maxsize=3)
+        finance = registry.for_scope(GraphScope("t1", "Finance"))
+        marketing = registry.for_scope(GraphScope("t1", "Marketing"))
+        tenant = registry.for_scope(GraphScope("t1"))
+        registry._dispatch({"tenant_id": "t1", "subject": "Finance"})
+        registry._dispatch({"full": True})
+        self.assertEqual(len(finance.events), 2)
+        self.assertEqual(len(marketing.events), 1)
+        self.assertEqual(len(tenant.events), 2)
+
+        self.assertIs(registry.for_scope(GraphScope("t1", "Finance")), finance)
+        registry.for_scope(GraphScope("t2", "Finance"))
+        self.assertEqual(len(registry), 3)
+        self.assertIsNot(registry.for_scope(GraphScope("t1", "Marketing")), marketing)
+
+
+class TestRateLimiter(unittest.IsolatedAsyncioTestCase):
+
+    def test_token_bucket_waits_for_refill(self):
+        bucket = TokenBucket(per_minute=60)
+        bucket.take(60)
+        self.assertAlmostEqual(bucket.wait_time(2), 2.0, places=1)
+        self.assertAlmostEqual(bucket.wait_time(600), 60.0, places=1)
+
+    async def test_concurrency_window_caps_in_flight_calls(self):
+        limiter = RateLimiter({"m": {"concurrency": 2}})
+        peak, running = 0, 0
+
+        async def work():
+            nonlocal peak, running
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            return "ok"
+
+        results = await asyncio.gather(*(limiter.call("m", work) for _ in range(6)))
+        self.assertEqual(results, ["ok"] * 6)
+        self.assertLessEqual(peak, 3)
+        self.assertEqual(limiter.stats()["m"]["calls"], 6)
+
+    def test_aliases_share_a_limiter_and_unknown_models_are_rejected(self):
+        from core.ratelimit import UnknownModelError
+        limiter = RateLimiter()
+        self.assertIs(limiter.for_model("gemini-2.0-flash-exp"), limiter.for_model("gemini-2.0-flash"))
+        with self.assertRaises(UnknownModelError):
+            limiter.for_model("gemini-made-up-9000")
+        self.assertEqual(set(limiter.models), {"gemini-2.0-flash"})
+
+    async def test_429_backs_off_shrinks_window_and_retries(self):
+        limiter = RateLimiter({"m": {"concurrency": 8}})
+        attempts = []
+
+        async def flaky():
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise Exception("429 Resource has been exhausted (e.g. check quota).")
+            return "ok"
+
+        with patch('core.ratelimit.asyncio.sleep', new_callable=AsyncMock) as mock_sleep:
+            self.assertEqual(await limiter.call("m", flaky), "ok")
+        self.assertEqual(len(attempts), 3)
+        self.assertEqual(mock_sleep.await_count, 2)
+        stats = limiter.stats()["m"]
+        self.assertEqual((stats["throttled"], stats["retries"]), (2, 2))
+        self.assertLess(stats["concurrency_limit"], 8)
+
+        async def always_429():
+            raise Exception("429 Too Many Requests")
+
+        with patch('core.ratelimit.asyncio.sleep', new_callable=AsyncMock):
+            with self.assertRaises(RateLimitedError):
+                await limiter.call("m", always_429, max_retries=1)
+
+    async def test_interactive_calls_jump_queued_batch_work_and_users_share_fairly(self):
+        limiter = RateLimiter({"m": {"concurrency": 1}})
+        gate = asyncio.Event()
+        order = []
+
+        async def blocker():
+            await gate.wait()
+
+        def job(name):
+            async def run():
+                order.append(name)
+            return run
+
+        async def submit(priority, user, name):
+            with work_class(priority, user=user):
+                await limiter.call("m", job(name), tokens=100)
+
+        with work_class(BATCH, user="alice"):
+            holder = asyncio.create_task(limiter.call("m", blocker))
+        await asyncio.sleep(0)
+        tasks = [asyncio.create_task(submit(BATCH, "alice", f"alice-{i}")) for i in range(3)]
+        await asyncio.sleep(0)
+        tasks.append(asyncio.create_task(submit(BATCH, "bob", "bob-0")))
+        tasks.append(asyncio.create_task(submit(LIVE, "carol", "lecture")))
+        tasks.append(asyncio.create_task(submit(INTERACTIVE, "dave", "chat")))
+        await asyncio.sleep(0)
+        self.assertEqual(limiter.class_stats()[BATCH]["waiting"], 4)
+
+        gate.set()
+        await asyncio.gather(holder, *tasks)
+        # Strict priority across classes, weighted fair queuing across users within one
+        self.assertEqual(order, ["chat", "lecture", "alice-0", "bob-0", "alice-1", "alice-2"])
+        stats = limiter.class_stats()
+        self.assertEqual((stats[INTERACTIVE]["calls"], stats[LIVE]["calls"], stats[BATCH]["calls"]), (1, 1, 5))
+
+    async def test_batch_work_leaves_reserved_headroom(self):
+        limiter = RateLimiter({"m": {"concurrency": 4}})
+        gate = asyncio.Event()
+
+        async def hold():
+            await gate.wait()
+
+        with work_class(BATCH):
+            batch = [asyncio.create_task(limiter.call("m", hold)) for _ in range(4)]
+        await asyncio.sleep(0)
+        window = limiter.for_model("m").window
+        self.assertEqual((window.in_flight, window.waiters.waiting(BATCH)), (3, 1))
+
+        # The reserved slot serves a chat turn at once, without waiting for batch calls to finish
+        self.assertEqual(await asyncio.wait_for(limiter.call("m", AsyncMock(return_value="ok")), 1), "ok")
+        gate.set()
+        await asyncio.gather(*batch)
+
+    def test_window_grows_additively_on_fast_successes(self):
+        window = AdaptiveConcurrency(initial=2, maximum=4)
+        for _ in range(2):
+            window.on_success(0.1)
+        self.assertAlmostEqual(window.limit, 2.0 + 1 / 2 + 1 / 2.5, places=6)
+        window.on_throttle()
+        self.assertLess(window.limit, 2)
+
+
+class TestMetrics(unittest.IsolatedAsyncioTestCase):
+
+    def test_histogram_renders_buckets_and_quantiles(self):
+        registry = m.MetricsRegistry()
+        hist = registry.histogram("t_seconds", "Test", ("node",), buckets=(0.1, 1.0))
+        for v in [0.05] * 90 + [0.5] * 9 + [2.0]:
+            hist.observe(v, "Professor")
+        text = registry.render()
+        self.assertIn('t_seconds_bucket{node="Professor",le="0.1"} 90', text)
+        self.assertIn('t_seconds_bucket{node="Professor",le="1"} 99', text)
+        self.assertIn('t_seconds_bucket{node="Professor",le="+Inf"} 100', text)
+        self.assertIn('t_seconds_quantiles{node="Professor",quantile="0.5"} 0.05', text)
+        self.assertIn('t_seconds_quantiles{node="Professor",quantile="0.95"} 0.5', text)
+        self.assertIn('t_seconds_quantiles{node="Professor",quantile="0.99"} 2', text)
+
+    async def test_router_hops_and_node_latency_per_graph_run(self):
+        decisions = iter(["ProfessorAgent", "ResearchAgent", "DONE"])
+        router = m.instrument_node("TestRouter", AsyncMock(side_effect=lambda s: {"next": next(decisions)}), router=True)
+        agent = m.instrument_node("TestAgent", AsyncMock(return_value={"messages": []}))
+        runs, hops = m.ROUTER_HOPS.count(), m.ROUTER_HOPS.series.get((), {}).get("sum", 0)
+
+        with m.graph_run():
+            for _ in range(2):
+                await router({})
+                await agent({})
+            await router({})
+
+        self.assertEqual(m.ROUTER_HOPS.count(), runs + 1)
+        self.assertEqual(m.ROUTER_HOPS.series[()]["sum"] - hops, 2)
+        self.assertEqual(m.NODE_SECONDS.count("TestRouter"), 3)
+        self.assertEqual(m.NODE_SECONDS.count("TestAgent"), 2)
+
+    async def test_model_calls_record_reported_tokens_and_cost(self):
+        limiter = RateLimiter()
+        before = m.LLM_TOKENS.get("gemini-2.5-pro", "output"), m.LLM_COST.get("gemini-2.5-pro")
+        response = MagicMock(usage_metadata={"input_tokens": 1000, "output_tokens": 200, "total_tokens": 1200})
+        await limiter.call("gemini-2.5-pro", AsyncMock(return_value=response), tokens=600)
+
+        self.assertEqual(m.LLM_TOKENS.get("gemini-2.5-pro", "output") - before[0], 200)
+        self.assertAlmostEqual(m.LLM_COST.get("gemini-2.5-pro") - before[1], (1000 * 1.25 + 200 * 10.0) / 1e6)
+        self.assertIn('vidyos_llm_call_seconds_count{model="gemini-2.5-pro",kind="generate"}', m.metrics.render())
+
+    async def test_db_queries_are_timed_by_operation(self):
+        raw = MagicMock()
+        raw.fetchval = AsyncMock(return_value=7)
+        raw.close = AsyncMock()
+        conn = m.InstrumentedConnection(raw)
+        before = m.DB_SECONDS.count("SELECT")
+
+        self.assertEqual(await conn.fetchval("  select count(*) from knowledge_nodes"), 7)
+        await conn.close()
+        self.assertEqual(m.DB_SECONDS.count("SELECT"), before + 1)
+        raw.close.assert_awaited_once()
+
+
+class TestTracing(unittest.IsolatedAsyncioTestCase):
+
+    def setUp(self):
+        self.tracer = tracing.Tracer()
+        patcher = patch.object(tracing, "tracer", self.tracer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_spans_nest_across_tasks_and_late_spans_join_the_trace(self):
+        release = asyncio.Event()
+
+        async def background():
+            await release.wait()
+            with tracing.child_span("late.work"):
+                pass
+
+        with tracing.span("POST /api/agent/chat") as root:
+            with tracing.child_span("node.MasterMind"):
+                await asyncio.gather(*(self._query(i) for i in range(2)))
+            task = asyncio.create_task(background())
+
+        spans = self.tracer.get(root.trace_id)
+        self.assertEqual([s["name"] for s in spans], ["POST /api/agent/chat", "node.MasterMind", "db.fetch", "db.fetch"])
+        by_name = {s["name"]: s for s in spans}
+        self.assertEqual(by_name["node.MasterMind"]["parent_id"], root.span_id)
+        self.assertEqual(by_name["db.fetch"]["parent_id"], by_name["node.MasterMind"]["span_id"])
+        self.assertEqual([s["depth"] for s in tracing.waterfall(spans)], [0, 1, 2, 2])
+
+        release.set()
+        await task
+        self.assertEqual(self.tracer.get(root.trace_id)[-1]["name"], "late.work")
+        with tracing.child_span("outside.any.trace") as none:
+            self.assertIsNone(none)
+
+    async def _query(self, i):
+        with tracing.child_span("db.fetch", i=i):
+            await asyncio.sleep(0)
+
+    async def test_middleware_sets_trace_header_and_exports_jsonl(self):
+        import tempfile
+        import httpx
+        from fastapi import FastAPI
+
+        app = FastAPI()
+        app.add_middleware(tracing.TracingMiddleware)
+
+        @app.get("/ping")
+        async def ping():
+            with tracing.child_span("db.fetchval"):
+                return {"trace": tracing.current_trace_id()}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            exporter = tracing.JsonlSpanExporter(os.path.join(tmp, "traces.jsonl"))
+            self.tracer.exporters.append(exporter)
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                response = await client.get("/ping")
+                continued = await client.get("/ping", headers={"traceparent": f"00-{'ab' * 16}-{'cd' * 8}-01"})
+
+            trace_id = response.headers["x-trace-id"]
+            self.assertEqual(response.json()["trace"], trace_id)
+            self.assertEqual(continued.headers["x-trace-id"], "ab" * 16)
+            self.tracer._done.clear()
+            spans = self.tracer.get(trace_id)  # read back from the JSONL file
+            self.assertEqual([s["name"] for s in spans], ["GET /ping", "db.fetchval"])
+            self.assertEqual(spans[0]["attributes"]["status_code"], 200)
+
+    def test_jsonl_exporter_writes_in_background_rotates_and_indexes(self):
+        import tempfile
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "traces.jsonl")
+            exporter = tracing.JsonlSpanExporter(path, max_bytes=400)
+            for i in range(6):
+                exporter.export([{"trace_id": f"t{i}", "span_id": "s", "start": i, "attributes": {"i": i}}] * 2)
+                exporter.flush()
+
+            self.assertTrue(os.path.exists(f"{path}.1"))
+            self.assertLessEqual(os.path.getsize(f"{path}.1"), 400 + 200)
+            self.assertEqual([s["attributes"]["i"] for s in exporter.find("t5")], [5, 5])
+            self.assertEqual(exporter.find("t0"), [])  # rotated out
+
+            # A new process indexes what the files hold
+            reopened = tracing.JsonlSpanExporter(path, max_bytes=400)
+            self.assertEqual(reopened.find("t5"), exporter.find("t5"))
+
+
+class TestProfiling(unittest.IsolatedAsyncioTestCase):
+
+    async def test_authorized_requests_store_collapsed_stacks_by_trace_id(self):
+        import tempfile
+        import httpx
+        from fastapi import FastAPI
+
+        def busy_prompt_building():
+            deadline = time.perf_counter() + 0.1
+            while time.perf_counter() < deadline:
+                sum(range(1000))
+
+        app = FastAPI()
+        app.add_middleware(profiling.ProfilingMiddleware)
+        app.add_middleware(tracing.TracingMiddleware)
+
+        @app.get("/slow")
+        async def slow():
+            busy_prompt_building()
+            return {"ok": True}
+
+        with tempfile.TemporaryDirectory() as tmp, \
+                patch.dict(os.environ, {"PROFILE_ADMIN_TOKEN": "s3cret"}), \
+                patch.object(profiling, "profile_store", profiling.ProfileStore(tmp)):
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                plain = await client.get("/slow?profile=1")
+                wrong = await client.get("/slow", headers={"X-Profile": "1", "X-Admin-Token": "nope"})
+                profiled = await client.get("/slow", headers={"X-Profile": "collapsed", "X-Admin-Token": "s3cret"})
+
+            self.assertNotIn("x-profile-id", plain.headers)
+            self.assertNotIn("x-profile-id", wrong.headers)
+            self.assertEqual(profiled.headers["x-profile-id"], profiled.headers["x-trace-id"])
+            path, media_type = profiling.profile_store.find(profiled.headers["x-trace-id"])
+            with open(path) as f:
+                stacks = f.read().splitlines()
+            self.assertTrue(media_type.startswith("text/plain"))
+            self.assertTrue(any("busy_prompt_building" in line for line in stacks))
+            self.assertTrue(all(line.rsplit(" ", 1)[1].isdigit() for line in stacks))
+            self.assertIsNone(profiling.profile_store.find(plain.headers["x-trace-id"]))
+
+    def test_format_flag(self):
+        self.assertIsNone(profiling.requested_format({}, b"q=profile"))
+        self.assertEqual(profiling.requested_format({}, b"profile=pstats"), "pstats")
+        self.assertEqual(profiling.requested_format({"x-profile": "1"}, b""), "collapsed")
+        self.assertIsNone(profiling.requested_format({"x-profile": "0"}, b""))
+
+
+class TestStartup(unittest.IsolatedAsyncioTestCase):
+
+    async def test_registry_builds_once_across_threads_and_retries_failures(self):
+        from core.registry import LazyRegistry
+        registry = LazyRegistry()
+        builds = []
+
+        def build_graph():
+            time.sleep(0.05)
+            builds.append("graph")
+            return object()
+
+        attempts = []
+
+        def build_flaky():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise RuntimeError("no credentials")
+            return "client"
+
+        registry.register("graph", build_graph, critical=True)
+        registry.register("flaky", build_flaky)
+        errors = await registry.warm(["graph", "graph", "flaky"])
+
+        self.assertEqual(builds, ["graph"])
+        self.assertIsNone(errors["graph"])
+        self.assertIn("no credentials", errors["flaky"])
+        self.assertFalse(registry.is_built("flaky"))
+        self.assertEqual(registry.get("flaky"), "client")
+        status = registry.status()
+        self.assertTrue(status["graph"]["critical"])
+        self.assertIsNotNone(status["flaky"]["build_ms"])
+        self.assertIsNone(status["flaky"]["error"])
+
+    async def test_warm_up_sets_readiness_and_times_first_request_per_route(self):
+        import httpx
+        from fastapi import FastAPI
+        from core import startup
+        from core.registry import LazyRegistry
+
+        state = startup.StartupState()
+        registry = LazyRegistry()
+        registry.register("router", lambda: "graph", critical=True)
+
+        app = FastAPI()
+        app.add_middleware(startup.FirstRequestMiddleware)
+
+        @app.get("/items/{item_id}")
+        async def item(item_id: str):
+            return {"id": item_id}
+
+        with patch.object(startup, "registry", registry), \
+             patch.object(startup, "startup_state", state), \
+             patch("core.db.warm_db", new_callable=AsyncMock) as warm_db:
+            self.assertFalse(state.ready)
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+                await client.get("/items/1")
+                await state.warm_up()
+                await client.get("/items/2")
+                await client.get("/missing")
+
+            warm_db.assert_awaited_once()
+            self.assertTrue(state.ready)
+            self.assertTrue(registry.is_built("router"))
+            self.assertEqual(list(state.first_requests), ["GET /items/{item_id}"])
+            first = state.first_requests["GET /items/{item_id}"]
+            self.assertEqual(first["status"], 200)
+            self.assertFalse(first["warm"])
+
+            state.db["warm"] = False  # DB unreachable after all: not ready
+            self.assertFalse(state.status()["ready"])
+
+    async def test_failed_db_warm_up_is_retried_until_ready(self):
+        from core import startup
+        from core.registry import LazyRegistry
+
+        state = startup.StartupState()
+        registry = LazyRegistry()
+        warm_db = AsyncMock(side_effect=[OSError("connection refused"), OSError("connection refused"), None])
+
+        with patch.object(startup, "registry", registry), \
+             patch("core.db.warm_db", warm_db), \
+             patch("asyncio.sleep", new_callable=AsyncMock) as sleep:
+            await state.warm_up()
+            self.assertFalse(state.ready)
+            self.assertIn("connection refused", state.status()["db"]["error"])
+            retry = state.start_db_retry()
+            self.assertIs(retry, state.start_db_retry())  # already running: not started twice
+            await retry
+        self.assertIsNone(state.start_db_retry())
+
+        self.assertTrue(state.ready)
+        self.assertEqual(state.db["attempts"], 3)
+        self.assertIsNone(state.db["error"])
+        self.assertNotIn("db", state.errors)
+        self.assertEqual([c.args[0] for c in sleep.await_args_list], [1.0, 2.0])
+
+
+class TestMasteryStore(unittest.IsolatedAsyncioTestCase):
+
+    def make_conn(self, rows):
+        conn = MagicMock()
+        conn.fetch = AsyncMock(return_value=rows)
+        conn.execute = AsyncMock()
+        conn.close = AsyncMock()
+        return conn
+
+    async def test_reads_are_cached_and_writes_go_through(self):
+        from services.mastery import MasteryStore
+        store = MasteryStore()
+        conn = self.make_conn([{"node_id": "n1", "label": "WACC", "mastery_level": "Beginner", "score": 0.1}])
+
+        with patch('services.mastery.get_db_connection', new_callable=AsyncMock, return_value=conn):
+            await store.get("u1")
+            await store.get("u1")
+            self.assertEqual(conn.fetch.await_count, 1)
+
+            await store.update("u1", "n1", "Advanced", 0.9)
+            rows = await store.get("u1")
+            self.assertEqual(conn.fetch.await_count, 1)
+            self.assertEqual(rows[0]["mastery_level"], "Advanced")
+
+    async def test_remote_invalidation_forces_reload(self):
+        from services.mastery import MasteryStore
+        from core.events import event_bus
+        store = MasteryStore()
+        conn = self.make_conn([])
+
+        with patch('services.mastery.get_db_connection', new_callable=AsyncMock, return_value=conn):
+            await store.get("u2")
+            event_bus.publish_local(MASTERY_CHANNEL, {"user_id": "u2", "node_id": "n9"})
+            await store.get("u2")
+            self.assertEqual(conn.fetch.await_count, 2)
+
+    def test_invalidation_generations_are_bounded(self):
+        from services.mastery import MasteryStore
+        store = MasteryStore(maxsize=16)
+        for i in range(100):
+            store.invalidate(f"user-{i}")
+        self.assertEqual(len(store._generation), 16)
+
+
+if __name__ == '__main__':
+    unittest.main()
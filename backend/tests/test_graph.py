@@ -0,0 +1,402 @@
+import unittest
+import os
+import sys
+from unittest.mock import patch, AsyncMock, MagicMock
+
+# Add backend to path so we can import services
+backend_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+from services.graph_snapshot import GraphSnapshot, GraphBuilder, GrowableArray
+
+NODES = [
+    {"id": "tvm", "label": "Time Value of Money", "type": "Concept"},
+    {"id": "npv", "label": "NPV", "type": "Concept"},
+    {"id": "irr", "label": "IRR", "type": "Concept"},
+    {"id": "capb", "label": "Capital Budgeting", "type": "Concept"},
+    {"id": "swot", "label": "SWOT", "type": "Concept"},
+]
+EDGES = [
+    {"source_id": "tvm", "target_id": "npv", "relation": "Prerequisite", "weight": 1.0},
+    {"source_id": "npv", "target_id": "irr", "relation": "Extends", "weight": 0.5},
+    {"source_id": "npv", "target_id": "capb", "relation": "Prerequisite", "weight": 1.0},
+    {"source_id": "irr", "target_id": "capb", "relation": "Prerequisite", "weight": 1.0},
+]
+
+
+def make_snapshot():
+    return GraphSnapshot.from_rows(NODES, EDGES)
+
+
+class TestGraphSnapshot(unittest.TestCase):
+
+    def test_csr_neighbours_in_both_directions(self):
+        g = make_snapshot()
+        npv = g.resolve("npv")
+        out, _, _ = g.neighbors(npv, "out")
+        incoming, _, _ = g.neighbors(npv, "in")
+        self.assertEqual({g.node_ids[i] for i in out}, {"irr", "capb"})
+        self.assertEqual([g.node_ids[i] for i in incoming], ["tvm"])
+
+    def test_k_hop_respects_relation_filter(self):
+        g = make_snapshot()
+        depth = g.k_hop(g.resolve("Capital Budgeting"), k=3, direction="in", relations=["Prerequisite"])
+        self.assertEqual({g.node_ids[i]: d for i, d in depth.items()}, {"capb": 0, "npv": 1, "irr": 1, "tvm": 2})
+
+    def test_shortest_prerequisite_path(self):
+        g = make_snapshot()
+        path = g.shortest_path(g.resolve("tvm"), g.resolve("capb"))
+        self.assertEqual([g.node_ids[i] for i in path], ["tvm", "npv", "capb"])
+        self.assertEqual(g.shortest_path(g.resolve("swot"), g.resolve("capb")), [])
+
+    def test_find_labels_prefers_longest_match(self):
+        g = make_snapshot()
+        found = g.find_labels("How does time value of money relate to NPV?")
+        self.assertEqual([g.node_ids[i] for i in found], ["tvm", "npv"])
+
+
+class TestIncrementalSnapshot(unittest.TestCase):
+
+    def test_growable_array_keeps_old_views_valid(self):
+        arr = GrowableArray("int32", capacity=2)
+        arr.extend([1, 2])
+        old = arr.view()
+        arr.extend([3, 4, 5])
+        self.assertEqual(old.tolist(), [1, 2])
+        self.assertEqual(arr.view().tolist(), [1, 2, 3, 4, 5])
+
+    def test_delta_edges_visible_without_compaction(self):
+        builder = GraphBuilder(compact_min=100)
+        builder.apply(NODES, EDGES)
+        builder.compact()
+        before = builder.snapshot()
+
+        builder.apply([{"id": "dcf", "label": "DCF", "type": "Concept"}],
+                      [{"id": "e9", "source_id": "tvm", "target_id": "dcf", "relation": "Prerequisite"}])
+        after = builder.snapshot()
+
+        self.assertEqual(builder.base_edges, len(EDGES))
+        self.assertEqual(after.version, before.version + 1)
+        out, _, _ = after.neighbors(after.resolve("tvm"), "out")
+        self.assertEqual({after.node_ids[i] for i in out}, {"npv", "dcf"})
+        # Readers holding the old version don't see the new node or edge
+        self.assertIsNone(before.resolve("DCF"))
+        out, _, _ = before.neighbors(before.resolve("tvm"), "out")
+        self.assertEqual([before.node_ids[i] for i in out], ["npv"])
+
+    def test_reapplying_rows_is_idempotent(self):
+        builder = GraphBuilder()
+        edges = [dict(e, id=f"e{i}") for i, e in enumerate(EDGES)]
+        builder.apply(NODES, edges)
+        self.assertEqual(builder.apply(NODES, edges), 0)
+        self.assertEqual(builder.snapshot().num_edges, len(EDGES))
+
+    def test_edges_ahead_of_their_nodes_are_held(self):
+        builder = GraphBuilder()
+        builder.apply(NODES[:1], [{"id": "e1", "source_id": "tvm", "target_id": "npv", "relation": "Prerequisite"}])
+        self.assertEqual(builder.snapshot().num_edges, 0)
+        # The node arrives in a later read, without the edge being read again
+        builder.apply(NODES[1:2], [])
+        self.assertEqual(builder.snapshot().num_edges, 1)
+        self.assertEqual(builder.pending_edges, {})
+
+    def test_old_snapshots_keep_their_labels(self):
+        builder = GraphBuilder()
+        builder.apply(NODES, EDGES)
+        before = builder.snapshot()
+        builder.apply([{"id": "npv", "label": "Net Present Value", "type": "Concept"}], [])
+        self.assertEqual(before.labels[before.resolve("NPV")], "NPV")
+        self.assertIsNone(before.resolve("Net Present Value"))
+        self.assertEqual(builder.snapshot().resolve("Net Present Value"), before.resolve("NPV"))
+
+    def test_reset_during_refresh_discards_stale_rows(self):
+        import asyncio
+        import datetime
+        from services.graph_snapshot import SnapshotManager
+        manager = SnapshotManager()
+        at = datetime.datetime(2026, 1, 1, tzinfo=datetime.timezone.utc)
+        node_reads = []
+
+        async def fetch(sql, *args):
+            if "knowledge_nodes" not in sql:
+                return []
+            node_reads.append(args[0])
+            if len(node_reads) == 1:
+                manager.reset()  # a dedup "full" event lands mid-refresh
+                return [dict(NODES[0], updated_at=at)]
+            return [dict(n, updated_at=at) for n in NODES]
+
+        conn = MagicMock()
+        conn.fetch = fetch
+        conn.close = AsyncMock()
+        with patch('core.db.get_db_connection', new_callable=AsyncMock, return_value=conn):
+            asyncio.run(manager.refresh())
+
+        # The incremental read was thrown away and the rebuild read from the start
+        self.assertEqual(len(node_reads), 2)
+        self.assertEqual(manager.snapshot.num_nodes, len(NODES))
+        self.assertEqual(manager.node_watermark, at)
+
+    def test_delta_compacts_into_base(self):
+        builder = GraphBuilder(compact_min=2, compact_ratio=0.0)
+        builder.apply(NODES, EDGES)
+        self.assertEqual(builder.base_edges, len(EDGES))
+        self.assertEqual(len(builder.snapshot().delta_src), 0)
+
+
+class TestNavigator(unittest.TestCase):
+
+    def test_navigate_builds_ui_payload_without_llm(self):
+        from agents.navigator import NavigatorAgent, is_navigation_request
+        g = make_snapshot()
+        reply = NavigatorAgent().navigate(g, "Show the path from Time Value of Money to Capital Budgeting")
+        self.assertEqual(reply["type"], "graph")
+        self.assertEqual(reply["payload"]["path"], ["tvm", "npv", "capb"])
+        self.assertEqual(len(reply["payload"]["edges"]), 2)
+
+        reply = NavigatorAgent().navigate(g, "Expand NPV")
+        self.assertEqual(reply["payload"]["center"], "npv")
+        self.assertEqual({n["id"] for n in reply["payload"]["nodes"]}, {"npv", "tvm", "irr", "capb"})
+
+        self.assertTrue(is_navigation_request("What are the prerequisites for Capital Budgeting?"))
+        self.assertFalse(is_navigation_request("Explain the Capital Asset Pricing Model"))
+
+
+class TestGraphDeltaSync(unittest.IsolatedAsyncioTestCase):
+
+    def make_conn(self, horizon, changes):
+        conn = MagicMock()
+        conn.close = AsyncMock()
+        conn.fetchval = AsyncMock(side_effect=lambda sql, *args: horizon if "horizon" in sql else 900)
+
+        async def fetch(sql, *args):
+            if "graph_changes" in sql:
+                return changes
+            if "FROM knowledge_nodes WHERE id = ANY" in sql:
+                return [{"id": i, "label": "NPV", "type": "Concept"} for i in args[0]]
+            if "FROM knowledge_nodes" in sql:
+                return [{"id": "full", "label": "Full", "type": "Concept"}]
+            return []
+        conn.fetch = AsyncMock(side_effect=fetch)
+        return conn
+
+    async def test_delta_returns_upserts_and_tombstones(self):
+        from services.graph_sync import graph_changes_since
+        conn = self.make_conn(None, [
+            {"entity": "node", "entity_id": "n1", "op": "U"},
+            {"entity": "node", "entity_id": "n2", "op": "D"},
+            {"entity": "edge", "entity_id": "e1", "op": "D"},
+        ])
+        with patch('services.graph_sync.get_db_connection', new_callable=AsyncMock, return_value=conn):
+            delta = await graph_changes_since(500)
+
+        self.assertFalse(delta["full"])
+        self.assertEqual(delta["version"], 900)
+        self.assertEqual(delta["nodes"]["rows"], [["n1", "NPV", "Concept"]])
+        self.assertEqual(delta["deleted"], {"nodes": ["n2"], "edges": ["e1"]})
+
+    async def test_version_older_than_horizon_gets_full_snapshot(self):
+        from services.graph_sync import graph_changes_since
+        conn = self.make_conn(600, [])
+        with patch('services.graph_sync.get_db_connection', new_callable=AsyncMock, return_value=conn):
+            state = await graph_changes_since(500)
+
+        self.assertTrue(state["full"])
+        self.assertEqual(state["nodes"]["rows"], [["full", "Full", "Concept"]])
+
+    async def test_reads_are_scoped_to_one_course(self):
+        from services.graph_sync import graph_changes_since
+        from core.scope import GraphScope
+        conn = self.make_conn(None, [{"entity": "node", "entity_id": "n1", "op": "U"}])
+        with patch('services.graph_sync.get_db_connection', new_callable=AsyncMock, return_value=conn):
+            await graph_changes_since(None, GraphScope("t1", "Finance"))
+            await graph_changes_since(500, GraphScope("t1", "Finance"))
+
+        graph_reads = [c for c in conn.fetch.await_args_list if "knowledge_" in c.args[0] or "graph_changes" in c.args[0]]
+        self.assertEqual(len(graph_reads), 4)
+        for call in graph_reads:
+            self.assertIn("tenant_id = $", call.args[0])
+            self.assertEqual(call.args[-2:], ("t1", "Finance"))
+
+
+class TestLiveGraphBroker(unittest.IsolatedAsyncioTestCase):
+
+    async def test_fan_out_to_many_subscribers(self):
+        from services.pubsub import Broker
+        broker = Broker()
+        subs = [broker.subscribe("session:s1") for _ in range(300)]
+        delivered = await broker.publish("session:s1", {"type": "node", "key": "node:n1"})
+        self.assertEqual(delivered, 300)
+        self.assertTrue(all(len(s) == 1 for s in subs))
+        broker.unsubscribe(subs[0])
+        self.assertEqual(broker.subscriber_count("session:s1"), 299)
+
+    async def test_slow_subscriber_coalesces_by_key(self):
+        from services.pubsub import Subscription
+        sub = Subscription("session:s1", maxlen=8)
+        sub.offer({"key": "node:n1", "label": "v1"})
+        sub.offer({"key": "node:n2", "label": "other"})
+        sub.offer({"key": "node:n1", "label": "v2"})
+        batch = await sub.next_batch()
+        self.assertEqual([m["label"] for m in batch], ["v2", "other"])
+        self.assertEqual(sub.coalesced, 1)
+
+    async def test_overflow_drops_oldest_and_requests_resync(self):
+        from services.pubsub import Subscription
+        sub = Subscription("session:s1", maxlen=2)
+        for i in range(3):
+            sub.offer({"key": f"node:{i}"})
+        batch = await sub.next_batch()
+        self.assertEqual(batch[0]["type"], "resync")
+        self.assertEqual([m["key"] for m in batch[1:]], ["node:1", "node:2"])
+
+
+class TestGraphLayout(unittest.IsolatedAsyncioTestCase):
+
+    def chain(self, n):
+        ids = [f"n{i}" for i in range(n)]
+        return ids, [(ids[i], ids[i + 1], 1.0) for i in range(n - 1)]
+
+    def test_grid_repulsion_tracks_exact_direction(self):
+        import numpy as np
+        from services.layout import _repulsion_exact, _repulsion_grid
+        pos = np.random.default_rng(0).uniform(-1, 1, size=(400, 2))
+        exact, approx = _repulsion_exact(pos, 0.1), _repulsion_grid(pos, 0.1)
+        cosine = (exact * approx).sum(1) / (np.linalg.norm(exact, axis=1) * np.linalg.norm(approx, axis=1))
+        self.assertGreater(np.median(cosine), 0.9)
+
+    async def test_layout_is_cached_by_subgraph(self):
+        from services.layout import LayoutService
+        service = LayoutService()
+        ids, edges = self.chain(30)
+        first = await service.layout(ids, edges, iterations=50)
+        again = await service.layout(list(reversed(ids)), edges, iterations=50)
+        self.assertFalse(first["cached"])
+        self.assertTrue(again["cached"])
+        self.assertEqual(first["positions"], again["positions"])
+        self.assertTrue(all(-1 <= c <= 1 for xy in first["positions"].values() for c in xy))
+
+    async def test_adding_nodes_warm_starts_from_previous_layout(self):
+        import numpy as np
+        from services.layout import LayoutService
+        service = LayoutService()
+        ids, edges = self.chain(40)
+        before = (await service.layout(ids, edges, scope="s"))["positions"]
+        after = await service.layout(ids + ["extra"], edges + [("n5", "extra", 1.0)], scope="s")
+        self.assertTrue(after["warm_start"])
+        moved = [np.hypot(*np.subtract(after["positions"][i], before[i])) for i in ids]
+        self.assertLess(np.median(moved), 0.1)
+
+
+class TestCommunities(unittest.TestCase):
+
+    def two_cliques(self):
+        nodes = [{"id": f"{g}{i}", "label": f"{g.upper()} {i}", "type": "Concept"} for g in "ab" for i in range(5)]
+        edges = [
+            {"source_id": f"{g}{i}", "target_id": f"{g}{j}", "relation": "Related", "weight": 1.0}
+            for g in "ab" for i in range(5) for j in range(i + 1, 5)
+        ]
+        edges.append({"source_id": "a0", "target_id": "b0", "relation": "Prerequisite", "weight": 1.0})
+        return GraphSnapshot.from_rows(nodes, edges)
+
+    def test_label_propagation_separates_cliques(self):
+        from services.communities import detect_communities
+        communities = detect_communities(self.two_cliques())
+        self.assertEqual(len(communities), 2)
+        self.assertEqual(sorted(communities.sizes.tolist()), [5, 5])
+        # Representative is the best-connected member (a0/b0 have the bridge edge)
+        self.assertEqual(sorted(communities.ids), ["a0", "b0"])
+
+    def test_warm_start_keeps_community_ids(self):
+        from services.communities import detect_communities
+        snapshot = self.two_cliques()
+        first = detect_communities(snapshot)
+        again = detect_communities(snapshot, previous=first.assignment(), seed=3)
+        self.assertEqual(first.assignment(), again.assignment())
+
+    def test_level_of_detail_aggregates_and_expands(self):
+        from services.communities import detect_communities, level_of_detail
+        snapshot = self.two_cliques()
+        communities = detect_communities(snapshot)
+
+        coarse = level_of_detail(snapshot, communities)
+        self.assertEqual({n["type"] for n in coarse["nodes"]}, {"Community"})
+        self.assertEqual(len(coarse["edges"]), 1)
+        self.assertEqual(coarse["edges"][0]["count"], 1)
+
+        detail = level_of_detail(snapshot, communities, expand=["a0"])
+        ids = {n["id"] for n in detail["nodes"]}
+        self.assertEqual(len(ids), 6)
+        self.assertIn("community:b0", ids)
+        bridge = [e for e in detail["edges"] if e["target"] == "community:b0"]
+        self.assertEqual(bridge[0]["source"], "a0")
+        self.assertEqual(sum(e["relation"] == "Related" for e in detail["edges"]), 10)
+
+
+    def test_persist_replaces_only_its_own_scope(self):
+        import asyncio
+        from contextlib import asynccontextmanager
+        from core.scope import GraphScope
+        from services.communities import detect_communities, persist_communities
+        snapshot = self.two_cliques()
+        conn = MagicMock()
+        conn.execute = AsyncMock()
+        conn.close = AsyncMock()
+
+        @asynccontextmanager
+        async def transaction():
+            yield
+
+        conn.transaction = transaction
+        with patch('core.db.get_db_connection', new_callable=AsyncMock, return_value=conn):
+            asyncio.run(persist_communities(snapshot, detect_communities(snapshot), GraphScope("t1", "Finance")))
+
+        deletes = [c.args for c in conn.execute.await_args_list if c.args[0].startswith("DELETE")]
+        self.assertEqual(deletes, [
+            ("DELETE FROM graph_community_edges WHERE tenant_id = $1 AND subject = $2", "t1", "Finance"),
+            ("DELETE FROM graph_communities WHERE tenant_id = $1 AND subject = $2", "t1", "Finance"),
+        ])
+        insert = next(c.args for c in conn.execute.await_args_list if "INSERT INTO graph_communities" in c.args[0])
+        self.assertEqual(insert[-2:], ("t1", "Finance"))
+
+class TestConceptRanking(unittest.IsolatedAsyncioTestCase):
+
+    def test_pagerank_matches_dense_solution(self):
+        import numpy as np
+        from services.analytics import pagerank
+        src, dst = np.array([0, 1, 2, 2]), np.array([1, 2, 0, 1])
+        ranks, _ = pagerank(4, src, dst)
+        # Dense reference: node 3 is dangling and spreads uniformly
+        m = np.zeros((4, 4))
+        for s, t in zip(src, dst):
+            m[t, s] += 1 / np.sum(src == s)
+        m[:, 3] = 0.25
+        g = 0.85 * m + 0.15 / 4
+        vals, vecs = np.linalg.eig(g)
+        ref = np.real(vecs[:, np.argmax(np.real(vals))])
+        np.testing.assert_allclose(ranks, ref / ref.sum(), atol=1e-6)
+        warm, iterations = pagerank(4, src, dst, init=ranks)
+        self.assertLessEqual(iterations, 2)
+
+    def test_foundational_concept_ranks_first(self):
+        from services.analytics import ConceptRanking
+        nodes = [dict(n, mention_count=5 if n["id"] == "npv" else 1) for n in NODES]
+        ranking = ConceptRanking(GraphSnapshot.from_rows(nodes, EDGES))
+        top = ranking.top(3)
+        self.assertEqual(top[0]["id"], "npv")
+        self.assertEqual(top[0]["dependents"], 1)
+        self.assertEqual(top[0]["mentions"], 5)
+        self.assertEqual(len(ranking.top(100)), len(NODES))
+
+    async def test_cached_top_never_waits_and_refreshes_in_background(self):
+        from services.analytics import CentralityStore
+        store = CentralityStore()
+        with patch('services.analytics.graph_store.get', new_callable=AsyncMock, return_value=make_snapshot()):
+            self.assertEqual(store.cached_top(3), [])
+            await store._refreshing
+            self.assertEqual(len(store.cached_top(3)), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+import unittest
+import os
+import sys
+import tempfile
+from unittest.mock import patch
+
+# Add backend to path so we can import services
+backend_path = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if backend_path not in sys.path:
+    sys.path.append(backend_path)
+
+from services.search_index import BM25Index
+from services.retrieval import reciprocal_rank_fusion, to_pgvector
+
+
+class TestBM25Index(unittest.TestCase):
+
+    def setUp(self):
+        self.index = BM25Index()
+        self.index.add("wacc", "WACC is the weighted average cost of capital across debt and equity.")
+        self.index.add("npv", "Net Present Value discounts future cash flows at the cost of capital.")
+        self.index.add("swot", "SWOT analysis lists strengths, weaknesses, opportunities and threats.")
+
+    def test_search_ranks_exact_term_first(self):
+        hits = self.index.search("What is WACC?")
+        self.assertEqual(hits[0]["id"], "wacc")
+        self.assertIn("wacc", hits[0]["matched_terms"])
+
+    def test_remove_drops_document_from_postings(self):
+        self.assertTrue(self.index.remove("wacc"))
+        self.assertEqual(self.index.search("WACC"), [])
+        self.assertEqual(len(self.index), 2)
+        self.assertNotIn("wacc", self.index.postings)
+
+    def test_readd_replaces_document(self):
+        self.index.add("npv", "Internal rate of return makes NPV zero.")
+        hits = self.index.search("internal rate of return")
+        self.assertEqual(hits[0]["id"], "npv")
+        self.assertEqual(self.index.search("discounts"), [])
+
+    def test_snippet_centres_on_query_terms(self):
+        filler = " ".join(["lorem"] * 200)
+        self.index.add("long", f"{filler} EBITDA margin matters here. {filler}")
+        hit = self.index.search("EBITDA margin")[0]
+        self.assertIn("EBITDA margin", hit["snippet"])
+        self.assertTrue(hit["snippet"].startswith("..."))
+
+    def test_save_and_load_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "index.json")
+            self.index.save(path)
+            loaded = BM25Index.load(path)
+            self.assertEqual(len(loaded), 3)
+            self.assertEqual(loaded.search("SWOT")[0]["id"], "swot")
+
+
+class TestHybridFusion(unittest.TestCase):
+
+    def test_rrf_rewards_agreement_between_retrievers(self):
+        fused = reciprocal_rank_fusion(
+            {"lexical": {"wacc": 1, "npv": 2}, "vector": {"npv": 1, "capm": 2}},
+            {"lexical": 1.0, "vector": 1.0}
+        )
+        self.assertEqual(fused[0][0], "npv")
+        self.assertEqual({doc for doc, _ in fused}, {"wacc", "npv", "capm"})
+
+    def test_rrf_zero_weight_ignores_retriever(self):
+        fused = reciprocal_rank_fusion(
+            {"lexical": {"wacc": 1}, "vector": {"capm": 1}},
+            {"lexical": 0.0, "vector": 1.0}
+        )
+        self.assertEqual(fused, [("capm", 1.0 / 61)])
+
+    def test_to_pgvector_text_form(self):
+        self.assertEqual(to_pgvector([0.5, -1.0, 2.0]), "[0.5,-1,2]")
+
+
+class TestConceptDedup(unittest.TestCase):
+
+    def nodes(self, labels):
+        return [
+            {"id": f"n{i}", "label": label, "mention_count": 1, "created_at": i}
+            for i, label in enumerate(labels)
+        ]
+
+    def test_label_forms_cover_acronyms_and_parentheticals(self):
+        from services.labels import labels_compatible, normalize_label
+        self.assertEqual(normalize_label("The Net Present Values (NPV)"), "net present value")
+        self.assertTrue(labels_compatible("NPV", "Net Present Value"))
+        self.assertTrue(labels_compatible("Net present value (NPV)", "NPV"))
+        self.assertFalse(labels_compatible("NPV", "IRR"))
+
+    def test_blocked_similarity_matches_dense(self):
+        import numpy as np
+        from services.dedup import similar_pairs
+        emb = np.random.default_rng(0).normal(size=(50, 8))
+        emb[10] = emb[3] + 0.01
+        emb[40] = emb[3] * 2
+        pairs = similar_pairs(emb, threshold=0.99, block=7)
+        self.assertEqual(sorted((i, j) for i, j, _ in pairs), [(3, 10), (3, 40), (10, 40)])
+        # Incremental: only pairs touching the queried rows
+        self.assertEqual(sorted((i, j) for i, j, _ in similar_pairs(emb, 0.99, rows=[40])), [(3, 40), (10, 40)])
+
+    def test_plan_confirms_with_label_rules(self):
+        import numpy as np
+        from services.dedup import plan_merges
+        nodes = self.nodes(["Net Present Value", "NPV", "Net present value (NPV)", "IRR", "Payback"])
+        nodes[1]["mention_count"] = 4
+        emb = np.array([[1, 0, 0], [0.97, 0.1, 0], [0.99, 0.05, 0], [0.9, 0.43, 0], [0, 1, 0]], dtype=float)
+        report = plan_merges(nodes, emb, threshold=0.9)
+        self.assertEqual(len(report["groups"]), 1)
+        group = report["groups"][0]
+        self.assertEqual(group["keep"]["label"], "NPV")
+        self.assertEqual({m["label"] for m in group["merge"]}, {"Net Present Value", "Net present value (NPV)"})
+        self.assertTrue(any("IRR" in r["labels"] for r in report["rejected"]))
+
+    def test_forget_merged_keeps_the_survivors_document(self):
+        from core.scope import GraphScope
+        from services import search_index
+        from services.dedup import _forget_merged
+        index = BM25Index()
+        index.add("node:NPV", "NPV. Net present value.")
+        index.add("node:Net Present Value", "Net Present Value. Discounted cash flows.")
+        keep = {"label": "NPV", "tenant_id": "t1", "subject": "Finance"}
+        merged = [dict(keep), {"label": "Net Present Value", "tenant_id": "t1", "subject": "Finance"}]
+        with patch.object(search_index, "get_course_index", return_value=index) as get_index, \
+             patch.object(search_index, "schedule_save"):
+            _forget_merged([{"keep": keep, "merge": merged}])
+        get_index.assert_called_with(GraphScope("t1", "Finance"))
+        self.assertEqual([h["id"] for h in index.search("net present value")], ["node:NPV"])
+
+
+class TestCourseIndex(unittest.TestCase):
+
+    def test_indexes_are_per_course(self):
+        import tempfile
+        from core.scope import GraphScope
+        from services import search_index
+        with tempfile.TemporaryDirectory() as tmp, \
+             patch.dict(os.environ, {"SEARCH_INDEX_PATH": os.path.join(tmp, "search_index.json")}), \
+             patch.object(search_index, "_course_indexes", search_index.ScopedRegistry(search_index._load_course_index)):
+            finance = search_index.get_course_index(GraphScope("t1", "Finance"))
+            finance.add("doc:wacc", "WACC weighted average cost of capital")
+            finance.save()
+            self.assertEqual(search_index.get_course_index(GraphScope("t2", "Finance")).search("capital"), [])
+            self.assertEqual(search_index.get_course_index(GraphScope("t1", "Marketing")).search("capital"), [])
+            # No subject: the tenant's default subject, like graph writes
+            self.assertIs(search_index.get_course_index(GraphScope("t1")), search_index.get_course_index(GraphScope("t1", "General")))
+            reloaded = search_index._load_course_index(GraphScope("t1", "Finance"))
+            self.assertEqual([h["id"] for h in reloaded.search("capital")], ["doc:wacc"])
+
+    def test_saves_are_batched_off_the_loop(self):
+        import asyncio
+        from services import search_index
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "course.json")
+            index = BM25Index(path=path)
+
+            async def scenario():
+                writes = []
+                write = BM25Index._write
+                with patch.object(BM25Index, "_write", side_effect=lambda *a: (writes.append(a[0]), write(*a))), \
+                     patch.object(search_index, "_pending_saves", {}):
+                    for i in range(5):
+                        index.add(f"chunk:{i}", f"segment {i} on working capital")
+                        search_index.schedule_save(index, delay=0.01)
+                    self.assertFalse(os.path.exists(path))
+                    await search_index._flush_task
+                return writes
+
+            self.assertEqual(asyncio.run(scenario()), [path])
+            self.assertFalse(index.dirty)
+            self.assertEqual(len(BM25Index.load(path).search("capital", k=10)), 5)
+
+class TestLabelIndex(unittest.TestCase):
+
+    def make_index(self):
+        from services.labels import LabelIndex
+        index = LabelIndex()
+        index.add("npv", "Net Present Value", [1.0, 0.0, 0.0])
+        index.add("capb", "Capital Budgeting", [0.0, 1.0, 0.0])
+        index.add("cc", "Cost of Capital", aliases=["Hurdle Rate"])
+        return index
+
+    def test_resolves_forms_acronyms_and_aliases(self):
+        index = self.make_index()
+        self.assertEqual(index.resolve("net present values"), "npv")
+        self.assertEqual(index.resolve("NPV"), "npv")
+        self.assertEqual(index.resolve("Net present value (NPV)"), "npv")
+        self.assertEqual(index.resolve("hurdle rate"), "cc")
+        self.assertIsNone(index.resolve("Working Capital"))
+
+    def test_prefix_and_abbreviation_are_candidates_confirmed_by_embedding(self):
+        index = self.make_index()
+        index.add("rp", "Risk Premium", [0.0, 0.0, 1.0])
+        index.add("mm", "Marketing Mix", [0.6, 0.0, 0.8])
+        # Prefixes and abbreviations alone never resolve
+        for label in ("Cap. Budg.", "capital budg", "Risk", "Cost", "Market", "Market Mix"):
+            self.assertIsNone(index.resolve(label), label)
+        self.assertEqual(index.candidates("Cap. Budg."), {"capb"})
+        self.assertEqual(index.candidates("Risk"), {"rp"})
+        # A candidate is accepted when the embeddings agree, not otherwise
+        matches = index.nearest(
+            [[0.1, 0.99, 0.0], [0.8, 0.0, -0.6]],
+            candidates=[index.candidates("capital budg"), index.candidates("Market Mix")]
+        )
+        self.assertEqual(matches, ["capb", None])
+        index.add("capm", "Capital Asset Pricing Model")
+        self.assertEqual(index.candidates("capi"), {"capb", "capm"})
+
+    def test_embedding_fallback_and_relabel(self):
+        index = self.make_index()
+        self.assertEqual(index.nearest([[0.99, 0.05, 0.0], [0.5, 0.5, 0.7]]), ["npv", None])
+        index.add("npv", "Discounted Value", [1.0, 0.0, 0.0])
+        self.assertIsNone(index.resolve("Net Present Value"))
+        self.assertEqual(index.resolve("discounted value"), "npv")
+
+    def test_removed_nodes_leave_the_vector_store(self):
+        index = self.make_index()
+        index.add("npv2", "Net Present Values Method", [0.98, 0.2, 0.0])
+        index.add("capb", "Capital Budgeting Decisions")  # relabel keeps its vector
+        index.remove("npv")
+        self.assertEqual(index.nearest([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]), ["npv2", "capb"])
+        index.remove("npv2")
+        self.assertEqual(index.nearest([[1.0, 0.0, 0.0]]), [None])
+        self.assertEqual(index.vector_ids, ["capb"])
+
+
+if __name__ == '__main__':
+    unittest.main()